@@ -0,0 +1,739 @@
+# -*- coding: utf-8 -*-
+"""
+基于 asyncio 的 YMODEM 发送端与传输：一个事件循环同时驱动多路升级，不再每个设备占用一个线程。
+- AsyncSerialTransport：串口以非阻塞方式打开，由事件循环监听其文件描述符（loop.add_reader，需 POSIX）。
+- AsyncUdpTransport：UDP 由 DatagramProtocol 接收。
+  二者把收到的数据放入 rxbuffer.RingBuffer，协议层 await read_token(timeout) 取应答字节。
+- AsyncYMODEM：与 YMODEM.send 相同的包格式与流程（包0 → 数据包 → EOT → 结束包，支持 auto/ymodem-g），
+  取消方式为 task.cancel()：发送端发出 CAN 后抛出 CancelledError，不再轮询 flash_status。
+- AsyncFlashScheduler：与 scheduler.FlashScheduler 对应的异步任务调度。
+
+    sched = AsyncFlashScheduler(["/dev/ttyUSB0", "192.168.1.200:5000"])
+    sched.submit(FlashJob("MAIN", "main.bin"))
+    results = asyncio.run(sched.run())
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+import time
+from collections import deque
+from time import monotonic
+
+import delta as delta_ext
+import framing
+import resume as resume_ext
+import rtt
+import telemetry as packet_telemetry
+from bootloader import DEFAULT_POLICY, ReadyDetector
+from rxbuffer import DEFAULT_CAPACITY, RingBuffer
+from scheduler import PortThroughput
+from transport import parse_udp_target
+from upgrade_tool import upgrade_command_for
+from ymodem import ACK, CAN, CRC, EOT, G, NAK, YMODEM, FrameWait
+
+
+class _AsyncReceiver(object):
+    """异步传输的接收侧：数据到达时写入环形缓冲并唤醒等待中的 read_token()。"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.log = logging.getLogger('YReporter')
+        self.ring = RingBuffer(capacity)
+        self._readable = asyncio.Event()
+
+    def _feed(self, data):
+        if data:
+            self.ring.write(data)
+            self._readable.set()
+
+    async def read_token(self, timeout):
+        """等待下一个应答字节，最长 timeout 秒；超时返回 None。"""
+        if not self.ring:
+            self._readable.clear()
+            try:
+                await asyncio.wait_for(self._readable.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.ring.read(1) or None
+
+    def pollc(self, size):
+        """非阻塞读取：只取已到达的数据（最多 size 字节），没有则返回 None。"""
+        return self.ring.read(size) or None
+
+
+class AsyncSerialTransport(_AsyncReceiver):
+    """
+    非阻塞串口：事件循环在串口可读时取走 in_waiting 的全部数据。
+    需要支持 add_reader 的事件循环（Linux/macOS 的默认循环）；Windows 请使用线程版 SerialTransport。
+    """
+
+    def __init__(self, port, baudrate=115200):
+        import serial
+
+        super().__init__()
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = serial.Serial(port=port,
+                                 baudrate=baudrate,
+                                 bytesize=8,
+                                 stopbits=1,
+                                 timeout=0,
+                                 xonxoff=False,
+                                 rtscts=False,
+                                 parity="N")
+        self._loop = asyncio.get_running_loop()
+        try:
+            self._loop.add_reader(self.ser.fileno(), self._on_readable)
+        except (AttributeError, NotImplementedError):
+            self.ser.close()
+            raise RuntimeError("async serial needs an event loop with add_reader (POSIX); "
+                               "use the threaded engine on this platform")
+
+    @classmethod
+    async def open(cls, port, baudrate=115200):
+        return cls(port, baudrate)
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            self.log.error("<<< %s read error: %s", self.port, e)
+            self._loop.remove_reader(self.ser.fileno())
+            return
+        self._feed(data)
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self.ser and self.ser.is_open)
+
+    def describe(self) -> str:
+        return f"{self.port}@{self.baudrate}"
+
+    def putc(self, data):
+        self.ser.write(data)
+
+    def close(self):
+        try:
+            if self.ser.is_open:
+                self._loop.remove_reader(self.ser.fileno())
+                self.ser.close()
+        except Exception:
+            pass
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def datagram_received(self, data, addr):
+        self.owner._feed(data)
+
+    def error_received(self, exc):
+        self.owner.log.debug("<<< %s: %s", self.owner.describe(), exc)
+
+
+class AsyncUdpTransport(_AsyncReceiver):
+    """UDP 传输：每个收到的 datagram 整个放入接收缓冲。用 open() 在事件循环中创建。"""
+
+    def __init__(self, server_ip, server_port):
+        super().__init__()
+        self.server = (server_ip, int(server_port))
+        self._transport = None
+
+    @classmethod
+    async def open(cls, server_ip, server_port, local_ip="", local_port=0):
+        self = cls(server_ip, server_port)
+        kwargs = {"remote_addr": self.server}
+        if local_ip or local_port:
+            kwargs["local_addr"] = (local_ip or "0.0.0.0", int(local_port))
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(self), **kwargs)
+        return self
+
+    @property
+    def is_open(self) -> bool:
+        return self._transport is not None
+
+    def describe(self) -> str:
+        return f"udp://{self.server[0]}:{self.server[1]}"
+
+    def putc(self, data):
+        if self._transport is not None:
+            self._transport.sendto(data)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self.ring.clear()
+
+
+async def open_port_async(spec, baudrate=115200):
+    """与 transport.open_port 相同的端口描述："ip:port" 打开 UDP，其余按串口名打开。"""
+    try:
+        ip, port = parse_udp_target(spec)
+    except ValueError:
+        return await AsyncSerialTransport.open(spec, baudrate)
+    return await AsyncUdpTransport.open(ip, port)
+
+
+async def enter_bootloader_async(transport, command, policy=None, label=""):
+    """
+    bootloader.enter_bootloader 的异步版本：发送升级指令，确认就绪字节 'C'/'G'（见 ReadyDetector）后立即返回。
+    返回值字段与 enter_bootloader 相同（status 为 "ready" | "timeout"；取消时抛出 CancelledError）。
+    """
+    log = logging.getLogger('YReporter')
+    policy = policy or DEFAULT_POLICY
+    payload = (command + "\r\n").encode('UTF-8')
+    result = {"status": "timeout", "ready": None, "resends": 0,
+              "timings": {"first_byte": None, "ready": None}}
+
+    t_start = monotonic()
+    transport.putc(payload)
+    log.info(">>> %s send upgrade instruction: '%s'", label, command)
+    last_send = t_start
+    detector = ReadyDetector()
+    while True:
+        now = monotonic()
+        if now - t_start >= policy.deadline:
+            log.warning("<<< %s no 'C' within %.1fs", label, policy.deadline)
+            return result
+        can_resend = result["resends"] < policy.max_resends
+        if can_resend and now - last_send >= policy.resend_interval:
+            transport.putc(payload)
+            last_send = now
+            result["resends"] += 1
+            log.info(">>> %s resend upgrade instruction (%d/%d)", label, result["resends"], policy.max_resends)
+        wait = policy.deadline - (now - t_start)
+        if result["resends"] < policy.max_resends:
+            wait = min(wait, policy.resend_interval - (monotonic() - last_send))
+
+        if detector.pending:
+            wait = min(wait, policy.ready_quiet)
+        char = await transport.read_token(max(0.0, wait))
+        if not char:
+            ready = detector.quiet()
+        else:
+            if result["timings"]["first_byte"] is None:
+                result["timings"]["first_byte"] = monotonic() - t_start
+            ready = detector.feed(char)
+        if ready is not None:
+            result["status"] = "ready"
+            result["ready"] = ready
+            result["timings"]["ready"] = monotonic() - t_start
+            log.info("<<< %s received %r after %.3fs", label, ready, result["timings"]["ready"])
+            return result
+
+
+class AsyncYMODEM(YMODEM):
+    """
+    asyncio 版 YMODEM 发送端，发送预组帧镜像（framing.FramedImage）。
+    与 YMODEM 共用包格式、'auto' 块长自适应、重发策略（NAK 立即重发、按 RTO 超时重发、按时限放弃）
+    与统计字段（block_counts/timings/rtt）。取消：对运行 send() 的任务调用 cancel()。
+    """
+
+    def __init__(self, transport, mode='auto', header_pad=b'\x00', pad=b'\x1a', telemetry=None):
+        """
+        参数：
+          transport: AsyncSerialTransport/AsyncUdpTransport（提供 putc/pollc/read_token）。
+          mode/header_pad/pad/telemetry: 同 YMODEM。
+        """
+        super().__init__(None, transport.putc, mode=mode, header_pad=header_pad, pad=pad, pollc=transport.pollc,
+                         telemetry=telemetry)
+        self.transport = transport
+
+    async def _token(self, timeout=None):
+        return await self.transport.read_token(self.response_timeout if timeout is None else timeout)
+
+    async def send(self, image, retry=20, callback=None, resume=None, timeout=15, ready=None):
+        """
+        发送一个预组帧镜像。
+        参数：
+          image: framing.FramedImage（包长需与 mode 一致）。
+          retry: 每帧最多重发次数（同 YMODEM.send）。
+          timeout: 每个等待点的总时限（秒，同 YMODEM.send）。
+          callback: 进度回调 callback(percent:int)。
+          resume: 续传提议 (offset, digest)，同 YMODEM.send。
+          ready: 握手时已收到的就绪字节（同 YMODEM.send）；提供时直接发送包0。
+        返回：
+          True 成功；False 失败（已向接收端发 CAN）。
+        取消：
+          任务被取消时向接收端发 CAN 后重新抛出 CancelledError。
+        """
+        try:
+            return await self._send_image(image, retry, callback, resume, timeout, ready)
+        except asyncio.CancelledError:
+            self.abort()
+            raise
+
+    async def _expect_ack(self, frame, retry, timeout):
+        """
+        发出 frame 并等待 ACK，重发与放弃的规则见 ymodem.FrameWait（与 YMODEM._transmit 相同）。
+        返回：
+          (ok, errors)：ok 表示收到 ACK；errors 为期间的 NAK/杂字节数。
+          其余统计留在 self._ack_stats（见 YMODEM._transmit）。
+        """
+        wait = self._frame_wait(frame, retry, timeout)
+        while True:
+            char = await self._token(wait.remaining(monotonic()))
+            action = wait.on_reply(char, monotonic())
+            if action == FrameWait.RESEND:
+                self.putc(frame)
+            elif action == FrameWait.ACK:
+                if wait.late_window:
+                    await self._discard_replies(wait.late_window)
+                self._ack_stats = wait.stats
+                return True, wait.errors
+            elif action == FrameWait.FAIL:
+                self.abort()
+                return False, wait.errors
+            elif action == FrameWait.CANCELED:
+                return False, wait.errors
+
+    async def _discard_replies(self, window):
+        """丢弃 window 秒内到达的应答（重发帧的重复 ACK）。"""
+        deadline = monotonic() + window
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return
+            char = await self._token(remaining)
+            if char:
+                self.log.debug("<<< discarding late reply %r", char)
+
+    async def _send_image(self, image, retry, callback, resume=None, timeout=15, ready=None):
+        packet_size = framing.packet_size_for(self.mode)
+        if image.packet_size != packet_size:
+            raise ValueError("<<< framed image packet size {0} does not match mode {1!r}".format(
+                image.packet_size, self.mode))
+        file_size = image.file_size
+        self.timings = {}
+        self.resume_offset = self.acked_offset = 0
+        self.original_size, self.wire_size = image.original_size, file_size
+        self.delta_rejected = False
+        self.compress_rejected = False
+        self.rtt = rtt.RttTable(self.ack_timeout)
+        is_delta = image.delta is not None
+        if (image.compressed or is_delta) and resume:
+            self.log.info("<<< resume is not offered for compressed or delta transfers")
+            resume = None
+        t_phase = monotonic()
+        if self.telemetry is not None:
+            self.telemetry.begin()
+
+        # 1) 等待接收端 'C'（或 YMODEM-G 的 'G'）；两个 CAN 表示接收端放弃（同 YMODEM._send）
+        streaming = False
+        cancel = False
+        deadline = monotonic() + timeout
+        while True:
+            if ready:
+                char, ready = ready, None
+            else:
+                char = await self._token(max(0.0, min(self.response_timeout, deadline - monotonic())))
+            if char == CRC:
+                if self.mode == 'ymodem-g':
+                    self.log.warning("<<< receiver offered CRC, falling back from ymodem-g to ymodem")
+                break
+            if char == G and self.mode == 'ymodem-g':
+                streaming = True
+                break
+            if char == CAN:
+                if cancel:
+                    self.log.warning("<<< receiver canceled the transmission before packet 0")
+                    return False
+                cancel = True
+            if monotonic() >= deadline:
+                self.log.error(">>> send error: no CRC within %.1fs, aborting", timeout)
+                self.abort()
+                return False
+
+        # 2) 包0，等待 ACK 与接收端就绪的 'C'/'G'
+        now = monotonic()
+        self.timings["start"] = now - t_phase
+        t_phase = now
+        offer = self._resume_offer(image.file_name, file_size, resume)
+        header = image.header_packet if offer is None else framing.make_frame(offer, 0, 128, self.header_pad)
+        self.putc(header)
+        # 包0 只在 NAK 时重发（见 YMODEM._send）
+        deadline = monotonic() + timeout
+        resends = 0
+        while True:
+            char = await self._token(max(0.0, min(self.response_timeout, deadline - monotonic())))
+            if char == ACK or (streaming and char == G):
+                break
+            if char == NAK:
+                self.putc(header)
+                resends += 1
+            if monotonic() >= deadline or resends > retry:
+                self.log.error(">>> packet 0 was not acknowledged, aborting")
+                self.abort()
+                return False
+        self._ready_ext = bytearray()
+        if char == ACK:
+            # 扩展应答（续传 '@'+偏移、压缩 'Z'、增量 'D'）在就绪字节之前到达，见 YMODEM._wait_ready
+            extended = offer is not None or image.compressed or is_delta
+            deadline = monotonic() + self.header_ready_timeout
+            while monotonic() < deadline:
+                char = await self._token(max(0.0, deadline - monotonic()))
+                if char == CRC or (streaming and char == G):
+                    break
+                if char and extended and len(self._ready_ext) < 32:
+                    self._ready_ext += char
+            else:
+                self.log.warning(">>> ACK wasn't CRC")
+        accepted = self._check_extensions(resume if offer is not None else None, image.compressed, is_delta)
+        if accepted is None:
+            self.abort()
+            return False
+        self.resume_offset = accepted
+        now = monotonic()
+        self.timings["header"] = now - t_phase
+        t_phase = now
+
+        # 3) 数据包
+        self.block_size = packet_size
+        self.block_counts = {}
+        self.block_switches = 0
+        self._adapt_window = deque(maxlen=self.ADAPT_WINDOW)
+        self._adapt_clean = 0
+        offset = self.acked_offset = self.resume_offset
+        if offset:
+            self.log.info("<<< receiver accepted resume at offset %d of %d", offset, file_size)
+        if streaming:
+            ok = await self._stream_image(image, callback, offset)
+            if not ok:
+                return False
+            self.block_counts = {packet_size: math.ceil((file_size - offset) / packet_size)}
+        else:
+            adaptive = self.mode == 'auto'
+            block_size = packet_size
+            sequence = 1
+            while offset < file_size:
+                frame = image.frame_at(offset, block_size, sequence, self.pad)
+                ok, errors = await self._expect_ack(frame, retry, timeout)
+                if not ok:
+                    return False
+                sent_at, last_sent_at, retries, cause, wire_bytes, _, timed_out = self._ack_stats
+                if self.telemetry is not None:
+                    self.telemetry.record(sequence, sent_at, monotonic(), retries, cause, wire_bytes, block_size,
+                                          last_sent_at)
+                offset += block_size
+                self.acked_offset = min(offset, file_size)
+                self.block_counts[block_size] = self.block_counts.get(block_size, 0) + 1
+                if adaptive:
+                    timed_out = timed_out or monotonic() - sent_at > self.ack_timeout
+                    block_size = self._adapt_block_size(block_size, errors + timed_out)
+                sequence = (sequence + 1) % 0x100
+                if callback:
+                    callback(math.ceil(min(offset, file_size) / file_size * 100))
+
+        # 4) EOT 与结束包
+        now = monotonic()
+        self.timings["data"] = now - t_phase
+        t_phase = now
+        ok, _ = await self._expect_ack(EOT, retry, timeout)
+        if not ok:
+            return False
+        ok, _ = await self._expect_ack(image.end_packet, retry, timeout)
+        if not ok:
+            return False
+        if callback:
+            callback(100)
+        self.timings["finish"] = monotonic() - t_phase
+        if self.telemetry is not None:
+            self.telemetry.finish(self.timings)
+        self.log.info('*** Transmission successful (ACK received ), blocks: %s, timings: %s',
+                      self.block_counts, self.timings)
+        return True
+
+    async def _stream_image(self, image, callback, start=0):
+        """YMODEM-G 数据阶段：从偏移 start 起连续发送数据包，每包后让出事件循环并检查接收端的 CAN/NAK。"""
+        packet_size = image.packet_size
+        for index, offset in enumerate(range(start, image.file_size, packet_size)):
+            self.putc(image.frame_at(offset, packet_size, index + 1, self.pad))
+            await asyncio.sleep(0)
+            reply = self.pollc(16)
+            if reply and (CAN in reply or NAK in reply):
+                self.log.error("<<< ymodem-g: receiver aborted at packet %d (%r)", index + 1, reply)
+                self.abort()
+                return False
+            if callback:
+                callback(min(100, math.ceil((offset + packet_size) / image.file_size * 100)))
+        return True
+
+
+class AsyncFlashSession(object):
+    """
+    FlashSession 的异步版本：握手 → 发送预组帧镜像。run() 的返回值字段与 FlashSession.run() 相同。
+    取消：取消运行 run() 的任务；结果（status="cancel"）保存在 self.result。
+    """
+
+    def __init__(self, transport, iface, file_path, mode='auto', handshake_policy=None,
+                 progress_callback=None, image_cache=framing.default_cache, telemetry=False, resume=None,
+                 compress=False, delta=None, compress_fallback=True):
+        self.log = logging.getLogger('YReporter')
+        self.transport = transport
+        self.iface = iface.strip().upper()
+        self.upgrade_command = upgrade_command_for(self.iface)
+        self.file_path = file_path
+        self.handshake_policy = handshake_policy
+        self.progress_callback = progress_callback
+        self.image_cache = image_cache
+        self.telemetry = packet_telemetry.PacketTelemetry() if telemetry else None
+        self.ymodem_sender = AsyncYMODEM(transport, mode=mode, telemetry=self.telemetry)
+        self.compress = compress
+        self.compress_fallback = compress_fallback
+        self.delta = delta
+        self.resume_store = None if compress or delta else resume_ext.open_store(resume)
+        self.result = None
+
+    def _load_image(self, packet_size, manifest=None):
+        """组帧镜像：给出 manifest 时先尝试增量流（变化过多时返回完整镜像，其 delta 为 None）。"""
+        if manifest is not None:
+            with open(self.file_path, 'rb') as f:
+                image = delta_ext.frame_delta(f.read(), manifest, os.path.basename(self.file_path), packet_size,
+                                              compress=self.compress)
+            if image is not None:
+                return image
+        if self.image_cache is not None:
+            return self.image_cache.get(self.file_path, packet_size, compress=self.compress)
+        return framing.FramedImage.from_file(self.file_path, packet_size, compress=self.compress)
+
+    def _resume_offer(self, file_size):
+        """（在线程池中执行）计算镜像摘要并查询续传记录，返回 (设备键, 摘要, 提议)。"""
+        key = resume_ext.device_key(self.transport.describe(), self.iface)
+        digest = resume_ext.file_digest(self.file_path)
+        return key, digest, self.resume_store.offer(key, digest, file_size)
+
+    async def run(self) -> dict:
+        result = self.result = {
+            "iface": self.iface,
+            "port": self.transport.describe(),
+            "file": self.file_path,
+            "size": 0,
+            "status": "fail",
+            "reason": None,
+            "timings": {"handshake": 0.0, "transfer": 0.0, "total": 0.0},
+            "resends": 0,
+            "throughput": 0.0,
+            "block_counts": {},
+            "resumed_from": 0,
+            "wire_size": 0,
+            "delta": None,
+            "compression": "sent" if self.compress else None,
+        }
+        t_start = t_handshake = time.perf_counter()
+        resume_key = digest = None
+        try:
+            try:
+                result["size"] = os.path.getsize(self.file_path)
+                manifest = None
+                if self.delta is not None:
+                    manifest = self.delta if isinstance(self.delta, dict) else delta_ext.load_manifest(self.delta)
+            except OSError as e:
+                result["reason"] = f"file error: {e}"
+                return result
+            except ValueError as e:
+                result["reason"] = f"delta base error: {e}"
+                return result
+
+            handshake = await enter_bootloader_async(self.transport, self.upgrade_command,
+                                                     self.handshake_policy, label=self.iface)
+            t_handshake = time.perf_counter()
+            result["timings"]["handshake"] = t_handshake - t_start
+            result["timings"].update(handshake["timings"])
+            result["resends"] = handshake["resends"]
+            if handshake["status"] != "ready":
+                result["reason"] = "handshake timeout"
+                return result
+            if handshake["ready"] == G:
+                self.log.info("<<< %s received 'G', using ymodem-g", self.iface)
+                self.ymodem_sender.mode = 'ymodem-g'
+
+            # 首次组帧与计算摘要需要读盘，放到线程池中执行，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            packet_size = framing.packet_size_for(self.ymodem_sender.mode)
+            image = await loop.run_in_executor(None, self._load_image, packet_size, manifest)
+            if manifest is not None:
+                result["delta"] = {"status": "full"} if image.delta is None else dict(image.delta, status="sent")
+            offer = None
+            if self.resume_store is not None:
+                resume_key, digest, offer = await loop.run_in_executor(None, self._resume_offer, result["size"])
+            ok = await self.ymodem_sender.send(image, callback=self.progress_callback, resume=offer,
+                                               ready=handshake["ready"])
+            # 设备不接受增量或压缩：重新进入升级模式后完整/不压缩发送（同 FlashSession）
+            for _ in range(2):
+                sender = self.ymodem_sender
+                if ok:
+                    break
+                if sender.delta_rejected:
+                    self.log.warning("<<< %s rejected the delta, retrying with the full image", self.iface)
+                    result["delta"]["status"] = "rejected"
+                elif sender.compress_rejected:
+                    result["compression"] = "rejected"
+                    if not self.compress_fallback:
+                        break
+                    self.log.warning("<<< %s does not support compressed transfer, retrying uncompressed", self.iface)
+                    self.compress = False
+                else:
+                    break
+                handshake = await enter_bootloader_async(self.transport, self.upgrade_command,
+                                                         self.handshake_policy, label=self.iface)
+                if handshake["status"] != "ready":
+                    break
+                image = await loop.run_in_executor(None, self._load_image, packet_size)
+                ok = await self.ymodem_sender.send(image, callback=self.progress_callback, ready=handshake["ready"])
+            t_end = time.perf_counter()
+            result["resumed_from"] = self.ymodem_sender.resume_offset
+            result["wire_size"] = self.ymodem_sender.wire_size
+            result["timings"]["transfer"] = t_end - t_handshake
+            result["block_counts"] = dict(self.ymodem_sender.block_counts)
+            if self.telemetry is not None:
+                result["telemetry"] = self.telemetry.summary()
+            result["timings"].update(self.ymodem_sender.timings)
+            if ok:
+                result["status"] = "success"
+                if t_end > t_handshake:
+                    result["throughput"] = (result["size"] - result["resumed_from"]) / (t_end - t_handshake)
+            elif result["compression"] == "rejected" and not self.compress_fallback:
+                result["reason"] = "device does not support compressed transfer"
+            else:
+                result["reason"] = "ymodem transfer failed"
+            return result
+        except asyncio.CancelledError:
+            result["status"] = "cancel"
+            result["reason"] = "canceled"
+            raise
+        finally:
+            result["timings"]["total"] = time.perf_counter() - t_start
+            # 包0 未被应答时不知道设备的状态，保留原有记录
+            if resume_key is not None and "header" in self.ymodem_sender.timings:
+                self.resume_store.record(resume_key, digest, result["size"], self.ymodem_sender.acked_offset,
+                                         ok=result["status"] == "success")
+
+
+class AsyncFlashScheduler(object):
+    """
+    在一个事件循环中把升级任务分配到多个端口（接口与 scheduler.FlashScheduler 相同，run() 为协程）。
+    每个端口一个协程，按实测吞吐排名匹配任务大小（同 FlashScheduler，见 scheduler.PortThroughput）；
+    cancel(job_id) 直接取消该任务的协程。
+    """
+
+    def __init__(self, ports, max_concurrency=None, baudrate=115200, session_kwargs=None,
+                 result_callback=None, transport_factory=None):
+        """
+        参数同 FlashScheduler；transport_factory 为协程函数 factory(port) -> 异步传输。
+        """
+        if not ports:
+            raise ValueError("at least one port is required")
+        self.log = logging.getLogger('YReporter')
+        self.ports = list(ports)
+        self.max_concurrency = max(1, min(max_concurrency or len(self.ports), len(self.ports)))
+        self.baudrate = baudrate
+        self.session_kwargs = dict(session_kwargs or {})
+        self.result_callback = result_callback
+        self.transport_factory = transport_factory or self._open_port
+        self._pending = []
+        self._ids = itertools.count(1)
+        self._stopping = False
+        self._throughput = PortThroughput(self.ports)
+        self.tasks = {}  # job_id -> 执行中的 asyncio.Task
+        self.results = []
+
+    async def _open_port(self, port):
+        return await open_port_async(port, baudrate=self.baudrate)
+
+    def submit(self, job) -> str:
+        """加入一个任务（scheduler.FlashJob），返回其任务 ID。"""
+        if job.port is not None and job.port not in self.ports:
+            raise ValueError(f"job port {job.port!r} is not managed by this scheduler")
+        if job.job_id is None:
+            job.job_id = f"job{next(self._ids)}"
+        self._pending.append(job)
+        return job.job_id
+
+    def cancel(self, job_id) -> bool:
+        """取消一个任务：等待中的移出队列，执行中的取消其协程。"""
+        for job in self._pending:
+            if job.job_id == job_id:
+                self._pending.remove(job)
+                return True
+        task = self.tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        return False
+
+    def cancel_all(self):
+        self._stopping = True
+        self._pending.clear()
+        for task in list(self.tasks.values()):
+            task.cancel()
+
+    def throughput(self, port) -> float:
+        """端口的吞吐估计（字节/秒），见 scheduler.PortThroughput.get。"""
+        return self._throughput.get(port)
+
+    def _pick(self, port):
+        if self._stopping:
+            return None
+        job = self._throughput.pick([j for j in self._pending if j.port in (None, port)], port)
+        if job is not None:
+            self._pending.remove(job)
+        return job
+
+    async def _worker(self, port, slots):
+        transport = None
+        try:
+            while True:
+                async with slots:
+                    job = self._pick(port)
+                    if job is None:
+                        return
+                    transport, result = await self._execute(job, port, transport)
+                if self.result_callback:
+                    self.result_callback(result)
+        finally:
+            if transport is not None:
+                transport.close()
+
+    async def _execute(self, job, port, transport):
+        try:
+            if transport is None or not transport.is_open:
+                transport = await self.transport_factory(port)
+            session = AsyncFlashSession(transport, job.iface, job.file_path, **self.session_kwargs)
+        except Exception as e:
+            self.log.error("*** %s on %s could not start: %s", job.job_id, port, e)
+            result = {"iface": job.iface, "file": job.file_path, "size": job.size,
+                      "status": "fail", "reason": f"port error: {e}"}
+        else:
+            task = asyncio.ensure_future(session.run())
+            self.tasks[job.job_id] = task
+            try:
+                # wait() 不会因任务被取消而抛出；只有本协程自身被取消时才会
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.wait({task})
+                raise
+            finally:
+                self.tasks.pop(job.job_id, None)
+            result = session.result
+            if not task.cancelled() and task.exception() is not None:
+                self.log.error("*** %s on %s failed: %r", job.job_id, port, task.exception())
+                result["reason"] = f"error: {task.exception()}"
+        result["job_id"] = job.job_id
+        result["port"] = port
+        self._throughput.record(port, result)
+        self.results.append(result)
+        return transport, result
+
+    async def run(self) -> list:
+        """执行队列中的全部任务，返回各任务结果（按完成顺序）。"""
+        self._stopping = False
+        slots = asyncio.Semaphore(self.max_concurrency)
+        await asyncio.gather(*(self._worker(port, slots) for port in self.ports))
+        return list(self.results)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+发送端吞吐基准：用 FlashSession（与 GUI 行相同的 transport.getc/putc/read_token 收发路径）
+把随机固件发给本机 UDP 回环上的模拟设备（simulator.DeviceSimulator），按参数网格逐项测量：
+  镜像大小 × 块模式（128/1K/auto/ymodem-g）× 模拟 RTT（设备应答延迟）× 丢字节率 × 并发会话数。
+每项报告：字节/秒、包/秒、每 MB 的发送线程 CPU 时间、握手/起始/包0/数据/收尾各阶段耗时；
+结果可写成 JSON，并与保存的基线逐项比较，超过容差的退化以返回码 1 标出。
+
+    python -m benchmark --sizes 64K,1M --modes ymodem128,ymodem --concurrency 1,4 --output bench.json
+    python -m benchmark --sizes 64K,1M --modes ymodem128,ymodem --concurrency 1,4 --baseline bench.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from bootloader import HandshakePolicy
+from simulator import DeviceSimulator, Impairments
+from transport import UdpTransport
+from upgrade_tool import FlashSession
+
+PHASES = ("handshake", "start", "header", "data", "finish")
+KEY_FIELDS = ("size", "mode", "rtt", "loss", "concurrency")
+
+# 与基线相比，吞吐下降或每 MB CPU 上升超过该比例即判为退化
+DEFAULT_TOLERANCE = 0.10
+
+
+def parse_size(text) -> int:
+    """"64K" / "1M" / "4096" → 字节数。"""
+    text = text.strip().upper()
+    scale = {"K": 1024, "M": 1024 * 1024}.get(text[-1:], 1)
+    number = text[:-1] if scale > 1 else text
+    value = int(float(number) * scale)
+    if value <= 0:
+        raise ValueError(f"invalid size {text!r}")
+    return value
+
+
+def _parse_list(text, convert):
+    return [convert(item) for item in text.split(",") if item.strip()]
+
+
+def case_key(case) -> tuple:
+    return tuple(case[name] for name in KEY_FIELDS)
+
+
+def make_image(directory, size) -> str:
+    """在 directory 中生成 size 字节的随机固件，返回路径。"""
+    path = os.path.join(directory, f"bench_{size}.bin")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+    return path
+
+
+def _run_session(endpoint, file_path, mode, policy, out):
+    """一个发送线程：执行一次 FlashSession 并记录本线程消耗的 CPU 时间。"""
+    ip, _, port = endpoint.rpartition(":")
+    transport = UdpTransport(ip, int(port))
+    try:
+        session = FlashSession(transport, "MAIN", file_path, mode=mode, handshake_policy=policy)
+        cpu = time.thread_time()
+        out["start"] = time.perf_counter()
+        out["result"] = session.run()
+        out["end"] = time.perf_counter()
+        out["cpu"] = time.thread_time() - cpu
+    finally:
+        transport.close()
+
+
+def run_once(case, file_path, ready_interval=1.0, seed=0) -> dict:
+    """
+    执行一次测量：启动 concurrency 个模拟设备与同样数量的发送线程，全部结束后汇总。
+    返回：
+      dict：ok（成功会话数）/ bytes_per_s（成功会话的总字节 / 墙钟时间）/ packets_per_s / cpu_per_mb（秒）/ phases
+    """
+    n = case["concurrency"]
+    policy = HandshakePolicy(deadline=5.0, resend_interval=1.0, max_resends=2)
+    sims = [DeviceSimulator.udp(impairments=Impairments(ack_latency=case["rtt"], drop_rate=case["loss"],
+                                                        seed=seed + i),
+                                streaming=case["mode"] == "ymodem-g", ready_interval=ready_interval)
+            for i in range(n)]
+    outs = [{} for _ in range(n)]
+    for sim in sims:
+        sim.start()
+    try:
+        threads = [threading.Thread(target=_run_session, args=(sim.endpoint, file_path, case["mode"], policy, out),
+                                    daemon=True)
+                   for sim, out in zip(sims, outs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for sim in sims:
+            sim.stop()
+
+    results = [out["result"] for out in outs if "result" in out]
+    ends = [out["end"] for out in outs if "end" in out]
+    wall = max(ends) - min(out["start"] for out in outs if "end" in out) if ends else 0.0
+    ok = sum(1 for r in results if r["status"] == "success")
+    total_bytes = case["size"] * ok  # 失败会话不计入吞吐
+    packets = sum(sum(r["block_counts"].values()) for r in results)
+    data_time = sum(r["timings"].get("data", 0.0) for r in results) / max(1, len(results))
+    return {
+        "ok": ok,
+        "bytes_per_s": total_bytes / wall if wall > 0 else 0.0,
+        "packets_per_s": packets / len(results) / data_time if results and data_time > 0 else 0.0,
+        "cpu_per_mb": sum(out.get("cpu", 0.0) for out in outs) / (total_bytes / 1e6) if total_bytes else 0.0,
+        "phases": {name: sum(r["timings"].get(name, 0.0) for r in results) / max(1, len(results))
+                   for name in PHASES},
+    }
+
+
+def run_case(case, file_path, repeat=3, ready_interval=1.0) -> dict:
+    """重复测量 repeat 次，各指标取中位数（成功数取最小值）。"""
+    runs = [run_once(case, file_path, ready_interval, seed=i * 1000) for i in range(repeat)]
+    out = dict(case)
+    out["repeat"] = repeat
+    out["ok"] = min(r["ok"] for r in runs)
+    for name in ("bytes_per_s", "packets_per_s", "cpu_per_mb"):
+        out[name] = statistics.median(r[name] for r in runs)
+    out["phases"] = {name: statistics.median(r["phases"][name] for r in runs) for name in PHASES}
+    return out
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE) -> list:
+    """
+    与基线逐项比较（按 size/mode/rtt/loss/concurrency 匹配）。
+    返回：
+      list[dict]：case / throughput_change / cpu_change（相对变化，正数为增加）/ regression
+    """
+    base = {case_key(r): r for r in baseline}
+    rows = []
+    for result in results:
+        old = base.get(case_key(result))
+        if old is None:
+            continue
+        throughput = (result["bytes_per_s"] / old["bytes_per_s"] - 1.0) if old["bytes_per_s"] else 0.0
+        cpu = (result["cpu_per_mb"] / old["cpu_per_mb"] - 1.0) if old["cpu_per_mb"] else 0.0
+        rows.append({"case": {name: result[name] for name in KEY_FIELDS},
+                     "throughput_change": throughput, "cpu_change": cpu,
+                     "regression": throughput < -tolerance or cpu > tolerance or result["ok"] < old["ok"]})
+    return rows
+
+
+def _format_result(r) -> str:
+    phases = " ".join(f"{r['phases'][name]:.3f}" for name in PHASES)
+    return (f"{r['size']:>9} {r['mode']:>9} {r['rtt']:>6g} {r['loss']:>7g} {r['concurrency']:>4} "
+            f"{r['ok']:>3}/{r['concurrency']:<3} {r['bytes_per_s'] / 1e6:>8.3f} {r['packets_per_s']:>9.0f} "
+            f"{r['cpu_per_mb']:>8.3f}  {phases}")
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="YMODEM sender throughput benchmark")
+    parser.add_argument("--sizes", default="64K,1M", help="image sizes, e.g. 64K,1M (default 64K,1M)")
+    parser.add_argument("--modes", default="ymodem128,ymodem",
+                        help="block modes: ymodem128, ymodem, auto, ymodem-g (default ymodem128,ymodem)")
+    parser.add_argument("--rtt", default="0", help="simulated device reply latency in seconds, e.g. 0,0.002")
+    parser.add_argument("--loss", default="0", help="byte drop probability sender -> device, e.g. 0,1e-5")
+    parser.add_argument("--concurrency", default="1", help="concurrent sessions, e.g. 1,4,8")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; medians are reported (default 3)")
+    parser.add_argument("--ready-interval", type=float, default=1.0,
+                        help="simulated device 'C' repeat interval in seconds (default 1.0)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --output")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative throughput drop / CPU rise before a case counts as a regression")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines instead of a table")
+    return parser
+
+
+def main(argv=None) -> int:
+    """
+    命令行入口。
+    返回码：0=完成（且无退化），1=相对基线有退化，2=参数错误。
+    """
+    args = _build_parser().parse_args(argv)
+    logging.getLogger('YReporter').setLevel(logging.ERROR)
+    try:
+        grid = {
+            "size": _parse_list(args.sizes, parse_size),
+            "mode": _parse_list(args.modes, str.strip),
+            "rtt": _parse_list(args.rtt, float),
+            "loss": _parse_list(args.loss, float),
+            "concurrency": _parse_list(args.concurrency, int),
+        }
+        for mode in grid["mode"]:
+            if mode not in ("ymodem128", "ymodem", "auto", "ymodem-g"):
+                raise ValueError(f"invalid mode {mode!r}")
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)["results"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"benchmark: {e}", file=sys.stderr)
+        return 2
+
+    # 模拟设备与发送端的逐包 print 不计入测量输出
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="ymodem-bench-") as tmp:
+            if not args.json:
+                print("     size      mode    rtt    loss conc  ok     MB/s     pkt/s CPU s/MB  "
+                      + " ".join(PHASES), file=stdout, flush=True)
+            for values in itertools.product(*(grid[name] for name in KEY_FIELDS)):
+                case = dict(zip(KEY_FIELDS, values))
+                result = run_case(case, make_image(tmp, case["size"]), args.repeat, args.ready_interval)
+                results.append(result)
+                print(json.dumps(result) if args.json else _format_result(result), file=stdout, flush=True)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if args.output:
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat,
+                "ready_interval": args.ready_interval}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+
+    if baseline is None:
+        return 0
+    rows = compare(results, baseline, args.tolerance)
+    for row in rows:
+        case = " ".join(f"{name}={row['case'][name]}" for name in KEY_FIELDS)
+        print(f"{case}: throughput {row['throughput_change']:+.1%}, cpu/MB {row['cpu_change']:+.1%}"
+              + ("  REGRESSION" if row["regression"] else ""), flush=True)
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
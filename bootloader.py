@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+进入 Bootloader（升级模式）的握手流程：发送升级指令 → 等待设备发出 YMODEM 就绪字节 'C'（流式设备为 'G'）。
+确认就绪字节后立即返回，不再固定等待；总时限、指令重发间隔与次数可配置，并记录各阶段耗时。
+
+就绪字节的判定（ReadyDetector）：'C'/'G' 前一个字节不是字母或数字（或与其相同），并且紧接着又收到同一字节，
+或之后线路安静 ready_quiet 秒。设备回显的升级指令（如 "$SH,UPGRADE,MAIN" 中的 'G'）与应用的回复/横幅
+（如 "Command OK"、"Going to boot"、"\r\nCRC ..."）后面都紧跟着其他字符，不会被误判为就绪。
+"""
+
+import logging
+from time import monotonic
+
+CRC = b'C'
+G = b'G'
+
+
+class HandshakePolicy(object):
+    """
+    握手时限与指令重发策略。
+    参数：
+      deadline: 从首次发送指令起等待就绪字节的总时限（秒）。
+      resend_interval: 超过该时间仍未就绪则重发升级指令（秒）。
+      max_resends: 最多重发次数；0 表示只发送一次。
+      ready_quiet: 'C'/'G' 之后线路安静这么久（秒）才确认为就绪字节（紧接着重复的就绪字节立即确认）。
+    """
+
+    def __init__(self, deadline=10.0, resend_interval=3.0, max_resends=2, ready_quiet=0.05):
+        if deadline <= 0 or resend_interval <= 0 or max_resends < 0 or ready_quiet <= 0:
+            raise ValueError("deadline/resend_interval/ready_quiet must be > 0 and max_resends >= 0")
+        self.deadline = deadline
+        self.resend_interval = resend_interval
+        self.max_resends = max_resends
+        self.ready_quiet = ready_quiet
+
+    def __repr__(self):
+        return (f"HandshakePolicy(deadline={self.deadline}, resend_interval={self.resend_interval}, "
+                f"max_resends={self.max_resends}, ready_quiet={self.ready_quiet})")
+
+
+DEFAULT_POLICY = HandshakePolicy()
+
+
+class ReadyDetector(object):
+    """
+    从握手期间收到的字节中识别就绪字节。
+    'C'/'G' 的前一个字节不是字母或数字（或与其相同）时记为候选：
+      - 下一个字节与候选相同（设备连续/周期发出的就绪字节）→ feed() 立即返回该字节；
+      - 下一个字节是别的字符（应用的回复或横幅）→ 丢弃候选；
+      - 之后线路安静 ready_quiet 秒 → 调用方调用 quiet() 确认候选。
+    """
+
+    def __init__(self):
+        self.prev = None
+        self.candidate = None
+
+    @property
+    def pending(self) -> bool:
+        """是否有等待确认的候选（此时调用方应按 ready_quiet 限时读取下一个字节）。"""
+        return self.candidate is not None
+
+    def feed(self, char):
+        """
+        处理收到的一个字节。
+        返回：
+          确认的就绪字节 b'C'/b'G'；尚未确认时返回 None。
+        """
+        candidate, self.candidate = self.candidate, None
+        if candidate is not None and char == candidate:
+            return char
+        prev, self.prev = self.prev, char
+        if char in (CRC, G) and (prev is None or prev == char or not prev.isalnum()):
+            self.candidate = char
+        return None
+
+    def quiet(self):
+        """候选之后线路已安静 ready_quiet 秒：返回并确认候选（没有候选时返回 None）。"""
+        candidate, self.candidate = self.candidate, None
+        return candidate
+
+
+def enter_bootloader(getc, putc, command, policy=None, cancelled=None, label="", read_token=None):
+    """
+    发送升级指令并等待设备就绪。
+    参数：
+      getc: 读取函数 getc(size)，超时返回 None（串口/UDP 传输的超时即为取消检查的间隔）。
+      putc: 写出函数 putc(data)。
+      command: 升级指令（不含 "\\r\\n"），例如 "$SH,UPGRADE,MAIN"。
+      policy: HandshakePolicy；None 使用 DEFAULT_POLICY。
+      cancelled: 可选的取消判断函数，返回 True 时立即结束。
+      label: 日志中的接口名/行号。
+      read_token: 可选的限时读取函数 read_token(timeout)，用于按 policy.ready_quiet 确认就绪字节；
+                  None 时用 getc 代替（确认要等满一次 getc 超时）。
+    返回：
+      dict，字段：
+        status: "ready" | "timeout" | "cancel"
+        ready: b'C' / b'G'（未就绪时为 None）
+        resends: 指令重发次数
+        timings: {"first_byte": 秒, "ready": 秒}（从首次发送指令起计，未发生为 None）
+    """
+    log = logging.getLogger('YReporter')
+    policy = policy or DEFAULT_POLICY
+    payload = (command + "\r\n").encode('UTF-8')
+    result = {"status": "timeout", "ready": None, "resends": 0,
+              "timings": {"first_byte": None, "ready": None}}
+
+    t_start = monotonic()
+    putc(payload)
+    log.info(">>> %s send upgrade instruction: '%s'", label, command)
+    last_send = t_start
+    detector = ReadyDetector()
+    noise = bytearray()
+    while True:
+        if cancelled is not None and cancelled():
+            result["status"] = "cancel"
+            break
+        now = monotonic()
+        if now - t_start >= policy.deadline:
+            log.warning("<<< %s no 'C' within %.1fs (received %r)", label, policy.deadline, bytes(noise[-32:]))
+            break
+        if now - last_send >= policy.resend_interval and result["resends"] < policy.max_resends:
+            putc(payload)
+            last_send = now
+            result["resends"] += 1
+            log.info(">>> %s resend upgrade instruction (%d/%d)", label, result["resends"], policy.max_resends)
+
+        if detector.pending and read_token is not None:
+            char = read_token(policy.ready_quiet)
+        else:
+            char = getc(1)
+        if not char:
+            ready = detector.quiet()
+        else:
+            if result["timings"]["first_byte"] is None:
+                result["timings"]["first_byte"] = monotonic() - t_start
+            candidate = detector.candidate
+            ready = detector.feed(char)
+            if ready is None:
+                if candidate is not None:
+                    noise.extend(candidate)
+                if not detector.pending:
+                    noise.extend(char)
+        if ready is not None:
+            result["status"] = "ready"
+            result["ready"] = ready
+            result["timings"]["ready"] = monotonic() - t_start
+            log.info("<<< %s received %r after %.3fs", label, ready, result["timings"]["ready"])
+            break
+    if noise:
+        log.debug("<<< %s received before ready: %r", label, bytes(noise[-64:]))
+    return result
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+压缩传输扩展：固件先以 zlib 流压缩，再按普通 YMODEM 文件发送；线上的“文件”是压缩流，
+包0 的大小字段为压缩流长度，其后附加压缩标记：
+
+    包0 负载：name 0x00 <压缩后大小> 0x20 "zlib=<原始大小>:<原始数据 CRC32 十六进制>:<窗口位数>"
+
+- 支持该扩展的 Bootloader 在包0 的 ACK 之后、'C' 之前回一个 'Z' 表示接受，边收边解压写入 Flash；
+- 普通 Bootloader 不会回 'Z'：发送端随即发 CAN 放弃，避免把压缩数据当作固件写入。
+
+窗口位数（wbits）决定解压端需要的历史窗口：2**wbits 字节。默认 12（4 KB），
+单片机上的 inflate 只需 4 KB 窗口缓冲加少量状态即可解压，不必容纳整个镜像。
+
+StreamDecoder 是接收端的参考实现（模拟设备 simulator.py 使用）：按包喂入数据、按块产出解压结果，
+内存占用与镜像大小无关，结束时校验原始长度与 CRC32。
+"""
+
+import re
+import zlib
+
+COMPRESS_MARK = b'Z'  # 接收端接受压缩传输时在 ACK 之后、'C' 之前发送
+DEFAULT_LEVEL = 9
+DEFAULT_WBITS = 12  # 4 KB 窗口（zlib 允许 9~15）
+CHUNK = 64 * 1024
+
+_TAG = re.compile(rb'^zlib=(\d+):([0-9a-fA-F]{1,8}):(\d+)$')
+
+
+def compress_image(data, level=DEFAULT_LEVEL, wbits=DEFAULT_WBITS):
+    """
+    以 zlib 流压缩固件（分块送入压缩器，不额外复制整个输入）。
+    返回：
+      (压缩流 bytes, 包0 压缩标记 bytes)。
+    """
+    view = memoryview(data).cast('B')
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    parts = []
+    crc = 0
+    for start in range(0, len(view), CHUNK):
+        chunk = view[start:start + CHUNK]
+        crc = zlib.crc32(chunk, crc)
+        parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+    return b''.join(parts), make_tag(len(view), crc, wbits)
+
+
+def make_tag(original_size, crc, wbits=DEFAULT_WBITS) -> bytes:
+    return f"zlib={original_size}:{crc:08x}:{wbits}".encode('ascii')
+
+
+def parse_tag(rest):
+    """
+    从包0 文件名之后的部分（size 0x20 ...）解析压缩标记。
+    返回：
+      (原始大小, crc32, wbits)；没有标记或格式不符时返回 None。
+    """
+    for field in bytes(rest).split(b'\x00')[0].split(b' ')[1:]:
+        match = _TAG.match(field)
+        if match:
+            wbits = int(match.group(3))
+            if 9 <= wbits <= 15:
+                return int(match.group(1)), int(match.group(2), 16), wbits
+    return None
+
+
+class DecodeError(Exception):
+    pass
+
+
+class StreamDecoder(object):
+    """
+    接收端的流式解压（Bootloader 参考实现）：
+      1) 包0 解析出 (原始大小, crc32, wbits)，wbits 大于设备窗口缓冲时拒绝（不回 'Z'）；
+      2) 每个数据包的负载（按包0 中的压缩后大小截掉末包填充）送入 feed()，得到的解压数据依次写入 Flash；
+         zlib 流自带结束标记，末尾多余的填充字节会被忽略；
+      3) EOT 后调用 finish()：压缩流必须完整结束，且原始长度与 CRC32 一致，否则整个镜像无效。
+    """
+
+    def __init__(self, original_size, crc, wbits=DEFAULT_WBITS):
+        self.original_size = original_size
+        self.crc = crc
+        self._inflater = zlib.decompressobj(wbits)
+        self._crc = 0
+        self.output_size = 0
+        self.input_size = 0
+
+    def feed(self, payload) -> bytes:
+        """送入一段压缩数据，返回本次解压出的数据（可能为空）。"""
+        self.input_size += len(payload)
+        try:
+            out = self._inflater.decompress(payload)
+        except zlib.error as e:
+            raise DecodeError(f"corrupt compressed stream: {e}")
+        self.output_size += len(out)
+        if self.output_size > self.original_size:
+            raise DecodeError(f"decompressed data exceeds {self.original_size} bytes")
+        self._crc = zlib.crc32(out, self._crc)
+        return out
+
+    def finish(self) -> bytes:
+        """压缩流结束时调用：返回剩余的解压数据，并校验长度与 CRC32。"""
+        out = self._inflater.flush()
+        self.output_size += len(out)
+        self._crc = zlib.crc32(out, self._crc)
+        if not self._inflater.eof:
+            raise DecodeError("compressed stream ended early")
+        if self.output_size != self.original_size:
+            raise DecodeError(f"size mismatch: {self.output_size} != {self.original_size}")
+        if self._crc != self.crc:
+            raise DecodeError(f"crc mismatch: {self._crc:08x} != {self.crc:08x}")
+        return out
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+CRC-16/XMODEM（多项式 0x1021，初值 0，不反射，无终异或）计算后端。
+- "binascii"：标准库 binascii.crc_hqx（C 实现，默认）。
+- "table"：纯 Python 查表实现，每次处理 2 字节（slicing-by-2），作为后备与参照。
+所有后端都支持增量计算：crc16(b, crc16(a)) == crc16(a + b)。
+
+微基准（对照 YMODEM.crctable 的逐字节实现）：
+    python crc16.py
+与参照实现的交叉校验见 tests/test_crc16.py。
+"""
+
+import binascii
+import timeit
+
+POLY = 0x1021
+
+
+def _make_tables():
+    """生成 slicing-by-2 所需的两张表：T0[i] = i·x^16 mod P，T1[i] = i·x^24 mod P。"""
+    t0 = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ POLY) if crc & 0x8000 else (crc << 1)
+        t0.append(crc & 0xffff)
+    t1 = [((c << 8) ^ t0[c >> 8]) & 0xffff for c in t0]
+    return t0, t1
+
+
+_T0, _T1 = _make_tables()
+
+
+def crc16_binascii(data, crc=0) -> int:
+    """binascii.crc_hqx 后端（与 CRC-16/XMODEM 相同）。"""
+    return binascii.crc_hqx(data, crc)
+
+
+def crc16_table(data, crc=0) -> int:
+    """纯 Python 查表后端：每次合并处理 2 字节，奇数长度的末字节单独处理。"""
+    t0, t1 = _T0, _T1
+    mv = memoryview(data).cast('B')
+    n = len(mv) & ~1
+    for a, b in zip(mv[0:n:2], mv[1:n:2]):
+        x = crc ^ ((a << 8) | b)
+        crc = t1[x >> 8] ^ t0[x & 0xff]
+    if n != len(mv):
+        crc = ((crc << 8) ^ t0[((crc >> 8) ^ mv[n]) & 0xff]) & 0xffff
+    return crc
+
+
+BACKENDS = {
+    "binascii": crc16_binascii,
+    "table": crc16_table,
+}
+
+_backend_name = "binascii"
+crc16 = crc16_binascii
+
+
+def set_backend(name):
+    """
+    切换全局 CRC 后端（"binascii" / "table"）；名称未知时抛出 ValueError。
+    YMODEM.calc_crc 每次调用时经由 crc16.crc16 解析后端，切换立即生效。
+    """
+    global _backend_name, crc16
+    try:
+        crc16 = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown CRC backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    _backend_name = name
+
+
+def get_backend() -> str:
+    return _backend_name
+
+
+class Crc16(object):
+    """
+    增量 CRC 计算器，适合边读边算的流式场景：
+        c = Crc16(); c.update(part1); c.update(part2); c.value
+    """
+
+    def __init__(self, data=b"", crc=0):
+        self.value = crc
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        self.value = crc16(data, self.value)
+        return self
+
+    def digest(self) -> bytes:
+        """两字节大端 CRC（与 YMODEM 包尾格式一致）。"""
+        return bytes((self.value >> 8, self.value & 0xff))
+
+
+def _reference_crc(data, crc=0):
+    """原 YMODEM.calc_crc 的逐字节查表实现，仅用于基准对比。"""
+    from ymodem import YMODEM
+
+    table = YMODEM.crctable
+    for char in bytearray(data):
+        crc = ((crc << 8) ^ table[((crc >> 8) ^ char) & 0xff]) & 0xffff
+    return crc & 0xffff
+
+
+def benchmark(sizes=(128, 1024), number=2000):
+    """
+    微基准：各后端与参照实现计算一个包负载的平均耗时。
+    返回：
+      dict —— {size: {backend: 微秒/次}}
+    """
+    out = {}
+    for size in sizes:
+        data = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+        row = {}
+        for name, fn in list(BACKENDS.items()) + [("reference", _reference_crc)]:
+            seconds = timeit.timeit(lambda: fn(data), number=number)
+            row[name] = seconds / number * 1e6
+        out[size] = row
+    return out
+
+
+if __name__ == "__main__":
+    for size, row in benchmark().items():
+        print(f"{size:5d} B  " + "  ".join(f"{name}={us:8.2f}us" for name, us in row.items()))
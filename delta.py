@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+块级增量升级：把新固件按固定块长切分，与设备当前镜像（旧固件文件，或设备上报的块哈希清单）逐块比较，
+只发送变化的块及其偏移，最后附上新镜像的整体摘要。增量流作为一个普通 YMODEM“文件”发送：
+
+    包0 负载：name 0x00 <增量流长度> 0x20 "delta=<新镜像大小>:<块长>:<基准镜像摘要>"
+    增量流：  [偏移 u32 LE][长度 u32 LE][数据] ... [0xFFFFFFFF][32][新镜像 sha256]
+
+- 支持该扩展的 Bootloader 先核对自身当前镜像的摘要与包0 中的基准摘要一致，再以 ACK 'D' 'C' 接受；
+  收到的块覆盖到当前镜像的副本上（A/B 分区或逐扇区读改写），按新大小截断，校验 sha256 后才生效。
+- 普通 Bootloader 或基准不符的设备不会回 'D'：发送端发 CAN 放弃，FlashSession 重新握手后完整发送。
+- 变化的块超过一定比例时增量并不划算，直接完整发送。
+
+DeltaApplier 是接收端的参考实现（模拟设备 simulator.py 使用）。
+
+    python -m delta manifest old.bin --block-size 4096 > main.manifest.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import struct
+import sys
+
+import framing
+
+DELTA_MARK = b'D'  # 接收端接受增量升级时在 ACK 之后、'C' 之前发送
+DEFAULT_BLOCK_SIZE = 4096
+BLOCK_HASH_LEN = 16  # 块哈希：sha256 十六进制前 16 位
+DIGEST_LEN = 16  # 包0 中基准镜像摘要的长度
+MAX_RATIO = 0.6  # 增量流超过完整镜像的该比例时改为完整发送
+
+_RECORD = struct.Struct('<II')
+_END = 0xFFFFFFFF
+
+
+def _block_hash(block) -> str:
+    return hashlib.sha256(block).hexdigest()[:BLOCK_HASH_LEN]
+
+
+def make_manifest(data, block_size=DEFAULT_BLOCK_SIZE) -> dict:
+    """
+    镜像的块哈希清单（设备可按同样的方式计算并上报自己的当前镜像）。
+    返回：
+      {"block_size", "size", "digest"（整体 sha256 十六进制）, "blocks"（各块哈希）}
+    """
+    view = memoryview(data).cast('B')
+    return {
+        "block_size": block_size,
+        "size": len(view),
+        "digest": hashlib.sha256(view).hexdigest(),
+        "blocks": [_block_hash(view[i:i + block_size]) for i in range(0, len(view), block_size)],
+    }
+
+
+def load_manifest(path, block_size=DEFAULT_BLOCK_SIZE) -> dict:
+    """
+    读取增量基准：.json 为块哈希清单（make_manifest 的格式），其它文件视为旧固件镜像并现场计算清单。
+    清单格式不符时抛出 ValueError。
+    """
+    if str(path).lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if not isinstance(manifest, dict) or not {"block_size", "size", "digest", "blocks"} <= set(manifest) \
+                or not isinstance(manifest["block_size"], int) or manifest["block_size"] <= 0:
+            raise ValueError(f"{path}: not a block manifest")
+        return manifest
+    with open(path, 'rb') as f:
+        return make_manifest(f.read(), block_size)
+
+
+def make_tag(new_size, manifest) -> bytes:
+    return f"delta={new_size}:{manifest['block_size']}:{manifest['digest'][:DIGEST_LEN]}".encode('ascii')
+
+
+def parse_tag(rest):
+    """
+    从包0 文件名之后的部分（size 0x20 ...）解析增量标记。
+    返回：
+      (新镜像大小, 块长, 基准摘要)；没有标记或格式不符时返回 None。
+    """
+    for field in bytes(rest).split(b'\x00')[0].split(b' ')[1:]:
+        if field.startswith(b'delta='):
+            try:
+                size, block_size, digest = field[len(b'delta='):].decode('ascii').split(':')
+                return int(size), int(block_size), digest
+            except (ValueError, UnicodeDecodeError):
+                return None
+    return None
+
+
+def make_delta(data, manifest):
+    """
+    按基准清单计算增量流。
+    返回：
+      (增量流 bytes, 变化的块数, 总块数)。
+    """
+    view = memoryview(data).cast('B')
+    block_size = manifest["block_size"]
+    old = manifest["blocks"]
+    parts = []
+    changed = 0
+    total = (len(view) + block_size - 1) // block_size
+    for index in range(total):
+        start = index * block_size
+        block = view[start:start + block_size]
+        if index < len(old) and old[index] == _block_hash(block):
+            continue
+        parts.append(_RECORD.pack(start, len(block)))
+        parts.append(block)
+        changed += 1
+    parts.append(_RECORD.pack(_END, 32))
+    parts.append(hashlib.sha256(view).digest())
+    return b''.join(parts), changed, total
+
+
+def frame_delta(data, manifest, file_name, packet_size=128, header_pad=b'\x00', pad=b'\x1a', compress=False,
+                max_ratio=MAX_RATIO):
+    """
+    为新镜像 data 组帧增量流（可再压缩）。
+    返回：
+      framing.FramedImage，附加属性 delta = {"changed_blocks", "total_blocks", "block_size", "stream_size"}，
+      original_size 为新镜像大小；增量流超过完整镜像的 max_ratio 时返回 None（应完整发送）。
+    """
+    stream, changed, total = make_delta(data, manifest)
+    size = len(memoryview(data).cast('B'))
+    if len(stream) > size * max_ratio:
+        logging.getLogger('YReporter').info("*** delta %d/%d blocks (%d bytes) not worth it, sending the full image",
+                                            changed, total, len(stream))
+        return None
+    image = framing.FramedImage(stream, file_name, packet_size, header_pad, pad, compress=compress,
+                                header_extra=make_tag(size, manifest))
+    image.original_size = size
+    image.delta = {"changed_blocks": changed, "total_blocks": total, "block_size": manifest["block_size"],
+                   "stream_size": len(stream)}
+    return image
+
+
+class DeltaError(Exception):
+    pass
+
+
+class DeltaApplier(object):
+    """
+    接收端应用增量流（Bootloader 参考实现）：
+      1) 包0 解析出 (新大小, 块长, 基准摘要)，与自身当前镜像的摘要不符时拒绝（不回 'D'）；
+      2) 增量流按到达顺序送入 feed()（可在任意位置断开），每凑齐一条记录就把数据写到新镜像的对应偏移；
+         新镜像以当前镜像的副本为起点（A/B 分区：先整体复制，或只在写入时按扇区读改写）；
+      3) 收到结束记录后 finish() 按新大小截断并校验整体 sha256，通过后新镜像才可启动。
+    """
+
+    def __init__(self, base, new_size, block_size):
+        self.image = bytearray(base[:new_size])
+        self.image.extend(bytes(max(0, new_size - len(self.image))))
+        self.new_size = new_size
+        self.block_size = block_size
+        self.blocks = 0
+        self.digest = None
+        self._pending = bytearray()
+
+    def feed(self, data):
+        """送入一段增量流。"""
+        if self.digest is not None:
+            return  # 结束记录之后的填充字节
+        self._pending.extend(data)
+        while len(self._pending) >= _RECORD.size:
+            offset, length = _RECORD.unpack_from(self._pending)
+            if len(self._pending) < _RECORD.size + length:
+                return
+            body = bytes(self._pending[_RECORD.size:_RECORD.size + length])
+            del self._pending[:_RECORD.size + length]
+            if offset == _END:
+                self.digest = body
+                return
+            if offset % self.block_size or offset + length > self.new_size:
+                raise DeltaError(f"block at {offset}+{length} outside the new image")
+            self.image[offset:offset + length] = body
+            self.blocks += 1
+
+    def finish(self) -> bytes:
+        """增量流结束时调用：校验整体摘要，返回新镜像。"""
+        if self.digest is None:
+            raise DeltaError("delta stream ended before the final digest")
+        if hashlib.sha256(self.image).digest() != self.digest:
+            raise DeltaError("image digest mismatch after applying the delta")
+        return bytes(self.image)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="delta", description="block manifests for delta upgrades")
+    sub = parser.add_subparsers(dest="command")
+    p_manifest = sub.add_parser("manifest", help="print the block manifest of an image as JSON")
+    p_manifest.add_argument("image", help="firmware image currently on the device")
+    p_manifest.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                            help=f"block size in bytes (default {DEFAULT_BLOCK_SIZE})")
+    args = parser.parse_args(argv)
+    if args.command != "manifest":
+        parser.print_help()
+        return 2
+    try:
+        manifest = load_manifest(args.image, args.block_size)
+    except (OSError, ValueError) as e:
+        print(f"delta: {e}", file=sys.stderr)
+        return 2
+    json.dump(manifest, sys.stdout)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
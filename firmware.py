@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+固件数据源：让 YMODEM 发送循环中的 read(packet_size) 不再触碰磁盘。
+- MappedSource：本地文件用 mmap 映射，read() 返回零拷贝的 memoryview 切片。
+- ReadAheadSource：无法映射的流（管道、网络流等）由后台线程预读后续 K 个包，
+  发送端等待 ACK 的同时下一个包已在内存中就绪。
+open_source()/as_source() 自动选择合适的实现；二者都实现文件对象的 read(size) 接口。
+"""
+
+import io
+import logging
+import mmap
+import os
+import queue
+import threading
+
+# 预读深度（包数）
+DEFAULT_DEPTH = 8
+
+
+class MappedSource(object):
+    """
+    只读映射本地文件，read(size) 按顺序返回 memoryview 切片（不复制数据）。
+    切片在 close() 之后仍可安全使用：映射会保留到最后一个切片被释放为止。
+    """
+
+    def __init__(self, path_or_stream):
+        """
+        参数：
+          path_or_stream: 文件路径，或带 fileno() 的已打开二进制文件（不负责关闭该文件）。
+        异常：
+          文件无法映射时抛出 OSError/ValueError/io.UnsupportedOperation，由 open_source() 回退到预读。
+        """
+        self.log = logging.getLogger('YReporter')
+        self._owned = None
+        if isinstance(path_or_stream, (str, bytes, os.PathLike)):
+            self.name = os.fspath(path_or_stream)
+            self._owned = f = open(path_or_stream, 'rb')
+        else:
+            f = path_or_stream
+            self.name = getattr(f, 'name', '')
+        try:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                # 提示内核提前把整个镜像读入页缓存，避免发送中途缺页等待磁盘
+                if hasattr(self._mm, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+                    try:
+                        self._mm.madvise(mmap.MADV_WILLNEED)
+                    except OSError:
+                        pass
+                self.view = memoryview(self._mm)
+            else:
+                self._mm = None
+                self.view = memoryview(b'')
+        except Exception:
+            if self._owned:
+                self._owned.close()
+            raise
+        self.pos = 0
+
+    def read(self, size=-1):
+        """返回从当前位置起最多 size 字节的 memoryview 切片；到达末尾返回空切片。"""
+        start = self.pos
+        end = self.size if size is None or size < 0 else min(self.size, start + size)
+        self.pos = end
+        return self.view[start:end]
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, min(self.size, base + offset))
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        try:
+            self.view.release()
+        except BufferError:
+            pass
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # 仍有切片在使用：映射随最后一个切片释放
+                pass
+        if self._owned:
+            self._owned.close()
+            self._owned = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReadAheadSource(object):
+    """
+    后台预读：线程以 chunk_size 为单位读取底层流，最多缓存 depth 块。
+    read(size) 从预读队列取数据（size 与 chunk_size 相同时无需拼接）。
+    底层读取异常会在下一次 read() 时重新抛出。
+    """
+
+    def __init__(self, stream, chunk_size=128, depth=DEFAULT_DEPTH, close_stream=False):
+        """
+        参数：
+          stream: 任意带 read(size) 的二进制流。
+          chunk_size: 预读单位（通常等于 YMODEM 包长）。
+          depth: 最多预读的块数 K。
+          close_stream: close() 时是否一并关闭 stream。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.stream = stream
+        self.name = getattr(stream, 'name', '')
+        self.chunk_size = chunk_size
+        self.close_stream = close_stream
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._stop = threading.Event()
+        self._pending = b''
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self.stream.read(self.chunk_size)
+                self._put(chunk or b'')
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _next_chunk(self):
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            self._eof = True
+            raise item
+        if not item:
+            self._eof = True
+        return item
+
+    def read(self, size=-1):
+        """读取最多 size 字节（size<0 读到末尾）；到达末尾返回 b''。"""
+        if size is None or size < 0:
+            parts = [self._pending]
+            self._pending = b''
+            while not self._eof:
+                parts.append(self._next_chunk())
+            return b''.join(parts)
+        data = self._pending
+        while len(data) < size and not self._eof:
+            chunk = self._next_chunk()
+            data = chunk if not data else data + chunk
+        self._pending = data[size:]
+        return data[:size]
+
+    def close(self):
+        self._stop.set()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._thread.join(timeout=1.0)
+        if self.close_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_source(path, chunk_size=128, depth=DEFAULT_DEPTH):
+    """
+    打开固件文件：优先 mmap，映射失败（特殊文件系统等）时回退为后台预读。
+    返回的数据源需由调用方 close()。
+    """
+    try:
+        return MappedSource(path)
+    except (OSError, ValueError):
+        return ReadAheadSource(open(path, 'rb'), chunk_size, depth, close_stream=True)
+
+
+def as_source(stream, chunk_size=128, depth=DEFAULT_DEPTH):
+    """
+    把调用方已打开的流包装为数据源（不接管其关闭）：
+      - 已经是 MappedSource/ReadAheadSource，或内存中的 BytesIO：原样返回；
+      - 普通文件：mmap 映射（从其当前位置开始）；
+      - 其它流：后台预读。
+    返回：
+      (source, owned)：owned=True 表示 source 为新建的包装，用完需 close()。
+    """
+    if isinstance(stream, (MappedSource, ReadAheadSource, io.BytesIO)):
+        return stream, False
+    try:
+        start = stream.tell()
+        source = MappedSource(stream)
+        source.seek(start)
+        return source, True
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return ReadAheadSource(stream, chunk_size, depth), True
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+预组帧固件镜像与缓存。
+FramedImage 把一个固件一次性组帧为连续缓冲区：[包0][数据包1..N][结束空包]，
+每个包都是可直接发送的完整帧（SOH/STX + 块序号 + 反码 + 数据 + CRC）。
+重传只需按下标切片，不再重复读取/填充/计算 CRC。
+
+FramedImage 也可以承载压缩流（compression.py）或增量流（delta.py）：此时各帧是压缩/增量数据，包0 附带相应标记。
+
+FramedImageCache 以 (路径, mtime, 大小, 包长, 填充字节, 是否压缩) 为键缓存 FramedImage，
+按内存预算做 LRU 淘汰；多行、多次升级同一个 .bin 时共用同一份帧数据。
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import compression
+import crc16
+import firmware
+
+SOH = b'\x01'
+STX = b'\x02'
+
+PACKET_SIZES = {
+    'ymodem': 1024,
+    'ymodem128': 128,
+    'ymodem-g': 1024,
+    'auto': 1024,
+}
+
+# 默认缓存预算：64 MB，足够容纳 8 个接口的多版本镜像
+DEFAULT_BUDGET = 64 * 1024 * 1024
+
+
+def packet_size_for(mode) -> int:
+    """YMODEM 模式名 → 数据包长度；模式未知时抛出 ValueError。"""
+    try:
+        return PACKET_SIZES[mode]
+    except KeyError:
+        raise ValueError("<<< Invalid mode specified: {mode!r}".format(mode=mode))
+
+
+def make_frame(payload, sequence, packet_size, pad):
+    """
+    组一个完整帧：头（SOH/STX、块序号、反码）+ 填充到 packet_size 的数据 + 2 字节 CRC。
+    返回：
+      bytes —— 可直接写出的帧。
+    """
+    head = SOH if packet_size == 128 else STX
+    body = bytes(payload).ljust(packet_size, pad)
+    crc = crc16.crc16(body)
+    return head + bytes((sequence & 0xff, 0xff - (sequence & 0xff))) + body + bytes((crc >> 8, crc & 0xff))
+
+
+def make_header_payload(file_name, file_size, extra=b'') -> bytes:
+    """包0 负载：文件名 + 0x00 + 十进制大小 + 0x20 + 扩展字段 extra（不含填充）。"""
+    return bytes(file_name, encoding="utf8") + b'\x00' + bytes(str(file_size), encoding="utf8") + b'\x20' + extra
+
+
+class FramedImage(object):
+    """
+    一次性组帧的固件镜像。
+    属性：
+      file_name / file_size / packet_size: 基本信息（压缩时 file_size 为压缩流长度，即线上的文件大小）。
+      compressed / original_size: 是否为压缩流；固件本身的大小。
+      header_extra: 包0 中大小之后的扩展字段（增量/压缩标记，以空格分隔）。
+      delta: 增量流的统计（见 delta.frame_delta）；完整镜像为 None。
+      count: 数据包数量。
+      frame_len: 数据帧长度（packet_size + 5）。
+      buffer: 整个组帧缓冲区的只读 memoryview（[包0][数据包1..N][结束空包]）。
+      nbytes: 缓冲区总字节数（用于缓存预算）。
+    """
+
+    HEADER_FRAME_LEN = 128 + 5
+
+    def __init__(self, data, file_name, packet_size=128, header_pad=b'\x00', pad=b'\x1a', compress=False,
+                 header_extra=b''):
+        """
+        参数：
+          data: 固件内容（bytes/bytearray/memoryview）。
+          file_name: 包0中发送给对端的文件名（不含路径）。
+          packet_size: 数据包长度（128/1024）。
+          header_pad/pad: 包0 与数据包的填充字节。
+          compress: True 时先按 compression.compress_image 压缩，再对压缩流组帧。
+          header_extra: 包0 中大小之后的扩展字段（压缩标记会追加在其后）。
+        """
+        assert packet_size in (128, 1024), packet_size
+        data = memoryview(data).cast('B')
+        self.original_size = len(data)
+        self.compressed = bool(compress)
+        self.header_extra = header_extra
+        self.delta = None
+        if compress:
+            data, tag = compression.compress_image(data)
+            self.header_extra = b' '.join(field for field in (header_extra, tag) if field)
+            data = memoryview(data)
+        self.file_name = file_name
+        self.file_size = len(data)
+        self.packet_size = packet_size
+        self.frame_len = packet_size + 5
+        self.count = (self.file_size + packet_size - 1) // packet_size
+
+        buf = bytearray(self.HEADER_FRAME_LEN * 2 + self.frame_len * self.count)
+        header = make_header_payload(file_name, self.file_size, self.header_extra)
+        if len(header) > 128:
+            raise ValueError(f"file name {file_name!r} too long for packet 0")
+        buf[0:self.HEADER_FRAME_LEN] = make_frame(header, 0, 128, header_pad)
+        pos = self.HEADER_FRAME_LEN
+        for i in range(self.count):
+            chunk = data[i * packet_size:(i + 1) * packet_size]
+            buf[pos:pos + self.frame_len] = make_frame(chunk, i + 1, packet_size, pad)
+            pos += self.frame_len
+        buf[pos:pos + self.HEADER_FRAME_LEN] = make_frame(b'\x00', 0, 128, header_pad)
+        self.pad = pad
+
+        # 直接持有组帧用的 bytearray，不再复制一份 bytes；对外只给只读视图（导出视图后 bytearray 也不能再改变长度）
+        self._view = memoryview(buf).toreadonly()
+        self.buffer = self._view
+        self.nbytes = len(buf)
+
+    @classmethod
+    def from_file(cls, path, packet_size=128, header_pad=b'\x00', pad=b'\x1a', file_name=None, compress=False):
+        source = firmware.open_source(path, packet_size)
+        try:
+            data = source.view if isinstance(source, firmware.MappedSource) else source.read()
+            return cls(data, file_name or os.path.basename(path), packet_size, header_pad, pad, compress)
+        finally:
+            source.close()
+
+    @property
+    def header_packet(self):
+        """包0（文件名与大小）。"""
+        return self._view[0:self.HEADER_FRAME_LEN]
+
+    @property
+    def end_packet(self):
+        """结束会话的空包0。"""
+        return self._view[self.nbytes - self.HEADER_FRAME_LEN:]
+
+    def packet(self, index):
+        """
+        第 index 个数据包（0-based，对应块序号 index+1）的帧切片（零拷贝 memoryview）。
+        """
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start = self.HEADER_FRAME_LEN + index * self.frame_len
+        return self._view[start:start + self.frame_len]
+
+    def payload(self, offset, size):
+        """
+        取文件偏移 [offset, offset+size) 的原始数据（不含填充，超出文件末尾的部分截掉），可跨帧。
+        """
+        end = min(offset + size, self.file_size)
+        parts = []
+        while offset < end:
+            index, within = divmod(offset, self.packet_size)
+            take = min(self.packet_size - within, end - offset)
+            start = self.HEADER_FRAME_LEN + index * self.frame_len + 3 + within
+            parts.append(self._view[start:start + take])
+            offset += take
+        return b''.join(parts)
+
+    def frame_at(self, offset, size, sequence, pad=None):
+        """
+        取从文件偏移 offset 开始、块长为 size、块序号为 sequence 的完整帧。
+        与镜像组帧方式一致（块长相同、偏移对齐、序号吻合）时直接返回现成的切片；
+        否则（块长自适应切换后）由原始数据现场组帧。
+        """
+        sequence &= 0xff
+        if size == self.packet_size and offset % size == 0:
+            index = offset // size
+            if ((index + 1) & 0xff) == sequence:
+                return self.packet(index)
+        return make_frame(self.payload(offset, size), sequence, size, self.pad if pad is None else pad)
+
+    def __len__(self):
+        return self.count
+
+
+class FramedImageCache(object):
+    """
+    FramedImage 的 LRU 缓存（线程安全）。
+    键：(绝对路径, mtime_ns, 大小, 包长, header_pad, pad, 是否压缩)；文件被改写后 mtime/大小变化即自动失效。
+    淘汰：缓存总字节数超过 budget 时，淘汰最久未使用的镜像（单个超预算的镜像不入缓存）。
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.log = logging.getLogger('YReporter')
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, packet_size=128, header_pad=b'\x00', pad=b'\x1a', compress=False) -> FramedImage:
+        """
+        取得文件的组帧镜像（compress 为 True 时为压缩流的组帧镜像）；未命中时读取并组帧后加入缓存。
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size, packet_size, header_pad, pad, bool(compress))
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        image = FramedImage.from_file(path, packet_size, header_pad, pad, compress=compress)
+        self.log.debug("*** framed %s (%d packets, %d bytes)", path, image.count, image.nbytes)
+        with self._lock:
+            if key not in self._items and image.nbytes <= self.budget:
+                # 同一路径的旧版本（mtime/大小已变）不再可能命中，先行移除
+                for old in [k for k in self._items if k[0] == path and k[1:3] != key[1:3]]:
+                    self.nbytes -= self._items.pop(old).nbytes
+                self._items[key] = image
+                self.nbytes += image.nbytes
+                while self.nbytes > self.budget:
+                    _, evicted = self._items.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+# 进程内共享的默认缓存（GUI 各行、CLI 批量任务共用）
+default_cache = FramedImageCache()
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+串口热插拔检测：事件驱动地发现 USB 串口适配器的插入/拔出，并按适配器身份自动对应到接口行。
+- 事件来源（按优先级自动选择）：
+  udev（Linux，需安装 pyudev）→ inotify 监视 /dev（Linux，经 ctypes 调用 libc，无额外依赖）→ 定时轮询（其它平台）；
+- 只在收到事件时重新枚举串口（事件之后稍等 settle 秒，合并同一次插拔产生的多个事件），
+  空闲时不再每隔几秒枚举 sysfs；
+- 缓存每个端口的 VID/PID/序列号/USB 位置，回调给出新增与移除的端口；
+- PortMap 按 VID/PID/序列号/USB 位置把已知的适配器对应到接口行（例如治具上 MAIN 板固定接在某个 FTDI 上）。
+
+    watcher = HotplugWatcher(lambda ports, added, removed: print(added, removed))
+    watcher.start()
+
+端口映射文件（JSON，各条件都可省略，给出的条件必须全部满足）：
+    {"MAIN": {"vid": "0403", "pid": "6001", "serial_number": "A10K1234"},
+     "IMU": {"location": "1-1.2:1.0"}}
+
+命令行：逐行输出端口变化（JSON）。
+    python -m hotplug --map ports.json
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from time import monotonic
+
+DEFAULT_INTERVAL = 2.0  # 轮询方式的枚举间隔（秒）
+DEFAULT_SETTLE = 0.05  # 事件之后等待 udev/驱动完成设备节点的时间（秒）
+DEFAULT_MAP_PATH = os.path.join(os.path.expanduser("~"), ".ymodem_ports.json")
+
+BACKENDS = ("auto", "udev", "inotify", "poll")
+PORT_FIELDS = ("device", "vid", "pid", "serial_number", "location", "description")
+# /dev 下视为串口的设备名前缀（inotify 只对这些名字的变化重新枚举）
+TTY_PREFIXES = ("ttyUSB", "ttyACM", "ttyAMA", "ttyS", "ttyXRUSB", "ttyCH", "rfcomm")
+
+_IN_ATTRIB = 0x00000004
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_MOVED_TO = 0x00000080
+_IN_EVENT = struct.Struct('iIII')
+
+
+def list_ports() -> dict:
+    """
+    枚举当前的串口（pyserial），返回 {设备名: 端口信息 dict}。
+    端口信息字段见 PORT_FIELDS；没有 USB 信息的端口 vid/pid 等为 None。
+    """
+    import serial.tools.list_ports
+
+    ports = {}
+    for info in serial.tools.list_ports.comports():
+        ports[info.device] = {"device": info.device, "vid": info.vid, "pid": info.pid,
+                              "serial_number": info.serial_number, "location": info.location,
+                              "description": info.description}
+    return ports
+
+
+def _parse_id(value):
+    """VID/PID：整数，或十六进制字符串（"0403" / "0x0403"）。"""
+    if value is None or isinstance(value, int):
+        return value
+    return int(str(value), 16)
+
+
+class PortMap(object):
+    """
+    适配器身份 → 接口名。
+    参数：
+      rules: {接口名: {"vid", "pid", "serial_number", "location"}}，每条规则给出的字段必须全部与端口一致。
+    规则按给出的字段数从多到少匹配（带序列号的规则优先于只有 VID/PID 的规则）。
+    """
+
+    def __init__(self, rules=None):
+        self.rules = []
+        for iface, rule in (rules or {}).items():
+            unknown = set(rule) - {"vid", "pid", "serial_number", "location"}
+            if unknown:
+                raise ValueError(f"{iface}: unknown port map fields {sorted(unknown)}")
+            rule = {key: _parse_id(value) if key in ("vid", "pid") else value for key, value in rule.items()}
+            self.rules.append((iface.strip().upper(), rule))
+        self.rules.sort(key=lambda item: -len(item[1]))
+
+    def iface_for(self, info):
+        """端口信息 → 接口名；没有匹配的规则返回 None。"""
+        for iface, rule in self.rules:
+            if rule and all(info.get(key) == value for key, value in rule.items()):
+                return iface
+        return None
+
+    def __len__(self):
+        return len(self.rules)
+
+
+def load_port_map(path=DEFAULT_MAP_PATH) -> PortMap:
+    """读取端口映射文件；文件不存在时返回空映射，格式不符时抛出 ValueError。"""
+    if not path or not os.path.exists(path):
+        return PortMap()
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, dict) or not all(isinstance(rule, dict) for rule in rules.values()):
+        raise ValueError(f"{path}: expected {{iface: {{vid, pid, serial_number, location}}}}")
+    return PortMap(rules)
+
+
+class _Inotify(object):
+    """监视一个目录中设备节点的创建/删除（Linux inotify，经 ctypes 调用 libc）。"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_CREATE | _IN_DELETE | _IN_ATTRIB | _IN_MOVED_TO
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"cannot watch {directory}")
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+    def names(self) -> list:
+        """读取已到达的事件，返回涉及的文件名。"""
+        names = []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        pos = 0
+        while pos + _IN_EVENT.size <= len(data):
+            _, _, _, length = _IN_EVENT.unpack_from(data, pos)
+            name = data[pos + _IN_EVENT.size:pos + _IN_EVENT.size + length].rstrip(b'\x00')
+            names.append(os.fsdecode(name))
+            pos += _IN_EVENT.size + length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Udev(object):
+    """udev 的 tty 子系统事件（pyudev）。"""
+
+    def __init__(self):
+        import pyudev
+
+        self.monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        self.monitor.filter_by("tty")
+        self.monitor.start()
+
+    def fileno(self):
+        return self.monitor.fileno()
+
+    def names(self) -> list:
+        names = []
+        while True:
+            device = self.monitor.poll(timeout=0)
+            if device is None:
+                return names
+            names.append(device.sys_name)
+
+    def close(self):
+        pass
+
+
+class HotplugWatcher(object):
+    """
+    串口热插拔监视（后台线程）。
+    回调 callback(ports, added, removed)：
+      ports: 当前全部端口 {设备名: 端口信息}；added/removed: 新增/移除的端口信息列表。
+    回调在监视线程中执行，界面程序应自行切回主线程（例如 root.after）。
+    """
+
+    def __init__(self, callback, backend="auto", interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE,
+                 lister=None, dev_dir="/dev"):
+        """
+        参数：
+          callback: 端口变化回调；启动时以当前全部端口作为 added 回调一次。
+          backend: "auto" | "udev" | "inotify" | "poll"。
+          interval: 轮询方式的枚举间隔（秒）。
+          settle: 收到事件后等待多久再枚举（秒）。
+          lister: 枚举函数 lister() -> {设备名: 端口信息}；默认 list_ports（pyserial）。
+          dev_dir: inotify 监视的目录。
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown hotplug backend {backend!r}")
+        self.log = logging.getLogger('YReporter')
+        self.callback = callback
+        self.requested = backend
+        self.backend = None  # 实际使用的事件来源
+        self.interval = interval
+        self.settle = settle
+        self.lister = lister or list_ports
+        self.dev_dir = dev_dir
+        self.ports = {}  # 设备名 -> 端口信息（上一次枚举的结果）
+        self.scans = 0  # 实际枚举次数（统计用）
+        self._source = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _open_source(self):
+        """按 backend 打开事件来源；不可用时依次退化，最终为轮询（返回 None）。"""
+        candidates = ("udev", "inotify") if self.requested == "auto" else (self.requested,)
+        for name in candidates:
+            try:
+                if name == "udev":
+                    source = _Udev()
+                elif name == "inotify" and sys.platform.startswith("linux"):
+                    source = _Inotify(self.dev_dir)
+                else:
+                    continue
+            except (ImportError, OSError, AttributeError) as e:
+                self.log.debug("hotplug: %s unavailable: %s", name, e)
+                continue
+            self.backend = name
+            return source
+        self.backend = "poll"
+        return None
+
+    @staticmethod
+    def _relevant(name) -> bool:
+        return name.startswith(TTY_PREFIXES)
+
+    def scan(self):
+        """重新枚举端口并与缓存比较，有变化时回调。返回 (added, removed)。"""
+        try:
+            ports = self.lister()
+        except Exception as e:
+            self.log.warning("hotplug: port enumeration failed: %s", e)
+            return [], []
+        self.scans += 1
+        added = [info for device, info in ports.items() if self.ports.get(device) != info]
+        removed = [info for device, info in self.ports.items() if device not in ports]
+        self.ports = ports
+        if added or removed:
+            for info in added:
+                self.log.info("hotplug: + %s (%s)", info["device"], info.get("description") or "")
+            for info in removed:
+                self.log.info("hotplug: - %s", info["device"])
+            try:
+                self.callback(dict(ports), added, removed)
+            except Exception:
+                self.log.exception("hotplug callback failed")
+        return added, removed
+
+    def start(self):
+        self._stop.clear()
+        self._source = self._open_source()
+        self.log.info("hotplug: watching serial ports via %s", self.backend)
+        self._thread = threading.Thread(target=self._run, name="hotplug", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+    def _run(self):
+        self.scan()
+        source = self._source
+        while not self._stop.is_set():
+            if source is None:
+                self._stop.wait(self.interval)
+                if not self._stop.is_set():
+                    self.scan()
+                continue
+            try:
+                if not select.select([source], [], [], 0.5)[0]:
+                    continue
+                names = source.names()
+            except (OSError, ValueError) as e:
+                self.log.warning("hotplug: %s failed (%s), falling back to polling", self.backend, e)
+                source, self.backend = None, "poll"
+                continue
+            if self.backend == "inotify" and not any(self._relevant(name) for name in names):
+                continue
+            # 同一次插拔往往连续产生多个事件：等待 settle 后把已到达的事件一并读掉，再枚举一次
+            deadline = monotonic() + self.settle
+            while monotonic() < deadline and select.select([source], [], [], max(0.0, deadline - monotonic()))[0]:
+                source.names()
+            self.scan()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="hotplug", description="watch serial port hotplug events")
+    parser.add_argument("--backend", default="auto", choices=BACKENDS, help="event source (default auto)")
+    parser.add_argument("--map", default=DEFAULT_MAP_PATH, help="port map JSON (default %(default)s)")
+    args = parser.parse_args(argv)
+    try:
+        port_map = load_port_map(args.map)
+    except (OSError, ValueError) as e:
+        print(f"hotplug: {e}", file=sys.stderr)
+        return 2
+
+    def report(ports, added, removed):
+        for event, infos in (("add", added), ("remove", removed)):
+            for info in infos:
+                print(json.dumps(dict(info, event=event, iface=port_map.iface_for(info))), flush=True)
+
+    watcher = HotplugWatcher(report, backend=args.backend)
+    watcher.start()
+    print(f"hotplug: watching via {watcher.backend}", file=sys.stderr, flush=True)
+    try:
+        while watcher._thread.is_alive():
+            watcher._thread.join(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+链路调速：进入 Bootloader（以默认波特率握手收到 'C'）之后、发送包0 之前，请求设备切换到更高的波特率，
+以短暂的往返测试确认链路，失败则逐级降速；每个端口/适配器记住最高的稳定速率，下次直接从它开始。
+
+协议（文本行，"\\r\\n" 结尾；设备在等待包0 期间识别，普通 Bootloader 会把它们当作杂字节忽略）：
+
+    >>> $BAUD,<rate>              （旧速率）
+    <<< $BAUD,<rate>,OK            （旧速率；不支持该速率时回 $BAUD,<rate>,NO）
+        双方切换到 <rate>
+    >>> $PING,<hex>  ×N           （新速率）
+    <<< $PONG,<hex>  ×N
+    >>> $BAUD,COMMIT
+    <<< $BAUD,COMMIT,OK            设备从此保持新速率，继续发送 'C'
+
+设备切换后 revert_timeout 秒内没有收到 COMMIT 即退回默认波特率；发送端往返测试失败时同样退回默认速率，
+等待设备超时退回后再尝试下一个较低的速率。设备对 $BAUD 没有应答时视为不支持，保持默认速率，
+并记入 TuneStore，之后同一端口/适配器不再请求调速（删除该条记录即可重新检测）。
+传输中途失败的速率记入 TuneStore，下次从更低的速率开始。
+
+    tuner = LinkTuner(TuneStore())
+    link = tuner.tune(transport, key=link_key(transport))   # 已握手、设备正在发 'C'
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from time import monotonic
+
+DEFAULT_RATES = (921600, 460800, 230400, 115200)
+DEFAULT_BASE_RATE = 115200
+PROBE_ROUNDS = 3
+PROBE_BYTES = 96  # 每次往返测试的随机字节数（十六进制后为 2 倍）
+REPLY_TIMEOUT = 0.5  # 等待设备应答一行的时限（秒）
+REVERT_TIMEOUT = 0.5  # 设备在新速率下等待 COMMIT 的时限（秒）
+REVERT_MARGIN = 0.1  # 往返测试失败后，在 REVERT_TIMEOUT 之外多等待的时间（秒）
+SWITCH_DELAY = 0.02  # 收到 OK 后双方切换波特率的间隔（秒）
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".ymodem_links.json")
+
+_stores = {}  # 文件路径 -> TuneStore
+_lock = threading.Lock()
+
+
+def open_store(tune):
+    """
+    FlashSession 的 tune 参数 → LinkTuner：
+      LinkTuner 原样返回；TuneStore 包装为 LinkTuner；True 使用 DEFAULT_PATH；字符串为 JSON 文件路径；
+      None/False 返回 None（不调速）。同一路径在进程内只打开一次。
+    """
+    if not tune:
+        return None
+    if isinstance(tune, LinkTuner):
+        return tune
+    if isinstance(tune, TuneStore):
+        return LinkTuner(tune)
+    path = os.path.abspath(DEFAULT_PATH if tune is True else tune)
+    with _lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = TuneStore(path)
+    return LinkTuner(store)
+
+
+def link_key(transport) -> str:
+    """
+    调速记录的键：USB 串口适配器为 "vid:pid:序列号"（换插口后仍对应同一根线缆），
+    其它串口为端口名；无法枚举端口（未安装 pyserial 等）时同样退化为端口名。
+    """
+    port = getattr(transport, "port", None)
+    if port is None:
+        return transport.describe()
+    try:
+        import hotplug
+
+        info = hotplug.list_ports().get(port)
+    except Exception:
+        info = None
+    if info and info.get("vid") is not None:
+        return f"{info['vid']:04x}:{info['pid']:04x}:{info.get('serial_number') or info.get('location') or port}"
+    return port
+
+
+class TuneStore(object):
+    """
+    各端口/适配器的调速记录（线程安全，持久化为 JSON 文件）。
+    值：{"rate": 最高稳定速率, "failed": [传输中出错的速率], "supported": 设备是否应答调速请求（未知为 None）, "time"}。
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        参数：
+          path: JSON 文件路径；None 表示只保存在内存中。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = dict(json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                self.log.warning("*** ignoring unreadable link store %s: %s", path, e)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            return {"rate": entry.get("rate"), "failed": list(entry.get("failed", [])),
+                    "supported": entry.get("supported")}
+
+    def record(self, key, rate=None, failed=None, supported=None):
+        """
+        记录稳定速率 rate，或把 failed 加入出错速率（出错速率不再作为候选，记录的稳定速率随之降低）；
+        supported 不为 None 时记录设备是否应答调速请求（记录稳定速率即视为应答）。
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, {"rate": None, "failed": []})
+            if failed is not None and failed not in entry["failed"]:
+                entry["failed"].append(failed)
+                if entry["rate"] is not None and entry["rate"] >= failed:
+                    entry["rate"] = None
+            if rate is not None:
+                entry["rate"] = rate
+                entry["supported"] = True
+            if supported is not None:
+                entry["supported"] = supported
+                if not supported:
+                    entry["rate"] = None
+            entry["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self._save()
+
+    def _save(self):
+        """在锁内调用：写临时文件后替换。"""
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.log.warning("*** cannot write link store %s: %s", self.path, e)
+
+
+class LinkTuner(object):
+    """
+    在已进入 Bootloader 的链路上协商更高的波特率。
+    传输对象须提供 set_baudrate(rate)（SerialTransport）；没有该方法的传输（UDP）不调速。
+    """
+
+    def __init__(self, store=None, rates=DEFAULT_RATES, probe_rounds=PROBE_ROUNDS, reply_timeout=REPLY_TIMEOUT,
+                 revert_timeout=REVERT_TIMEOUT):
+        """
+        参数：
+          store: TuneStore；None 表示只在内存中记录。
+          rates: 候选波特率（从高到低尝试）。
+          probe_rounds: 每个速率的往返测试次数（全部通过才算稳定）。
+          reply_timeout: 等待设备应答一行的时限（秒）。
+          revert_timeout: 设备未收到 COMMIT 时退回默认速率的时限（秒，须与设备一致）。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.store = store if store is not None else TuneStore(None)
+        self.rates = sorted(set(rates), reverse=True)
+        self.probe_rounds = probe_rounds
+        self.reply_timeout = reply_timeout
+        self.revert_timeout = revert_timeout
+
+    def candidates(self, key, base_rate) -> list:
+        """
+        本次要尝试的速率（从高到低）：高于 base_rate 且低于传输中出过错的速率；有记录的稳定速率时从它开始。
+        记录为不支持调速的端口/适配器返回空列表。
+        """
+        entry = self.store.get(key) or {"rate": None, "failed": [], "supported": None}
+        if entry["supported"] is False:
+            return []
+        rates = [rate for rate in self.rates if rate > base_rate and rate not in entry["failed"]]
+        if entry["failed"]:
+            rates = [rate for rate in rates if rate < min(entry["failed"])]
+        if entry["rate"] in rates:
+            rates = rates[rates.index(entry["rate"]):]
+        return rates
+
+    @staticmethod
+    def _read_line(transport, timeout):
+        """读取一行以 '$' 开头的应答（忽略行外的 'C'/'G' 等字节）；超时返回 None。"""
+        line = None
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            char = transport.read_token(remaining)
+            if char is None:
+                return None
+            if char == b'$':
+                line = bytearray(char)
+            elif line is not None:
+                if char == b'\n':
+                    return bytes(line).rstrip(b'\r')
+                line += char
+                if len(line) > 512:
+                    line = None
+
+    def _request(self, transport, text, expect, timeout=None):
+        """发送一行并等待以 expect 开头的应答行；返回应答行，超时返回 None。"""
+        transport.putc(text.encode('ascii') + b'\r\n')
+        deadline = monotonic() + (self.reply_timeout if timeout is None else timeout)
+        while True:
+            line = self._read_line(transport, deadline - monotonic())
+            if line is None or line.startswith(expect.encode('ascii')):
+                return line
+
+    def _probe(self, transport) -> bool:
+        for _ in range(self.probe_rounds):
+            pattern = os.urandom(PROBE_BYTES).hex()
+            reply = self._request(transport, f"$PING,{pattern}", "$PONG,")
+            if reply != f"$PONG,{pattern}".encode('ascii'):
+                return False
+        return self._request(transport, "$BAUD,COMMIT", "$BAUD,COMMIT") == b"$BAUD,COMMIT,OK"
+
+    def tune(self, transport, key, base_rate=None, cancelled=None) -> dict:
+        """
+        协商波特率（须在握手收到 'C' 之后、发送包0 之前调用）。
+        参数：
+          transport: 已进入 Bootloader 的传输（提供 set_baudrate/read_token/putc）。
+          key: 记录稳定速率的端口/适配器标识。
+          base_rate: 当前（默认）波特率；None 时取 transport.baudrate。
+          cancelled: 可选的取消判断函数。
+        返回：
+          dict：baudrate（协商后的速率）/ base / tried（尝试过的速率及结果 [(rate, "ok"|"no"|"probe failed")]）
+                / supported（设备是否应答了调速请求；已记录为不支持时为 False，不再发送请求）/ elapsed（秒）。
+        """
+        set_baudrate = getattr(transport, "set_baudrate", None)
+        base_rate = base_rate or getattr(transport, "baudrate", None) or DEFAULT_BASE_RATE
+        result = {"baudrate": base_rate, "base": base_rate, "tried": [], "supported": None, "elapsed": 0.0}
+        if set_baudrate is None:
+            return result
+        entry = self.store.get(key)
+        if entry is not None and entry["supported"] is False:
+            self.log.debug("<<< %s: device does not support baud switching, staying at %d", key, base_rate)
+            result["supported"] = False
+            return result
+        t_start = monotonic()
+        for rate in self.candidates(key, base_rate):
+            if cancelled is not None and cancelled():
+                break
+            reply = self._request(transport, f"$BAUD,{rate}", f"$BAUD,{rate},")
+            if reply is None:
+                self.log.info("<<< %s: no reply to the baud request, staying at %d", key, base_rate)
+                result["supported"] = bool(result["tried"])
+                if not result["supported"]:
+                    # 不支持调速的 Bootloader：记下来，之后的会话不再为等待应答花费 reply_timeout
+                    self.store.record(key, supported=False)
+                break
+            result["supported"] = True
+            if reply != f"$BAUD,{rate},OK".encode('ascii'):
+                result["tried"].append((rate, "no"))
+                continue
+            time.sleep(SWITCH_DELAY)
+            set_baudrate(rate)
+            if self._probe(transport):
+                result["tried"].append((rate, "ok"))
+                result["baudrate"] = rate
+                self.store.record(key, rate=rate)
+                self.log.info("*** %s: link tuned to %d baud", key, rate)
+                break
+            # 双方退回默认速率：设备在 revert_timeout 内没有收到 COMMIT 会自行退回；
+            # 稍多等一会儿再切换，set_baudrate 同时丢弃期间收到的乱码
+            result["tried"].append((rate, "probe failed"))
+            self.log.warning("<<< %s: link test failed at %d baud, stepping down", key, rate)
+            time.sleep(self.revert_timeout + REVERT_MARGIN)
+            set_baudrate(base_rate)
+        result["elapsed"] = monotonic() - t_start
+        return result
+
+    def record_failure(self, key, rate):
+        """传输在调速后的 rate 下失败：下次不再尝试该速率及以上。"""
+        self.store.record(key, failed=rate)
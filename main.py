@@ -14,9 +14,7 @@ UPGRADE_V1.7
 import logging
 import base64
 import os
-import queue
 import threading
-import time
 import socket
 import ipaddress
 import tkinter as tk
@@ -25,12 +23,20 @@ from tkinter import ttk, filedialog, messagebox
 import serial
 import serial.tools.list_ports
 
+import framing
+import hotplug
+import linktune
+from bootloader import HandshakePolicy, enter_bootloader
+from progress import DEFAULT_PUMP_INTERVAL_MS, STATE_DONE, STATE_SENDING, ProgressBus
+from transport import PortLeases, SerialTransport, UdpHub, open_port, parse_udp_target
+from upgrade_tool import INTERFACE_NAMES, UPGRADE_COMMANDS
 from ymodem import YMODEM
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 SCRIPT_VERSION = "1.7"
-send_data_mutex = threading.Lock()
+BAUDRATES = ["300", "600", "1200", "2400", "4800", "9600", "19200", "38400",
+             "57600", "115200", "128000", "230400", "256000", "460800", "921600"]
 
 
 class SerialFlasherApp:
@@ -57,11 +63,12 @@ class SerialFlasherApp:
                                   xonxoff=False,
                                   rtscts=False,
                                   parity="N") for _ in range(1)]
-        self.queue = queue.Queue()
+        # 进度总线：发送线程只投递 (行, 百分比, 状态)，由 _pump_progress 按固定帧率统一刷新界面
+        self.queue = ProgressBus()
+        self.progress_pump_ms = DEFAULT_PUMP_INTERVAL_MS
         self.open_all_button_enabled = True
         self.close_all_button_enabled = False
         self.lock = threading.Lock()
-        self.ymodem_sender = YMODEM(lambda size: self.sender_getc(size, row), lambda data: self.sender_putc(data, row))
         # 让根窗口第0列可拉伸（根上所有子 Frame 都在 column=0）
         self.root.grid_columnconfigure(0, weight=1)
 
@@ -70,17 +77,16 @@ class SerialFlasherApp:
 
         # 串口部分
         self.serial_rows = []
-        self.progress_bars = []
         self.progress_percentage = []
         self.available_ports = []  # 存储所有可用串口
         self.rows = []  # 存储串口行
         self.opened_ports = []  # 用于记录已打开的串口列表
         self.opened_ports_count = 0  # 记录成功打开的串口数量
 
-        self.upgrade_commands = ["$SH,UPGRADE,MAIN", "$SH,UPGRADE,IMU", "$SH,UPGRADE,M1", "$SH,UPGRADE,M2",
-                                 "$SH,UPGRADE,M3", "$SH,UPGRADE,MP", "$JS,UPGRADE,MOTOR", "$JS,UPGRADE,IMU"]
+        # 升级指令表与接口名与无界面引擎（upgrade_tool.py）共用
+        self.upgrade_commands = list(UPGRADE_COMMANDS)
 
-        self.interface_names = ["MAIN", "IMU", "M1", "M2", "M3", "MP", "MOTOR", "JS_IMU"]
+        self.interface_names = list(INTERFACE_NAMES)
 
         # 记住每行的上次目录（长度 = 接口行数），以及全局最后一次目录
         self.last_open_dirs = [None] * 8
@@ -98,7 +104,8 @@ class SerialFlasherApp:
         # ✅ UDP 状态与配置
         self.udp_connected = False
         self.udp_sock = None
-        self.udp_rx_buf = bytearray()
+        self.udp_transport = None
+        self.udp_hub = None  # UDP 已连接时各行 "ip:port" 端口共用的 socket（transport.UdpHub）
         self.udp_conf = {
             "local_ip": "",
             "local_port": "",
@@ -117,10 +124,32 @@ class SerialFlasherApp:
 
         # ✅ 用已创建的行数来建事件列表
         self.cancel_events = [threading.Event() for _ in range(len(self.rows))]
-
-        # 定时检测可用串口
-        self.update_ports_thread = threading.Thread(target=self.update_ports_loop, daemon=True)
-        self.update_ports_thread.start()
+        # 每行升级期间使用的传输（行内独立串口/UDP，或公共串口/UDP），升级结束后复位为 None
+        self.row_transports = [None] * len(self.rows)
+        # 端口租约：同一串口/UDP 目标同一时刻只借给一行；留空端口的行共用顶部连接的同一个传输对象
+        self.port_leases = PortLeases()
+        self.row_port_keys = [None] * len(self.rows)
+        # 每行当前的 YMODEM 会话（每次升级新建），取消按键只作用于本行的会话
+        self.row_senders = [None] * len(self.rows)
+        # 进入升级模式的握手策略：等待 'C' 的总时限、升级指令重发间隔与次数
+        self.handshake_policy = HandshakePolicy()
+        # 链路调速（串口行勾选“调速”时）：行内独立串口握手后协商更高的波特率，
+        # 各适配器的最高稳定速率与是否支持调速记在 linktune.DEFAULT_PATH
+        self.link_tuner = linktune.open_store(True)
+
+        # 每行界面上已显示的进度，进度没有变化的行不重复 configure
+        self.shown_progress = [None] * len(self.rows)
+        self.root.after(self.progress_pump_ms, self._pump_progress)
+
+        # 串口热插拔：udev/inotify 事件驱动（其它平台退化为轮询），已知适配器自动填入对应的接口行
+        try:
+            self.port_map = hotplug.load_port_map()
+        except (OSError, ValueError) as e:
+            logging.warning("ignoring port map %s: %s", hotplug.DEFAULT_MAP_PATH, e)
+            self.port_map = hotplug.PortMap()
+        self.auto_ports = [None] * len(self.rows)  # 由端口映射自动填入各行的端口
+        self.hotplug = hotplug.HotplugWatcher(self._on_ports_changed)
+        self.hotplug.start()
 
         # 在初始化时禁用所有串口行的'关闭串口'按键
         for row in range(len(self.serial_rows)):
@@ -157,8 +186,7 @@ class SerialFlasherApp:
         # 创建一个波特率的 Combobox 控件
         baudrate_var = tk.StringVar()
         baudrate_combobox = ttk.Combobox(frame, textvariable=baudrate_var, state="readonly", width=25)
-        baudrate_combobox['values'] = ["300", "600", "1200", "2400", "4800", "9600", "19200", "38400",
-                                       "57600", "115200", "128000", "230400", "256000", "460800", "921600"]
+        baudrate_combobox['values'] = BAUDRATES
         baudrate_combobox.grid(row=0, column=2, padx=5, pady=0, sticky='ew')
 
         # 每个串口行的打开串口按键
@@ -186,53 +214,78 @@ class SerialFlasherApp:
         """
         创建单条升级行的 UI 组件，并返回对控件的引用字典。
         布局（从左到右）：
-          [接口标签] [选择文件按钮] [文件路径Entry(可拉伸)] [升级按钮]
+          [接口标签] [行串口/UDP下拉] [行波特率下拉+调速勾选] [选择文件按钮] [文件路径Entry(可拉伸)] [升级按钮] [接收按钮]
           [进度条(可拉伸)] [百分比标签] [状态标签] [取消按钮(可选)]
+        行串口下拉可选择串口，也可直接输入 "ip:port" 作为该行的 UDP 设备地址；
+        留空表示沿用顶部公共串口/UDP 连接。
         参数：
           row: 1-based 行号（同时用于回调闭包传参）。
           interface_name: 行左侧显示的接口名。
         返回：
-          dict，包含该行常用控件引用，如 flash_button/progress_bar/percentage_label/flash_status_label/cancel_flash_button 等。
+          dict，包含该行常用控件引用，如 port_combobox/baudrate_combobox/tune_var/flash_button/receive_button/
+          progress_bar/percentage_label/flash_status_label/cancel_flash_button 等。
         备注：
           该函数只负责创建与布局，不包含任何传输逻辑。
         """
         frame = tk.Frame(self.root)
 
-        # ✅ 让第2列（文件路径）与第4列（进度条）可横向拉伸
-        frame.grid_columnconfigure(2, weight=2)
-        frame.grid_columnconfigure(4, weight=1)
+        # ✅ 让第4列（文件路径）与第7列（进度条）可横向拉伸
+        frame.grid_columnconfigure(4, weight=2)
+        frame.grid_columnconfigure(7, weight=1)
 
         # 每个接口行的接口显示框
         upgrade_label = tk.Label(frame, text=f"{interface_name}", width=8, height=2, relief=tk.SUNKEN, )
         upgrade_label.grid(row=0, column=0, sticky=tk.E, padx=5, pady=0)
 
+        # 每个接口行独立的串口/UDP 地址（可编辑：选串口或输入 ip:port；留空=公共连接）
+        port_combobox = ttk.Combobox(frame, width=16)
+        port_combobox.grid(row=0, column=1, padx=5, pady=0)
+
+        # 每个接口行独立的波特率（留空=沿用顶部串口行的波特率）与调速开关，同放在第2列
+        baud_frame = tk.Frame(frame)
+        baud_frame.grid(row=0, column=2, padx=5, pady=0)
+        baudrate_combobox = ttk.Combobox(baud_frame, state="readonly", width=8)
+        baudrate_combobox['values'] = [""] + BAUDRATES
+        baudrate_combobox.pack(side=tk.LEFT)
+
+        # 链路调速开关（默认关闭）：勾选后，该行独立串口握手后协商更高的波特率，见 linktune.py
+        tune_var = tk.BooleanVar(value=False)
+        tune_check = tk.Checkbutton(baud_frame, text="调速", variable=tune_var)
+        tune_check.pack(side=tk.LEFT)
+
         # 每个接口行的选择升级文件按键
         select_file_button = tk.Button(frame, text="选择接口{}升级文件".format(row), height=2,
                                        command=lambda row=row: self.select_file(row))  # 为每个升级接口行的选择文件按钮添加一个row参数
-        select_file_button.grid(row=0, column=1, padx=5, pady=5)
+        select_file_button.grid(row=0, column=3, padx=5, pady=5)
 
         # 每个接口行的文件显示Entry
         file_path_entry = tk.Entry(frame, textvariable=self.file_path[row - 1], width=30,
                                    font=('宋体', 13))  # 使用对应interface行的file_path变量
-        file_path_entry.grid(row=0, column=2, padx=5, pady=0, sticky='ew')  # 文件显示 Entry（✅ 加 sticky）
+        file_path_entry.grid(row=0, column=4, padx=5, pady=0, sticky='ew')  # 文件显示 Entry（✅ 加 sticky）
 
-        # 每个接口行的烧录按键
+        # 每个接口行的烧录按键（串口/UDP 由该行自己的设置决定）
         flash_button = tk.Button(frame, text="升级",
-                                 command=lambda row=row: self.flash(row, self.serial_rows[0]['port_combobox'].get()),
-                                 state=tk.DISABLED, height=2, width=8, font=('宋体', 12))  # 修改这里，将选定的串口传递给flash函数
-        flash_button.grid(row=0, column=3, padx=5, pady=0)
+                                 command=lambda row=row: self.flash(row),
+                                 state=tk.DISABLED, height=2, width=8, font=('宋体', 12))
+        flash_button.grid(row=0, column=5, padx=5, pady=0)
+
+        # 每个接口行的接收按键：以 YMODEM 接收端身份从设备拉取文件（转储/标定表/日志）
+        receive_button = tk.Button(frame, text="接收",
+                                   command=lambda row=row: self.receive(row),
+                                   height=2, width=6, font=('宋体', 12))
+        receive_button.grid(row=0, column=6, padx=5, pady=0)
 
         # 烧录进度条控件
         progress_bar = ttk.Progressbar(frame, orient=tk.HORIZONTAL, length=200, mode='determinate')
-        progress_bar.grid(row=0, column=4, padx=5, pady=0, sticky='ew')  # 进度条（✅ 加 sticky；length=200 只是初始宽度）
+        progress_bar.grid(row=0, column=7, padx=5, pady=0, sticky='ew')  # 进度条（✅ 加 sticky；length=200 只是初始宽度）
 
         # 烧录进度条百分比
         percentage_label = tk.Label(frame, text="0%")
-        percentage_label.grid(row=0, column=5, padx=5, pady=0)
+        percentage_label.grid(row=0, column=8, padx=5, pady=0)
 
         # 烧录状态显示框
         flash_status_label = tk.Label(frame, fg='grey', text="准备升级", height=2, relief=tk.RIDGE, font=('宋体', 12))
-        flash_status_label.grid(row=0, column=6, padx=5, pady=0)
+        flash_status_label.grid(row=0, column=9, padx=5, pady=0)
 
         frame.grid(row=row + 2, column=0, columnspan=3, pady=0, sticky='ew')
 
@@ -241,12 +294,16 @@ class SerialFlasherApp:
             command=lambda row=row: self.cancel_flash(row),  # 传入当前行号
             state=tk.DISABLED, width=8, height=2, font=('宋体', 12)
         )
-        cancel_btn.grid(row=0, column=7, padx=5, pady=0)  # 放在最右侧新列，不影响原列布局
+        cancel_btn.grid(row=0, column=10, padx=5, pady=0)  # 放在最右侧新列，不影响原列布局
 
         return {
+            'port_combobox': port_combobox,
+            'baudrate_combobox': baudrate_combobox,
+            'tune_var': tune_var,
             'select_file_button': select_file_button,
             'file_path_entry': file_path_entry,
             'flash_button': flash_button,
+            'receive_button': receive_button,
             'progress_bar': progress_bar,
             'percentage_label': percentage_label,
             'flash_status_label': flash_status_label,
@@ -559,9 +616,9 @@ class SerialFlasherApp:
         启用 UDP 目标（为 socket 记录默认目的地址）。
         流程：
         1) 读取 self.udp_conf（local_ip/local_port/server_ip/server_port）并做基础校验。
-        2) 创建 UDP socket，必要时 bind(local_ip, local_port)，然后 connect(server_ip, server_port)。
-           注意：对于 UDP，connect() 不进行握手；只是在本地记录默认目的地址，
-           以及让 recv() 只接收来自该对端的数据，因此“连接成功”不代表对端在线。
+        2) 创建 UdpHub（一个 UDP socket，bind(local_ip, local_port)），并在其上登记 server_ip:server_port。
+           注意：UDP 不进行握手；集线器只按来源地址把数据分给登记的对端，因此“连接成功”不代表对端在线。
+           行端口填写 "ip:port" 的行在同一 socket 上登记各自的设备，一架网络设备共用一个 socket 同时升级。
         3) 若你实现了探测逻辑（_udp_probe），可在此处发送探测包并判断是否收到回包，
            以决定是否禁用串口按钮/提示“已验证”或“未验证”。
         4) 成功启用后：更新 self.udp_sock/self.udp_connected，并联动 UI
@@ -589,16 +646,12 @@ class SerialFlasherApp:
 
         # 建立/绑定/连接
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(1.0)
-            if lpt or lip:
-                sock.bind((lip, lpt))
-            # "连接"一个 UDP 目标，便于后续 recv() 只收该对端数据
-            sock.connect((sip, spt))
+            # 绑定公共 socket 并登记默认目标，recv 到的数据按来源地址分发
+            self.udp_hub = UdpHub(lip, lpt)
+            self.udp_transport = self.udp_hub.open(sip, spt)
             self._update_udp_target_display()
-            self.udp_sock = sock
+            self.udp_sock = self.udp_hub.sock
             self.udp_connected = True
-            self.udp_rx_buf.clear()
 
             # ✅ UI：UDP 连接成功 → 禁用串口开/关按钮；UDP 连接按钮置灰，关闭按钮高亮
             self.ui_call(self.serial_rows[0]['open_button'].configure, state=tk.DISABLED)
@@ -609,9 +662,12 @@ class SerialFlasherApp:
             messagebox.showinfo("提示", f"UDP 已连接到 {sip}:{spt}")
 
         except Exception as e:
+            if self.udp_hub:
+                self.udp_hub.close()
             self.udp_connected = False
             self.udp_sock = None
-            self.udp_rx_buf.clear()
+            self.udp_transport = None
+            self.udp_hub = None
             # ✅ UI：连接失败 → 恢复串口行默认状态（打开=可点、关闭=置灰；UDP 连接按钮可点，关闭置灰）
             self.ui_call(self.serial_rows[0]['open_button'].configure, state=tk.NORMAL)
             self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.DISABLED)
@@ -622,17 +678,20 @@ class SerialFlasherApp:
     def udp_close(self):
         """
         关闭当前 UDP socket（若存在），并将 UDP 相关状态复位：
-        - 关闭 self.udp_sock，清空 self.udp_rx_buf，置 self.udp_connected=False。
+        - 关闭 self.udp_hub（其上登记的公共目标与各行设备随之失效），置 self.udp_connected=False。
         - UI 恢复默认：允许重新“连接”UDP，串口按钮恢复可用。
         不影响已打开的串口（如有），也不改动升级线程状态。
         """
         try:
-            if self.udp_sock:
-                self.udp_sock.close()
+            if self.udp_transport:
+                self.port_leases.discard(self.udp_transport.describe())
+            if self.udp_hub:
+                self.udp_hub.close()
         finally:
+            self.udp_hub = None
+            self.udp_transport = None
             self.udp_sock = None
             self.udp_connected = False
-            self.udp_rx_buf.clear()
             # ✅ UI：关闭 UDP → 串口按钮恢复默认；UDP 连接按钮可点，关闭置灰
             self.ui_call(self.serial_rows[0]['open_button'].configure, state=tk.NORMAL)
             self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.DISABLED)
@@ -720,57 +779,93 @@ class SerialFlasherApp:
 
     def sender_getc(self, size, row):
         """
-        作为 YMODEM 的 getc 回调：读取 size 字节。
-        - 若 UDP 已启用且 self.udp_sock 存在：优先从 UDP 读取。
-          为适配 YMODEM 的“字节流”语义，这里用 self.udp_rx_buf 将 datagram 缓冲成字节流，
-          以满足上层反复 getc(1) 的读取方式（超时返回 None）。
-        - 否则：从串口 self.ser[0].read(size) 读取（未打开返回 None）。
-        该方法应为“非阻塞短超时”读取；出现 socket 超时/异常时返回 None，让上层继续轮询。
+        作为 YMODEM 的 getc 回调：从第 row 行（0-based）的传输读取 size 字节。
+        - 行传输由 _resolve_row_transport() 在升级开始时确定：行内独立串口/UDP，或公共串口/UDP。
+        - 传输内部把已到达的数据整块放入接收缓冲（rxbuffer），上层反复 getc(1) 只从缓冲区取字节。
+        该方法应为“非阻塞短超时”读取；超时或该行未在升级时返回 None，让上层继续轮询。
         """
-        # ✅ 如果 UDP 已连接，优先走 UDP
-        if self.udp_connected and self.udp_sock:
-            try:
-                # 用一个缓冲把 datagram 拆成字节流，满足 YMODEM 对 getc(1) 的调用习惯
-                if not self.udp_rx_buf:
-                    pkt = self.udp_sock.recv(4096)  # 单次尽量多收一点
-                    if pkt:
-                        self.udp_rx_buf.extend(pkt)
-                if not self.udp_rx_buf:
-                    return None
-                # 按请求大小返回
-                out = bytes(self.udp_rx_buf[:size])
-                del self.udp_rx_buf[:size]
-                return out or None
-            except socket.timeout:
-                return None
-            except Exception:
-                return None
+        transport = self.row_transports[row]
+        if transport is None:
+            return None
+        return transport.getc(size)
+
+    def sender_pollc(self, size, row):
+        """
+        作为 YMODEM 的 pollc 回调：非阻塞读取第 row 行已到达的数据，没有则立即返回 None。
+        YMODEM-G 流式发送期间用于检查对端的 CAN。
+        """
+        transport = self.row_transports[row]
+        if transport is None:
+            return None
+        return transport.pollc(size)
 
-        # 串口路径（原有逻辑）
-        return self.ser[0].read(size) or None
+    def sender_readtoken(self, timeout, row):
+        """
+        作为 YMODEM 的 readtoken 回调：最多等待 timeout 秒，读取第 row 行的下一个应答字节，超时返回 None。
+        """
+        transport = self.row_transports[row]
+        if transport is None:
+            return None
+        return transport.read_token(timeout)
 
     def sender_putc(self, data, row):
         """
-        作为 YMODEM 的 putc 回调：发送 bytes 数据。
-        - 若 UDP 已启用：直接 self.udp_sock.send(data)。
-        - 否则：走串口 self.ser[0].write(data)；为避免并发写，使用 send_data_mutex 互斥。
-        本方法不抛异常到外层（发送异常可吞掉或按需记录日志），以免中断传输流程；
+        作为 YMODEM 的 putc 回调：通过第 row 行（0-based）的传输发送 bytes 数据。
+        每行各自独占自己的串口/UDP，因此不再需要全局写锁，各行可同时升级。
         是否中止由上层根据 ACK/NAK 超时等行为自行判断。
         """
-        # ✅ UDP 已连接则走 UDP
-        if self.udp_connected and self.udp_sock:
-            try:
-                self.udp_sock.send(data)
-            except Exception:
-                pass
-            return
+        transport = self.row_transports[row]
+        if transport is not None:
+            transport.putc(data)
 
-        # 串口路径（原有逻辑）
-        send_data_mutex.acquire()
+    def _resolve_row_transport(self, idx):
+        """
+        为第 idx 行（0-based）确定升级使用的传输，并在 self.port_leases 上占用该端口。
+        规则：
+          - 行端口为 "ip:port"：UDP 已连接时在公共 UdpHub 上登记该设备（共用一个 socket），否则新建独立的 UdpTransport。
+          - 行端口为串口名：以该行波特率（留空则取顶部波特率，再留空取 115200）新建独立的 SerialTransport。
+          - 行端口留空：沿用顶部公共连接（UDP 已连接优先，其次是已打开的公共串口）。
+            公共连接只有一个传输对象（一个接收缓冲），同一时刻只借给一行。
+        返回：
+          (transport, owned)：owned=True 表示该传输由本行独占，升级结束后需关闭。
+          公共连接未打开时返回 (None, False)。
+        异常：
+          端口正被其他行使用时抛出 ValueError；打开行内独立串口/UDP 失败时抛出异常，由调用方提示。
+        """
+        widgets = self.rows[idx]
+        owner = f"interface{idx + 1}"
+        port = widgets['port_combobox'].get().strip()
+        if not port:
+            if self.udp_connected and self.udp_transport:
+                key, factory = self.udp_transport.describe(), lambda: self.udp_transport
+            elif self.ser[0].is_open:
+                key, factory = self.ser[0].port, lambda: SerialTransport.from_serial(self.ser[0])
+            else:
+                return None, False
+            transport = self.port_leases.acquire(key, owner, factory, shared=True)
+            self.row_port_keys[idx] = key
+            return transport, False
+
+        baud_str = widgets['baudrate_combobox'].get().strip() or \
+            self.serial_rows[0]['baudrate_combobox'].get().strip() or "115200"
         try:
-            self.ser[0].write(data)
-        finally:
-            send_data_mutex.release()
+            key = "udp://%s:%d" % parse_udp_target(port)
+        except ValueError:
+            key = port
+        transport = self.port_leases.acquire(
+            key, owner, lambda: open_port(port, baudrate=int(baud_str), hub=self.udp_hub if self.udp_connected else None))
+        self.row_port_keys[idx] = key
+        return transport, True
+
+    def _release_row_transport(self, idx, owned):
+        """升级线程结束时释放第 idx 行的传输与端口租约；公共连接只归还租约，不关闭。"""
+        transport = self.row_transports[idx]
+        self.row_transports[idx] = None
+        key, self.row_port_keys[idx] = self.row_port_keys[idx], None
+        if key is not None:
+            self.port_leases.release(key, f"interface{idx + 1}")
+        if owned and transport is not None:
+            transport.close()
 
     # 打开串口
     def open_serial(self, idx, port_var):
@@ -808,6 +903,7 @@ class SerialFlasherApp:
         # 打开串口
         try:
             if self.ser[0].is_open:
+                self.port_leases.discard(self.ser[0].port)
                 self.ser[0].close()
             self.ser[0].port = port
             self.ser[0].baudrate = baud
@@ -860,6 +956,7 @@ class SerialFlasherApp:
             self.close_serial_status()  # 串口未连接，则关闭串口按键状态恢复到打开串口前的状态
         else:
             try:
+                self.port_leases.discard(self.ser[0].port)
                 self.ser[0].close()
                 print('baud rate:', self.serial_rows[0]['baudrate_combobox'].get())
                 # 更新串口状态
@@ -896,36 +993,45 @@ class SerialFlasherApp:
         self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.DISABLED)  # 串口关闭成功后，关闭串口按键置灰
         self.ui_call(self.serial_rows[0]['open_button'].configure, state=tk.NORMAL)  # 串口关闭成功后，打开串口按键高亮
 
-    # 每2秒定时检查一次可用串口
-    def update_ports_loop(self):
+    # 串口插拔事件（hotplug 监视线程回调）
+    def _on_ports_changed(self, ports, added, removed):
         """
-        周期性刷新“可用串口”并更新下拉框（非阻塞轮询）。
+        HotplugWatcher 的回调：串口有插拔时才会调用（不再每 2 秒枚举一次）。
+        参数：
+          ports: 当前全部端口 {设备名: 端口信息（vid/pid/serial_number/location/...）}。
+          added/removed: 新增/移除的端口信息列表。
+        在监视线程中执行：下拉框与接口行的更新经 root.after 切回主线程。
+        """
+        self.root.after(0, self._apply_ports_to_combo, sorted(ports))
+        if len(self.port_map):
+            self.root.after(0, self._apply_port_map, added, removed)
 
-        流程：
-          1) 调用 get_available_ports() 获取最新串口列表。
-          2) 调用 _apply_ports_to_combo(...) 写回到 combobox，尽量保留当前选择。
-          3) 使用 self.root.after(interval_ms, self.update_ports_loop) 自我调度，避免线程阻塞 UI。
-
-        约定/细节：
-          - 轮询间隔一般 500ms~2000ms 之间权衡即可（过短浪费、过长更新不及时）。
-          - 若串口已打开，通常只刷新列表但不改变当前选择；当检测到“已选端口消失”时，可提示或仅维持现状，
-            具体由你的业务决定（不要在已连接时偷偷切换端口）。
-          - 注意在窗口关闭/on_close 时停止调度（例如设置一个标志，或在销毁前不再调用 after），
-            以免在销毁的 Tk 上继续调度导致异常。
-
-        异常处理：
-          - get_available_ports() 失败时，保持现有 combobox 不变即可；无需抛出到界面。
+    def _apply_port_map(self, added, removed):
         """
-        # 后台线程：轮询串口；UI 更新丢回主线程执行
-        while True:
-            try:
-                available = self.get_available_ports()
-                ports = sorted(list(available)) if available else []
-                # 关键：把 UI 更新切回主线程，避免跨线程操作 Tk 控件
-                self.root.after(0, self._apply_ports_to_combo, ports)
-            except Exception:
-                logging.exception("ports poll error")
-            time.sleep(2)
+        按端口映射（~/.ymodem_ports.json）把已知适配器填入对应接口行（主线程执行）：
+          - 新插入的适配器匹配到某个接口时，该行端口设为此串口，状态显示“端口就绪”；
+          - 自动填入的串口被拔出时清空该行端口；
+          - 正在升级/接收的行，以及用户手动填写过其它端口的行不受影响。
+        """
+        for info in removed:
+            for idx, device in enumerate(self.auto_ports):
+                if device == info["device"] and self.row_transports[idx] is None:
+                    self.auto_ports[idx] = None
+                    if self.rows[idx]['port_combobox'].get() == device:
+                        self.rows[idx]['port_combobox'].set('')
+                        self.rows[idx]['flash_status_label'].configure(fg='grey', text="端口已拔出")
+        for info in added:
+            iface = self.port_map.iface_for(info)
+            if iface not in self.interface_names:
+                continue
+            idx = self.interface_names.index(iface)
+            combo = self.rows[idx]['port_combobox']
+            if self.row_transports[idx] is not None or combo.get() not in ('', self.auto_ports[idx]):
+                continue
+            combo.set(info["device"])
+            self.auto_ports[idx] = info["device"]
+            self.rows[idx]['flash_status_label'].configure(fg='green', text="端口就绪")
+            logging.info("hotplug: %s -> %s", info["device"], iface)
 
     def _apply_ports_to_combo(self, ports):
         """
@@ -957,6 +1063,11 @@ class SerialFlasherApp:
             combo['values'] = []
             combo.set('')
 
+        # 各接口行的串口下拉只刷新候选项，不改动用户已填写的串口/UDP 地址
+        for r in self.rows:
+            if tuple(r['port_combobox']['values']) != tuple(ports):
+                r['port_combobox']['values'] = ports
+
     def ui_call(self, fn, *args, **kwargs):
         """
         把任意函数投递到 Tk 主线程执行（线程安全的 UI 调度器）。
@@ -995,20 +1106,18 @@ class SerialFlasherApp:
         except Exception:
             pass
 
-        # 通知 YMODEM：进入“取消”状态（我们在 ymodem.py 里会在循环里检测到）
-        if getattr(self, "ymodem_sender", None):
+        # 通知本行的 YMODEM 会话：进入“取消”状态（我们在 ymodem.py 里会在循环里检测到）
+        sender = self.row_senders[i]
+        if sender is not None:
             try:
-                self.ymodem_sender.update_flash_status(2)
+                sender.update_flash_status(2)
             except Exception:
                 pass
 
-        # 主动发出 CAN 序列，帮助对端尽快中止（可选但推荐）
+        # 主动向本行的串口/UDP 发出 CAN 序列，帮助对端尽快中止（可选但推荐）
         try:
             can_seq = b'\x18' * 5  # CAN * 5
-            if self.udp_connected and self.udp_sock:
-                self.udp_sock.send(can_seq)
-            elif self.ser[0].is_open:
-                self.ser[0].write(can_seq)
+            self.sender_putc(can_seq, i)
         except Exception:
             pass
 
@@ -1030,24 +1139,35 @@ class SerialFlasherApp:
 
         return False
 
+    def _row_thread(self, row, owned, upgrade_command, tune=False):
+        """升级线程入口：执行 burn_in_thread，结束后（含异常/取消）释放该行的会话与传输。"""
+        try:
+            self.burn_in_thread(row, upgrade_command, tune=tune)
+        finally:
+            self.row_senders[row] = None
+            self._release_row_transport(row, owned)
+
     # 串口烧录逻辑及其方法
-    def burn_in_thread(self, row, port_var, upgrade_command):
+    def burn_in_thread(self, row, upgrade_command, tune=False):
         """
         单行升级线程主体。
         流程：
-          1) 发送升级指令（如 "$SH,UPGRADE,MAIN"）并等待 2s。
-          2) 进入握手循环，读取设备 ‘C’，期间支持“取消”即时生效并收尾。
-          3) 握手成功后调用 ymodem_send() 发送文件（串口或 UDP）。
+          1) 发送升级指令（如 "$SH,UPGRADE,MAIN"），收到设备 ‘C’ 立即进入传输（设备回 ‘G’ 时自动改用 YMODEM-G 流式发送）；
+             等待时限与指令重发策略见 self.handshake_policy，期间支持“取消”即时生效并收尾。
+          3) 握手成功后调用 ymodem_send() 发送文件（该行的串口或 UDP；行内独立串口先经 linktune 协商波特率）。
           4) 根据返回值更新 UI：成功/失败/取消，复位各控件状态。
         参数：
-          row: 1-based 行号。
-          port_var: 当前选择的串口（或其变量）。
+          row: 0-based 行号；收发经由 self.row_transports[row]。
           upgrade_command: 设备侧进入升级的命令。
+          tune: True 时握手后协商更高的波特率（仅本行独占的串口；公共串口由各行共用，不调速）。
         返回：
           True 表示已成功发起并完成；False/None 由内部逻辑决定（失败或被取消时通常提前 return）。
         """
-        # 在这里重新初始化ymodem_sender
-        self.ymodem_sender = YMODEM(lambda size: self.sender_getc(size, row), lambda data: self.sender_putc(data, row))
+        # 每次升级新建本行的 YMODEM 会话，收发绑定到本行的传输
+        sender = YMODEM(lambda size: self.sender_getc(size, row), lambda data: self.sender_putc(data, row),
+                        mode='auto', pollc=lambda size: self.sender_pollc(size, row),
+                        readtoken=lambda timeout: self.sender_readtoken(timeout, row))
+        self.row_senders[row] = sender
         #   烧录过程中禁用烧录按键,关闭串口按键和选择文件按键,烧录状态显示框显示‘烧录中’
         self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.DISABLED)
         self.ui_call(self.rows[row]['flash_button'].configure, state=tk.DISABLED)
@@ -1057,10 +1177,10 @@ class SerialFlasherApp:
         self.ui_call(self.rows[row]['cancel_flash_button'].configure, state=tk.NORMAL)
 
         self.log.info(f"*** interface{row + 1}The burning thread starts！***")
-        self.ser[0].port = port_var
-        if self.ser[0].is_open:
-            self.log.info(f"<<< 串口已打开！")
-        elif not self.ser[0].is_open:
+        transport = self.row_transports[row]
+        if transport is not None and transport.is_open:
+            self.log.info(f"<<< interface{row + 1} 使用 {transport.describe()}")
+        else:
             self.log.info(f"<<< 串口未打开！")
             self.ui_call(messagebox.showinfo, "提示", "串口未打开！")
             self.ui_call(self.rows[row]['flash_status_label'].configure, fg='grey', text="准备升级")
@@ -1073,22 +1193,26 @@ class SerialFlasherApp:
         file = self.file_path[row].get()
         print("<<< The burning file is:", file)
         print("<<< Open file：", file)
-        retry_count = 0
 
         if len(file) <= 0:
             messagebox.showinfo("提示", "请选择正确的文件！")
             return
         else:
-            self.ser[0].write((upgrade_command + "\r\n").encode('UTF-8'))
-            self.log.info(">>> interface%d send upgrade instruction: '%s'", row + 1, upgrade_command)
-            time.sleep(2)
-            self.log.debug("Waiting for %.1fs after sending upgrade instruction…", 2.0)
-
-            # ✅ 取消检查（发送指令后、进入握手循环前）
-            if (hasattr(self, "ymodem_sender") and getattr(self.ymodem_sender, "_check_cancel", lambda: False)()) \
-                    or (0 <= row < len(self.cancel_events) and self.cancel_events[row].is_set()):
-                # ✅ 日志：握手前检测到取消
-                self.log.info("*** interface%d upgrade canceled (before handshake) ***", row + 1)
+            def cancelled():
+                return sender._check_cancel() \
+                    or (0 <= row < len(self.cancel_events) and self.cancel_events[row].is_set())
+
+            # 发送升级指令并等待 'C'：收到即开始传输，超时/重发策略见 self.handshake_policy
+            handshake = enter_bootloader(lambda size: self.sender_getc(size, row),
+                                         lambda data: self.sender_putc(data, row),
+                                         upgrade_command, self.handshake_policy, cancelled=cancelled,
+                                         label=f"interface{row + 1}",
+                                         read_token=lambda timeout: self.sender_readtoken(timeout, row))
+            self.log.info("*** interface%d handshake %s, resends=%d, timings=%s", row + 1,
+                          handshake["status"], handshake["resends"], handshake["timings"])
+            if handshake["status"] == "cancel":
+                # ✅ 日志：握手期间检测到取消
+                self.log.info("*** interface%d upgrade canceled (during handshake) ***", row + 1)
                 # UI：升级取消
                 self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.NORMAL)
                 self.ui_call(self.rows[row]['flash_button'].configure, state=tk.NORMAL)
@@ -1100,71 +1224,54 @@ class SerialFlasherApp:
                 except Exception:
                     pass
                 return
-
-            retry_count = 0
-            while True:
-                # ✅ 取消检查（握手循环内，每次读之前都能立刻退出）
-                if (hasattr(self, "ymodem_sender") and getattr(self.ymodem_sender, "_check_cancel", lambda: False)()) \
-                        or (0 <= row < len(self.cancel_events) and self.cancel_events[row].is_set()):
-                    # ✅ 日志：握手期间检测到取消
-                    self.log.info("*** interface%d upgrade canceled (during handshake) ***", row + 1)
-
-                    self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.NORMAL)
-                    self.ui_call(self.rows[row]['flash_button'].configure, state=tk.NORMAL)
-                    self.ui_call(self.rows[row]['flash_status_label'].configure, fg='red', text="升级取消！")
-                    self.ui_call(self.rows[row]['select_file_button'].configure, state=tk.NORMAL)
-                    self.ui_call(self.rows[row]['cancel_flash_button'].configure, state=tk.DISABLED)
-                    try:
-                        self.cancel_events[row].clear()
-                    except Exception:
-                        pass
-                    return
-                response = self.ser[0].read(4)
-                self.log.debug("<<< interface%d received: %r", row + 1, response)
-                if b'C' in response:
-                    self.log.info("<<< interface%d  received 'CCCC'！", row + 1)
-                    break
-                else:
-                    self.log.debug("<<< interface%d  received are:%r", row + 1, response)
-                    # self.ser[0].write((upgrade_command + "\r\n").encode('UTF-8'))
-                    # print(">>> interface{} send upgrade instructions :'{}'！".format(row + 1, upgrade_command))
-                    retry_count += 1
-                if retry_count > 10:
-                    self.log.info(f"*** interface{row + 1} flash failed！***")
-                    #   判断烧录是否结束，如果 flash failed，就更新按键状态：打开烧录按键,关闭串口按键和选择文件按键
-                    self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.NORMAL)
-                    self.ui_call(self.rows[row]['flash_button'].configure, state=tk.NORMAL)
-                    self.ui_call(self.rows[row]['flash_status_label'].configure, fg='red', text="升级失败！")
-                    self.ui_call(self.rows[row]['select_file_button'].configure, state=tk.NORMAL)
-                    self.ui_call(self.rows[row]['cancel_flash_button'].configure, state=tk.DISABLED)
-                    return False
-
-            # 在调用 ymodem_send 方法之前，确保 self.progress_bars 列表的长度至少为 row + 1
-            while len(self.progress_bars) < row + 1:
-                progress_bar = ttk.Progressbar(self.root, orient=tk.HORIZONTAL, length=200, mode='determinate')
-                self.progress_bars.append(progress_bar)
-
-            self.root.after(0, self.progress_bars[row].configure, value=0)
-            self.ymodem_send(file, row, lambda percentage: self.progress_bars[row].configure(value=percentage))
+            if handshake["status"] != "ready":
+                self.log.info(f"*** interface{row + 1} flash failed！***")
+                #   判断烧录是否结束，如果 flash failed，就更新按键状态：打开烧录按键,关闭串口按键和选择文件按键
+                self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.NORMAL)
+                self.ui_call(self.rows[row]['flash_button'].configure, state=tk.NORMAL)
+                self.ui_call(self.rows[row]['flash_status_label'].configure, fg='red', text="升级失败！")
+                self.ui_call(self.rows[row]['select_file_button'].configure, state=tk.NORMAL)
+                self.ui_call(self.rows[row]['cancel_flash_button'].configure, state=tk.DISABLED)
+                return False
+            if handshake["ready"] == b'G':
+                # 设备支持 YMODEM-G：自动改用流式发送（逐包不等 ACK）
+                self.log.info("<<< interface%d  received 'G', using ymodem-g", row + 1)
+                sender.mode = 'ymodem-g'
+
+            link = None
+            if tune:
+                link_key = linktune.link_key(transport)
+                link = self.link_tuner.tune(transport, link_key, cancelled=cancelled)
+                if link["baudrate"] != link["base"]:
+                    self.log.info("*** interface%d link tuned to %d baud", row + 1, link["baudrate"])
+
+            self.queue.post(row, 0)
+            res = self.ymodem_send(file, row, ready=handshake["ready"])
+            if res not in (True, "cancel", None) and link is not None and link["baudrate"] != link["base"]:
+                # 在调速后的速率下传输失败：下次从更低的速率开始
+                self.link_tuner.record_failure(link_key, link["baudrate"])
 
     #   通过ymodem协议发送升级文件
-    def ymodem_send(self, file_path, row, progress_callback):
+    def ymodem_send(self, file_path, row, ready=None):
         """
         以 YMODEM 协议发送指定文件（行内调用）。
         行为：
-          - 打开文件，构造 YMODEM 实例并传入 getc/putc 回调、进度回调。
-          - 传输过程中通过 callback/flash_status_callback 更新进度条与状态文案。
+          - 打开文件，使用本行的 YMODEM 会话（self.row_senders[row]）并传入进度回调。
+          - 固件经 framing.default_cache 预组帧，多行/多次升级同一文件时共用帧数据。
+          - 进度投递到进度总线（self.queue），由 _pump_progress 统一刷新；状态文案经 flash_status_callback 更新。
           - 识别 ymodem.send() 的返回值：True=成功, "cancel"=用户取消, ("fail", reason)=失败。
         参数：
           file_path: 待升级的固件文件路径。
-          row: 1-based 行号。
-          callback: 进度回调（百分比/状态）。
+          row: 0-based 行号。
+          ready: 握手时收到的就绪字节（b'C'/b'G'）；提供时直接发送包0，不再等待设备的下一个 'C'。
         返回：
           True / "cancel" / ("fail", reason)
         """
+        sender = self.row_senders[row]
         try:
             file_size = os.path.getsize(file_path)
             file_name = os.path.basename(file_path)
+            image = framing.default_cache.get(file_path, framing.packet_size_for(sender.mode))
         except FileNotFoundError:
             self.log.info("<<< 烧录文件未找到!")
             return
@@ -1172,23 +1279,13 @@ class SerialFlasherApp:
         with open(file_path, 'rb') as file_stream:
             def callback(percentage):
                 """
-                进度回调：更新当前行的进度条与百分比标签。
+                进度回调（在发送线程中执行）：只把本行进度投递到进度总线，不直接调度 Tk。
                 参数：
                   percentage: 0~100 的整数；可根据文件发送字节数计算得到。
-                线程安全：通常从发送线程调用，请配合 ui_call() 切到主线程更新控件。
                 返回：无
                 """
-                if percentage < 100 or percentage == 100:
-                    self.root.after(0, progress_callback, percentage)
-                    self.root.after(0, self.update_percentage_label, row, percentage)
-                    self.root.after(0, self.update_progress_bar_label, row, percentage)
-                    self.log.info(f"<<<sent_percentage: {percentage}")
-                elif percentage > 100:
-                    percentage = 100
-                    self.root.after(0, progress_callback, percentage)
-                    self.root.after(0, self.update_percentage_label, row, percentage)
-                    self.root.after(0, self.update_progress_bar_label, row, percentage)
-                    self.log.info(f"<<<sent_percentage: {percentage}")
+                percentage = min(percentage, 100)
+                self.queue.post(row, percentage, STATE_DONE if percentage == 100 else STATE_SENDING)
 
             #   烧录状态标志位返回及判断
             def flash_status_callback(flash_status):
@@ -1202,7 +1299,7 @@ class SerialFlasherApp:
                 """
                 #   flash_status为1表示烧录成功
                 if flash_status == 1:
-                    self.log.info(f"*** 第{row + 1}行串口烧录完成！")
+                    self.log.info(f"*** 第{row + 1}行串口烧录完成！数据块: {sender.block_counts}")
                     #   判断烧录是否结束，如果烧录完成，就更新按键状态：打开烧录按键,关闭串口按键和选择文件按键
                     self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.NORMAL)
                     self.ui_call(self.rows[row]['flash_button'].configure, state=tk.NORMAL)
@@ -1219,8 +1316,8 @@ class SerialFlasherApp:
                     self.ui_call(self.rows[row]['select_file_button'].configure, state=tk.NORMAL)
                     self.ui_call(self.rows[row]['cancel_flash_button'].configure, state=tk.DISABLED)
 
-            res = self.ymodem_sender.send(file_stream, file_name, file_size, callback=callback,
-                                          flash_status_callback=flash_status_callback)
+            res = sender.send(file_stream, file_name, file_size, callback=callback,
+                              flash_status_callback=flash_status_callback, image=image, ready=ready)
             # ✅ 日志：传输阶段取消
             self.log.info("*** interface%d upgrade canceled (during transfer) ***", row + 1)
 
@@ -1234,6 +1331,20 @@ class SerialFlasherApp:
 
             return res
 
+    def _pump_progress(self):
+        """
+        界面进度泵：每 progress_pump_ms 毫秒在主线程运行一次，取出进度总线中各行的最新进度并刷新控件。
+        一帧内同一行的多次进度只应用最后一次；与上次显示相同的行不重复刷新。
+        """
+        try:
+            for row, (percentage, _state) in self.queue.drain().items():
+                if self.shown_progress[row] != percentage:
+                    self.shown_progress[row] = percentage
+                    self.update_progress_bar_label(row, percentage)
+                    self.update_percentage_label(row, percentage)
+        finally:
+            self.root.after(self.progress_pump_ms, self._pump_progress)
+
     #   更新烧录百分比变化
     def update_percentage_label(self, row, percentage):
         """
@@ -1259,27 +1370,108 @@ class SerialFlasherApp:
         self.rows[row]['progress_bar'].configure(value=percentage)
 
     #   烧录按键
-    def flash(self, row, port_var):
+    def flash(self, row):
         """
         点击“升级”按钮的入口：校验前置条件并启动该行的升级线程。
         流程：
-          1) 校验：串口/UDP 可用、已选择升级文件、端口与波特率合法
-          2) UI 置为忙：禁用“选择文件/升级”按钮，状态改为“升级中…”，‘取消’按钮高亮
-          3) 启动线程：目标 burn_in_thread(row, port, upgrade_command)
+          1) 校验：已选择升级文件、该行未在升级中
+          2) 按行设置确定传输（_resolve_row_transport）：行内独立串口/UDP，或顶部公共连接
+          3) 启动线程：目标 burn_in_thread(row, upgrade_command)，结束后释放该行传输
         参数：
           row: 1-based 行号
-          port: 当前选定串口名（若走 UDP 可忽略此值）
         返回：无（线程内负责后续 UI 收尾）
         """
         # 烧录逻辑
         # 启动一个线程执行烧录
-        file_path = self.file_path[row - 1].get()
-        if file_path and port_var:  # 检查是否已选择文件
-            self.ser[0].port = port_var
-            threading.Thread(target=self.burn_in_thread, args=(row - 1, port_var, self.upgrade_commands[row - 1]),
-                             daemon=True).start()
-        else:
-            messagebox.showinfo("提示", "请先打开串口！")
+        idx = row - 1
+        file_path = self.file_path[idx].get()
+        if not file_path:  # 检查是否已选择文件
+            messagebox.showinfo("提示", "请选择正确的文件！")
+            return
+        if self.row_transports[idx] is not None:
+            messagebox.showinfo("提示", f"接口{row}正在升级中！")
+            return
+
+        try:
+            transport, owned = self._resolve_row_transport(idx)
+        except Exception as e:
+            messagebox.showinfo("提示", f"接口{row}打开串口/UDP 失败：{e}")
+            return
+        if transport is None:
+            messagebox.showinfo("提示", "请先打开串口或为该行选择串口/UDP 地址！")
+            return
+
+        self.row_transports[idx] = transport
+        # 调速只用于本行独占的串口（公共串口由各行共用），且须勾选“调速”
+        tune = owned and self.rows[idx]['tune_var'].get()
+        threading.Thread(target=self._row_thread, args=(idx, owned, self.upgrade_commands[idx], tune),
+                         daemon=True).start()
+
+    #   接收按键
+    def receive(self, row):
+        """
+        点击“接收”按钮的入口：选择保存目录，按行设置确定传输（与升级相同），启动接收线程。
+        接收期间“取消升级”按钮同样可用（取消本行的 YMODEM 会话）。
+        参数：
+          row: 1-based 行号
+        """
+        idx = row - 1
+        if self.row_transports[idx] is not None:
+            messagebox.showinfo("提示", f"接口{row}正在升级/接收中！")
+            return
+        out_dir = filedialog.askdirectory(title="选择接收文件的保存目录",
+                                          initialdir=self.last_open_dirs[idx] or self.last_open_dir or os.getcwd())
+        if not out_dir:
+            return
+        try:
+            transport, owned = self._resolve_row_transport(idx)
+        except Exception as e:
+            messagebox.showinfo("提示", f"接口{row}打开串口/UDP 失败：{e}")
+            return
+        if transport is None:
+            messagebox.showinfo("提示", "请先打开串口或为该行选择串口/UDP 地址！")
+            return
+
+        self.row_transports[idx] = transport
+        threading.Thread(target=self._receive_thread, args=(idx, owned, out_dir), daemon=True).start()
+
+    def _receive_thread(self, row, owned, out_dir):
+        """接收线程：YMODEM.recv 把文件流式写入 out_dir，进度经进度总线显示，结束后恢复本行控件。"""
+        receiver = YMODEM(lambda size: self.sender_getc(size, row), lambda data: self.sender_putc(data, row),
+                          mode='ymodem', pollc=lambda size: self.sender_pollc(size, row),
+                          readtoken=lambda timeout: self.sender_readtoken(timeout, row))
+        self.row_senders[row] = receiver
+        r = self.rows[row]
+        self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.DISABLED)
+        for key in ('flash_button', 'receive_button', 'select_file_button'):
+            self.ui_call(r[key].configure, state=tk.DISABLED)
+        self.ui_call(r['flash_status_label'].configure, fg='blue', text="接收中...")
+        self.ui_call(r['cancel_flash_button'].configure, state=tk.NORMAL)
+        self.queue.post(row, 0)
+        self.log.info("*** interface%d receiving into %s", row + 1, out_dir)
+        result = {"status": "fail", "reason": "error", "files": []}
+        try:
+            result = receiver.recv(out_dir, callback=lambda percentage: self.queue.post(row, percentage))
+        except Exception as e:
+            self.log.error("*** interface%d receive error: %s", row + 1, e)
+        finally:
+            self.row_senders[row] = None
+            self._release_row_transport(row, owned)
+
+        self.log.info("*** interface%d receive %s (%s): %s", row + 1, result["status"], result.get("reason"),
+                      [f["path"] for f in result["files"]])
+        text, color = {"success": ("接收完成！", 'green'), "cancel": ("接收取消！", 'red')}.get(
+            result["status"], ("接收失败！", 'red'))
+        self.ui_call(r['flash_status_label'].configure, fg=color, text=text)
+        self.ui_call(self.serial_rows[0]['close_button'].configure, state=tk.NORMAL)
+        self.ui_call(r['flash_button'].configure, state=tk.NORMAL if self.file_path[row].get() else tk.DISABLED)
+        self.ui_call(r['receive_button'].configure, state=tk.NORMAL)
+        self.ui_call(r['select_file_button'].configure, state=tk.NORMAL)
+        self.ui_call(r['cancel_flash_button'].configure, state=tk.DISABLED)
+        try:
+            self.cancel_events[row].clear()
+        except Exception:
+            pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+组播升级：同一网段上多台相同的设备升级同一个镜像时，数据包只向组播组发送一次，
+各设备按收包位图报告缺失的包，发送端只对缺失的包逐台单播补发。线上流量约为一份镜像，而不是 N 份。
+
+每台设备的控制流程仍走单播（经 transport.UdpHub 共用一个 socket，按来源地址分发应答）：
+
+    1) 升级指令 → 'C'（同普通升级）；
+    2) 包0 负载：name 0x00 size 0x20 "mcast=<组地址>:<端口>:<会话号十六进制>:<包长>"
+       支持组播的 Bootloader 加入该组，回 ACK 'M' 'C'；普通 Bootloader 不回 'M'，
+       发送端随即发 CAN 放弃，结束后对这些设备重新握手并按普通 YMODEM 单播发送；
+    3) 组播数据：每个 datagram 为 "YMD" <会话号 u32> <包序号 u32> <完整 YMODEM 帧>（与 FramedImage 相同）；
+    4) 补发轮：发送端单播 "YMQ" <会话号>，设备回 "YMB" <会话号> <包数 u32> <收包位图>（第 i 位为 1 表示已收到第 i 包），
+       缺失的包以同样的 "YMD" datagram 单播补发，直到全部设备收齐或达到轮数上限；
+    5) 发送端单播 "YME" <会话号>，设备收齐时回 ACK（否则回 NAK，再补发一轮），之后照常 EOT → ACK 'C' → 结束空包。
+
+    hub = UdpHub("", 0)
+    session = MulticastSession(hub, ["192.168.1.201:5000", "192.168.1.202:5000"], "MAIN", "main.bin")
+    result = session.run()
+"""
+
+import concurrent.futures
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from time import monotonic
+
+import framing
+from bootloader import enter_bootloader
+from rxbuffer import ACK, CAN, CRC, G, NAK
+from transport import parse_udp_target
+from upgrade_tool import FlashSession, upgrade_command_for
+
+MULTICAST_MARK = b'M'  # 接收端接受组播时在 ACK 之后、'C' 之前发送
+DEFAULT_GROUP = ("239.255.42.99", 5099)
+DEFAULT_ROUNDS = 8  # 补发轮数上限
+# 组播默认限速（字节/秒）：组播没有逐包 ACK 的节拍，不限速时设备的接收缓冲很快溢出，丢的包都要单播补发
+DEFAULT_RATE = 1024 * 1024
+EOT = b'\x04'
+
+DATA_MAGIC = b'YMD'
+QUERY_MAGIC = b'YMQ'
+BITMAP_MAGIC = b'YMB'
+END_MAGIC = b'YME'
+_DATA = struct.Struct('>3sII')  # magic, 会话号, 包序号
+_CONTROL = struct.Struct('>3sI')  # magic, 会话号
+_BITMAP = struct.Struct('>3sII')  # magic, 会话号, 包数
+
+
+def make_tag(group, session_id, packet_size) -> bytes:
+    return f"mcast={group[0]}:{group[1]}:{session_id:08x}:{packet_size}".encode('ascii')
+
+
+def parse_tag(rest):
+    """
+    从包0 文件名之后的部分（size 0x20 ...）解析组播标记。
+    返回：
+      ((组地址, 端口), 会话号, 包长)；没有标记或格式不符时返回 None。
+    """
+    for field in bytes(rest).split(b'\x00')[0].split(b' ')[1:]:
+        if field.startswith(b'mcast='):
+            try:
+                ip, port, session_id, packet_size = field[len(b'mcast='):].decode('ascii').split(':')
+                packet_size = int(packet_size)
+                if packet_size not in (128, 1024):
+                    return None
+                return (ip, int(port)), int(session_id, 16), packet_size
+            except (ValueError, UnicodeDecodeError):
+                return None
+    return None
+
+
+def make_data(session_id, index, frame) -> bytes:
+    return _DATA.pack(DATA_MAGIC, session_id, index) + bytes(frame)
+
+
+def parse_data(datagram):
+    """
+    解析组播/补发数据 datagram。
+    返回：
+      (会话号, 包序号, 帧 bytes)；不是数据 datagram 时返回 None。
+    """
+    if len(datagram) <= _DATA.size or not datagram.startswith(DATA_MAGIC):
+        return None
+    _, session_id, index = _DATA.unpack_from(datagram)
+    return session_id, index, datagram[_DATA.size:]
+
+
+def make_control(magic, session_id) -> bytes:
+    return _CONTROL.pack(magic, session_id)
+
+
+def make_bitmap(session_id, received) -> bytes:
+    """received: 每包一个元素（真值表示已收到）→ "YMB" 应答。"""
+    bits = bytearray((len(received) + 7) // 8)
+    for index, ok in enumerate(received):
+        if ok:
+            bits[index >> 3] |= 0x80 >> (index & 7)
+    return _BITMAP.pack(BITMAP_MAGIC, session_id, len(received)) + bytes(bits)
+
+
+def missing_packets(bits, count) -> list:
+    """收包位图 → 缺失的包序号列表。"""
+    return [index for index in range(count) if not bits[index >> 3] & (0x80 >> (index & 7))]
+
+
+def open_group_socket(group, interface_ip=""):
+    """
+    设备端：加入组播组的接收 socket（SO_REUSEADDR，同一主机上的多个模拟设备可共用组端口）。
+    interface_ip 为接收组播的本地网卡地址，留空表示由系统选择。
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", group[1]))
+        membership = socket.inet_aton(group[0]) + socket.inet_aton(interface_ip or "0.0.0.0")
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+class _Device(object):
+    """一台参与组播升级的设备（发送端的跟踪状态）。"""
+
+    def __init__(self, target, peer):
+        self.target = target
+        self.peer = peer
+        self.status = "pending"  # pending → joined → done / unicast / fail
+        self.reason = None
+        self.missing = None  # 最近一次位图中缺失的包序号；None 表示还没有收到位图
+        self.repaired = 0
+        self.result = None  # 单播回退时 FlashSession 的结果
+
+
+class MulticastSession(object):
+    """
+    一次组播升级：同一接口、同一镜像、多台网络设备。
+    """
+
+    def __init__(self, hub, targets, iface, file_path, group=DEFAULT_GROUP, interface_ip=None, ttl=1,
+                 rate=DEFAULT_RATE, max_rounds=DEFAULT_ROUNDS, handshake_policy=None, response_timeout=1.0,
+                 progress_callback=None, max_workers=32):
+        """
+        参数：
+          hub: transport.UdpHub；控制应答与补发都经它的 socket 收发，组播数据也从它发出。
+          targets: 设备地址列表（"ip:port"）。
+          iface: 接口名（MAIN/IMU/...）。
+          file_path: 固件文件路径。
+          group: 组播组 (ip, port)。
+          interface_ip: 发送组播的本地网卡地址；None 时使用 hub 绑定的地址（0.0.0.0 则由路由决定）。
+          ttl: 组播 TTL（1 表示不出本网段）。
+          rate: 组播与补发的速率上限（字节/秒），避免设备接收缓冲溢出；None/0 表示不限速。
+          max_rounds: 补发轮数上限。
+          handshake_policy: bootloader.HandshakePolicy。
+          response_timeout: 等待单个控制应答的时限（秒）。
+          progress_callback: 进度回调 callback(percent:int)，按全部设备已确认收到的包计算。
+          max_workers: 握手/收尾阶段并行处理的设备数。
+        """
+        self.log = logging.getLogger('YReporter')
+        if not targets:
+            raise ValueError("at least one multicast target is required")
+        self.hub = hub
+        self.targets = list(targets)
+        self.iface = iface.strip().upper()
+        self.upgrade_command = upgrade_command_for(self.iface)
+        self.file_path = file_path
+        self.group = (group[0], int(group[1]))
+        self.interface_ip = interface_ip
+        self.ttl = ttl
+        self.rate = rate
+        self.max_rounds = max_rounds
+        self.handshake_policy = handshake_policy
+        self.response_timeout = response_timeout
+        self.progress_callback = progress_callback
+        self.max_workers = max_workers
+        self.session_id = int.from_bytes(os.urandom(4), 'big')
+        self.cancel_event = threading.Event()
+        self.devices = []
+        self.image = None
+        self.header_frame = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _setup_group(self):
+        """在 hub 的 socket 上设置组播发送参数。"""
+        sock = self.hub.sock
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        interface_ip = self.interface_ip if self.interface_ip is not None else self.hub.local[0]
+        if interface_ip and interface_ip != "0.0.0.0":
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface_ip))
+
+    def _parallel(self, fn, devices):
+        if not devices:
+            return
+        workers = max(1, min(self.max_workers, len(devices)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fn, devices))
+
+    # ---- 单播控制 ----
+
+    def _wait_token(self, peer, wanted, timeout):
+        """等待 wanted 中的某个应答字节；其它字节记入返回的第二项。超时返回 (None, 其它字节)。"""
+        other = bytearray()
+        deadline = monotonic() + timeout
+        while not self.cancel_event.is_set():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            char = peer.read_token(remaining)
+            if char in wanted:
+                return char, bytes(other)
+            if char and len(other) < 64:
+                other += char
+        return None, bytes(other)
+
+    def _read_exact(self, peer, n, deadline):
+        out = bytearray()
+        while len(out) < n:
+            char = peer.read_token(max(0.0, deadline - monotonic()))
+            if char is None:
+                return None
+            out += char
+        return bytes(out)
+
+    @staticmethod
+    def _drain(peer):
+        """丢弃该设备已到达但未读取的应答（例如上一轮超时后才到的 "YMB"），避免被当作新一轮的位图。"""
+        while peer.pollc(4096):
+            pass
+
+    def _read_bitmap(self, peer, deadline):
+        """
+        从该设备的应答流中找到本会话的 "YMB" 应答。截止时间过后仍会读完已到达的数据。
+        返回：
+          位图 bytes；超时返回 None。
+        """
+        window = b''
+        while True:
+            char = peer.read_token(max(0.0, deadline - monotonic()))
+            if char is None:
+                return None
+            window = (window + char)[-len(BITMAP_MAGIC):]
+            if window != BITMAP_MAGIC:
+                continue
+            rest = self._read_exact(peer, _BITMAP.size - len(BITMAP_MAGIC), deadline)
+            if rest is None:
+                return None
+            _, session_id, count = _BITMAP.unpack(BITMAP_MAGIC + rest)
+            bits = self._read_exact(peer, (count + 7) // 8, deadline)
+            if bits is not None and session_id == self.session_id and count == self.image.count:
+                return bits
+            window = b''
+
+    def _join(self, device):
+        """握手并发送带组播标记的包0；设备回 'M' 即加入，否则发 CAN 放弃（稍后单播回退）。"""
+        peer = device.peer
+        handshake = enter_bootloader(peer.getc, peer.putc, self.upgrade_command, self.handshake_policy,
+                                     cancelled=self.cancel_event.is_set, label=device.target,
+                                     read_token=peer.read_token)
+        if handshake["status"] != "ready":
+            device.status, device.reason = "fail", f"handshake {handshake['status']}"
+            return
+        for _ in range(3):
+            peer.putc(self.header_frame)
+            char, _ = self._wait_token(peer, (ACK, NAK), self.response_timeout)
+            if char == ACK:
+                break
+        else:
+            peer.putc(CAN + CAN)
+            device.status, device.reason = "fail", "no ACK for packet 0"
+            return
+        char, ext = self._wait_token(peer, (CRC, G), self.response_timeout * 3)
+        if char is not None and MULTICAST_MARK in ext:
+            device.status = "joined"
+            return
+        self.log.info("<<< %s did not accept multicast (got %r), will send by unicast", device.target, ext)
+        peer.putc(CAN + CAN)
+        device.status = "unicast"
+
+    def _finish(self, device):
+        """全部包收齐后：YME → ACK，然后 EOT → ACK 'C' → 结束空包 → ACK。"""
+        peer = device.peer
+        steps = ((make_control(END_MAGIC, self.session_id), (ACK, NAK), "end of multicast"),
+                 (EOT, (ACK, NAK), "EOT"))
+        for payload, wanted, label in steps:
+            for _ in range(5):
+                peer.putc(payload)
+                char, _ = self._wait_token(peer, wanted, self.response_timeout)
+                if char == ACK:
+                    break
+                if char == NAK and label == "end of multicast":
+                    device.status, device.missing = "joined", None  # 设备认为还缺包，回到补发轮
+                    return
+            else:
+                device.status, device.reason = "fail", f"no ACK for {label}"
+                return
+        char, _ = self._wait_token(peer, (CRC, G), self.response_timeout * 3)
+        for _ in range(5):
+            peer.putc(self.image.end_packet)
+            char, _ = self._wait_token(peer, (ACK,), self.response_timeout)
+            if char == ACK:
+                device.status = "done"
+                return
+        device.status, device.reason = "fail", "no ACK for the end packet"
+
+    def _unicast(self, device):
+        """不支持组播的设备：重新握手后按普通 YMODEM 单播发送。"""
+        session = FlashSession(device.peer, self.iface, self.file_path, mode='ymodem',
+                               handshake_policy=self.handshake_policy)
+        device.result = session.run()
+        device.status = "done" if device.result["status"] == "success" else "fail"
+        device.reason = device.result["reason"]
+
+    # ---- 数据 ----
+
+    def _pace(self, t_start, sent_bytes):
+        if self.rate:
+            delay = t_start + sent_bytes / self.rate - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _multicast_pass(self) -> int:
+        """每个数据包向组播组发送一次，返回发送的字节数。"""
+        sent = 0
+        t_start = monotonic()
+        for index in range(self.image.count):
+            if self.cancel_event.is_set():
+                break
+            datagram = make_data(self.session_id, index, self.image.packet(index))
+            try:
+                self.hub.sendto(datagram, self.group)
+            except OSError as e:
+                self.log.warning(">>> multicast packet %d: %s", index, e)
+            sent += len(datagram)
+            self._pace(t_start, sent)
+        return sent
+
+    def _repair_round(self, devices) -> int:
+        """
+        查询各设备的收包位图并单播补发缺失的包，返回补发的字节数。
+        先收齐全部设备的位图再补发：按速率限速的补发可能远长于 response_timeout，
+        边读边补会让后面设备的位图过期、留在缓冲里被下一轮误读。
+        """
+        query = make_control(QUERY_MAGIC, self.session_id)
+        for device in devices:
+            self._drain(device.peer)
+            device.peer.putc(query)
+        deadline = monotonic() + self.response_timeout
+        for device in devices:
+            bits = self._read_bitmap(device.peer, deadline)
+            device.missing = None if bits is None else missing_packets(bits, self.image.count)
+        sent = 0
+        t_start = monotonic()
+        for device in devices:
+            for index in device.missing or ():
+                datagram = make_data(self.session_id, index, self.image.packet(index))
+                device.peer.putc(datagram)
+                device.repaired += 1
+                sent += len(datagram)
+                self._pace(t_start, sent)
+        return sent
+
+    def _report_progress(self, devices):
+        if not self.progress_callback or not devices:
+            return
+        total = self.image.count * len(devices)
+        missing = sum(self.image.count if d.missing is None else len(d.missing) for d in devices)
+        self.progress_callback(int((total - missing) * 100 / total) if total else 100)
+
+    def run(self) -> dict:
+        """
+        执行组播升级。
+        返回：
+          dict，字段：
+            iface / file / size / group
+            status: "success"（全部设备成功）| "partial" | "fail" | "cancel"
+            devices: [{"target", "status"（"success" | "fail"）, "mode"（"multicast" | "unicast"）,
+                       "reason", "repaired"（单播补发的包数）}]
+            multicast_bytes / repair_bytes: 组播发送与单播补发的字节数
+            rounds: 补发轮数
+            timings: {"join", "multicast", "repair", "finish", "unicast", "total"}（秒）
+        """
+        result = {"iface": self.iface, "file": self.file_path, "size": 0, "group": f"{self.group[0]}:{self.group[1]}",
+                  "status": "fail", "devices": [], "multicast_bytes": 0, "repair_bytes": 0, "rounds": 0,
+                  "timings": {}}
+        t_start = monotonic()
+        try:
+            self.image = framing.default_cache.get(self.file_path, 1024)
+            tag = make_tag(self.group, self.session_id, self.image.packet_size)
+            self.header_frame = framing.make_frame(
+                framing.make_header_payload(self.image.file_name, self.image.file_size, tag), 0, 128, b'\x00')
+            result["size"] = self.image.file_size
+            self._setup_group()
+            for target in self.targets:
+                self.devices.append(_Device(target, self.hub.open(*parse_udp_target(target))))
+        except (OSError, ValueError) as e:
+            result["reason"] = str(e)
+            self._close()
+            return result
+
+        timings = result["timings"]
+        try:
+            t_phase = monotonic()
+            self._parallel(self._join, self.devices)
+            joined = [d for d in self.devices if d.status == "joined"]
+            timings["join"] = monotonic() - t_phase
+
+            if joined:
+                t_phase = monotonic()
+                result["multicast_bytes"] = self._multicast_pass()
+                timings["multicast"] = monotonic() - t_phase
+
+                t_phase = monotonic()
+                repair = 0.0
+                finish = 0.0
+                while joined and result["rounds"] < self.max_rounds and not self.cancel_event.is_set():
+                    result["rounds"] += 1
+                    t_round = monotonic()
+                    result["repair_bytes"] += self._repair_round(joined)
+                    repair += monotonic() - t_round
+                    self._report_progress(joined)
+                    complete = [d for d in joined if d.missing == []]
+                    t_round = monotonic()
+                    self._parallel(self._finish, complete)
+                    finish += monotonic() - t_round
+                    joined = [d for d in joined if d.status == "joined"]
+                for device in joined:
+                    device.status = "fail"
+                    device.reason = "cancelled" if self.cancel_event.is_set() else \
+                        f"{'unknown' if device.missing is None else len(device.missing)} packets still missing"
+                timings["repair"] = repair
+                timings["finish"] = finish
+
+            fallback = [d for d in self.devices if d.status == "unicast"]
+            if fallback and not self.cancel_event.is_set():
+                t_phase = monotonic()
+                self._parallel(self._unicast, fallback)
+                timings["unicast"] = monotonic() - t_phase
+        finally:
+            self._close()
+
+        for device in self.devices:
+            result["devices"].append({
+                "target": device.target,
+                "status": "success" if device.status == "done" else "fail",
+                "mode": "unicast" if device.result is not None else "multicast",
+                "reason": device.reason,
+                "repaired": device.repaired,
+            })
+        ok = sum(1 for d in result["devices"] if d["status"] == "success")
+        if self.cancel_event.is_set():
+            result["status"] = "cancel"
+        elif ok == len(self.devices):
+            result["status"] = "success"
+        elif ok:
+            result["status"] = "partial"
+        timings["total"] = monotonic() - t_start
+        if self.progress_callback and result["status"] == "success":
+            self.progress_callback(100)
+        self.log.info("*** multicast %s: %d/%d devices, %d bytes multicast, %d bytes repaired, %d rounds",
+                      self.iface, ok, len(self.devices), result["multicast_bytes"], result["repair_bytes"],
+                      result["rounds"])
+        return result
+
+    def _close(self):
+        for device in self.devices:
+            device.peer.close()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+进度总线：发送线程只把 (row, value, state) 投递进队列，不直接调度 Tk；
+界面线程按固定帧率调用 drain()，每行只取最新的一条再更新控件。
+这样无论链路多快、同时升级多少行，界面每帧的开销只与行数有关。
+
+    bus = ProgressBus()
+    bus.post(0, 37)                        # 发送线程
+    for row, (value, state) in bus.drain().items():   # 界面线程（root.after 周期调用）
+        ...
+"""
+
+import queue
+
+STATE_SENDING = "sending"
+STATE_DONE = "done"
+
+# 界面刷新周期（毫秒），约 20 帧/秒
+DEFAULT_PUMP_INTERVAL_MS = 50
+
+
+class ProgressBus(object):
+    """
+    多生产者、单消费者的进度队列。
+    post() 为 queue.SimpleQueue.put（C 实现，不阻塞、不经过 Tk），可在任意线程调用；
+    drain() 只应在界面线程调用。
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self.applied = 0  # 累计交给界面的条数（统计用）
+
+    def post(self, row, value, state=STATE_SENDING):
+        """投递一行的进度：value 为百分比（0~100），state 为 STATE_*。"""
+        self._queue.put((row, value, state))
+
+    def drain(self) -> dict:
+        """
+        取出队列中已有的全部条目，每行只保留最新的一条。
+        返回：
+          {row: (value, state)}；没有新进度时为空字典。
+        """
+        latest = {}
+        get = self._queue.get_nowait
+        while True:
+            try:
+                row, value, state = get()
+            except queue.Empty:
+                break
+            latest[row] = (value, state)
+        self.applied += len(latest)
+        return latest
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+断点续传扩展：发送失败/取消后，记录每个设备、每个镜像（按内容摘要区分）最后被 ACK 的文件偏移；
+下次升级时在包0 的大小字段之后附加续传提议（借鉴 ZMODEM 的 ZRPOS）：
+
+    包0 负载：name 0x00 size 0x20 "resume=<offset>:<digest>"
+
+首次升级（没有记录）也携带 "resume=0:<digest>"，让设备把本次写入的数据与镜像摘要关联起来。
+
+- 支持续传的 Bootloader 校验摘要与本地已写入的数据后，以 ACK '@' <十进制偏移> 'C' 应答，
+  发送端从该偏移继续发送（数据包块序号仍从 1 开始，偏移须为 128 的整数倍且不大于提议值）；
+- 普通 Bootloader 只按空格截取大小，忽略附加字段，照常回 ACK 'C'，发送端即从头完整发送。
+
+    store = ResumeStore()
+    key = device_key(transport.describe(), "MAIN")
+    digest = file_digest("main.bin")
+    offer = store.offer(key, digest, file_size)          # (offset, digest)，没有记录时 offset 为 0
+    sender.send(..., resume=offer)
+    store.record(key, digest, file_size, sender.acked_offset, ok=res is True)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+RESUME_MARK = b'@'  # 接收端接受续传时在 ACK 之后、'C' 之前发送：'@' + 十进制偏移
+RESUME_ALIGN = 128  # 续传偏移的对齐粒度（最小数据块长度）
+DIGEST_LEN = 16  # 包0 中携带的摘要长度（sha256 十六进制前 16 位）
+MAX_ENTRIES = 256  # 记录条数上限，超过时淘汰最早的记录
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".ymodem_resume.json")
+
+_digests = {}  # (绝对路径, mtime_ns, 大小) -> 摘要
+_stores = {}  # 文件路径 -> ResumeStore（同一进程内的各会话共用一个实例与锁）
+_lock = threading.Lock()
+
+
+def file_digest(path) -> str:
+    """
+    固件内容摘要（sha256 十六进制的前 DIGEST_LEN 位），与文件名无关；
+    按 (路径, mtime, 大小) 缓存，同一文件反复升级时不重复计算。
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = _digests[key] = h.hexdigest()[:DIGEST_LEN]
+    return digest
+
+
+def device_key(port, iface) -> str:
+    """设备标识：端口描述 + 接口名，例如 "/dev/ttyUSB0/MAIN"、"udp://192.168.1.200:5000/IMU"。"""
+    return f"{port}/{iface.strip().upper()}"
+
+
+def make_offer(offset, digest) -> bytes:
+    """包0 中大小字段之后附加的续传提议。"""
+    return f"resume={offset}:{digest}".encode('ascii')
+
+
+def parse_offer(rest):
+    """
+    从包0 文件名之后的部分（size 0x20 ...）解析续传提议。
+    返回：
+      (offset, digest)；没有提议或格式不符时返回 None。
+    """
+    for field in bytes(rest).split(b'\x00')[0].split(b' ')[1:]:
+        if field.startswith(b'resume='):
+            offset, _, digest = field[len(b'resume='):].partition(b':')
+            try:
+                return int(offset), digest.decode('ascii')
+            except (ValueError, UnicodeDecodeError):
+                return None
+    return None
+
+
+def parse_accept(reply):
+    """
+    从包0 的 ACK 与就绪字节之间收到的字节中解析接收端接受的续传偏移。
+    返回：
+      偏移（int）；接收端未接受续传时返回 None。
+    """
+    match = re.search(re.escape(RESUME_MARK) + rb'(\d+)', bytes(reply))
+    return int(match.group(1)) if match else None
+
+
+def open_store(resume):
+    """
+    FlashSession 的 resume 参数 → ResumeStore：
+      ResumeStore 实例原样返回；True 使用 DEFAULT_PATH；字符串为 JSON 文件路径；None/False 返回 None（不续传）。
+    同一路径在进程内只打开一次。
+    """
+    if not resume:
+        return None
+    if isinstance(resume, ResumeStore):
+        return resume
+    path = os.path.abspath(DEFAULT_PATH if resume is True else resume)
+    with _lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ResumeStore(path)
+        return store
+
+
+class ResumeStore(object):
+    """
+    续传记录（线程安全，持久化为 JSON 文件）。
+    键：device_key|digest；值：{"offset", "size", "time"}。
+    偏移大于 0 且小于文件大小的记录才会作为续传起点；升级成功后记录即被删除。
+    写入前先重新读取文件，多个工作进程共用同一文件时只会互相覆盖同一条记录。
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        参数：
+          path: JSON 文件路径；None 表示只保存在内存中。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = dict(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            self.log.warning("*** ignoring unreadable resume store %s: %s", self.path, e)
+
+    @staticmethod
+    def _key(device, digest) -> str:
+        return f"{device}|{digest}"
+
+    def get(self, device, digest):
+        """返回记录 dict 的副本；没有记录返回 None。"""
+        with self._lock:
+            entry = self._entries.get(self._key(device, digest))
+            return dict(entry) if entry else None
+
+    def offer(self, device, digest, file_size):
+        """
+        本次升级的续传提议。
+        返回：
+          (offset, digest)；没有可用记录时 offset 为 0（完整发送，但让设备记下摘要）。
+        """
+        entry = self.get(device, digest)
+        if not entry or entry.get("size") != file_size:
+            return 0, digest
+        offset = entry["offset"] // RESUME_ALIGN * RESUME_ALIGN
+        return (offset if 0 < offset < file_size else 0), digest
+
+    def record(self, device, digest, file_size, acked_offset, ok=False):
+        """
+        记录一次升级的结果：成功时删除记录；否则保存最后被 ACK 的偏移（不大于 0 时不保存）。
+        """
+        key = self._key(device, digest)
+        with self._lock:
+            self._load()
+            if ok or acked_offset <= 0:
+                if self._entries.pop(key, None) is None:
+                    return
+            else:
+                self._entries.pop(key, None)
+                self._entries[key] = {"offset": int(acked_offset), "size": int(file_size),
+                                      "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                while len(self._entries) > MAX_ENTRIES:
+                    self._entries.pop(next(iter(self._entries)))
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def _save(self):
+        """在锁内调用：写临时文件后替换，避免并发升级或中途退出留下残缺的 JSON。"""
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.log.warning("*** cannot write resume store %s: %s", self.path, e)
+
+    def __len__(self):
+        return len(self._entries)
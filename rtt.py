@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+应答超时估计：按 RFC 6298（Jacobson/Karels）维护平滑往返时间 SRTT 与其平均偏差 RTTVAR，
+重发超时 RTO = SRTT + 4·RTTVAR（限制在 [min_rto, max_rto]）。
+- 只用未重发过的包的 ACK 采样（Karn 算法：重发后的 ACK 无法确定对应哪一次发送）；
+- 超时重发时 RTO 加倍（退避），收到下一个有效采样后按估计值恢复；
+- 不同长度的帧（128/1024 数据包、EOT）往返时间差别很大，发送端按帧长各用一个估计器（RttTable）。
+
+    table = RttTable(initial=1.0)
+    est = table.get(len(frame))
+    ... 发出 frame，est.rto 秒内没有应答则重发并 est.backoff() ...
+    est.sample(acked_at - sent_at)   # 仅限未重发的包
+"""
+
+ALPHA = 1.0 / 8
+BETA = 1.0 / 4
+K = 4
+MIN_RTO = 0.1  # 秒：低于串口适配器的缓冲/调度抖动会引起无谓的重发
+MAX_RTO = 4.0  # 秒：退避上限（放弃由调用方按总时限决定）
+
+
+class RttEstimator(object):
+    """
+    单一帧长的往返时间估计。
+    参数：
+      initial: 还没有采样时的 RTO（秒）。
+      min_rto / max_rto: RTO 的下限与上限（秒）。
+    """
+
+    def __init__(self, initial=1.0, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = min(max(initial, min_rto), max_rto)
+        self.samples = 0
+        self.backoffs = 0
+
+    def sample(self, rtt):
+        """记录一次往返时间（秒）并更新 RTO。"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.samples += 1
+        self.rto = min(max(self.srtt + K * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self):
+        """超时重发：RTO 加倍（不超过 max_rto）。"""
+        self.backoffs += 1
+        self.rto = min(self.rto * 2, self.max_rto)
+
+    def snapshot(self) -> dict:
+        return {"srtt": self.srtt, "rttvar": self.rttvar, "rto": self.rto, "samples": self.samples,
+                "backoffs": self.backoffs}
+
+
+class RttTable(object):
+    """按帧长分组的 RttEstimator（一次发送会话一个）。"""
+
+    def __init__(self, initial=1.0, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.initial = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.estimators = {}
+
+    def get(self, frame_size) -> RttEstimator:
+        estimator = self.estimators.get(frame_size)
+        if estimator is None:
+            estimator = self.estimators[frame_size] = RttEstimator(self.initial, self.min_rto, self.max_rto)
+        return estimator
+
+    def snapshot(self) -> dict:
+        """{帧长: {"srtt", "rttvar", "rto", "samples", "backoffs"}}"""
+        return {size: estimator.snapshot() for size, estimator in sorted(self.estimators.items())}
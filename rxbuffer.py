@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+接收缓冲：把串口/UDP 收到的数据整块放入环形缓冲区，协议层再按字节（应答符号）取用。
+- RingBuffer：定长环形缓冲区，写入/读取只做切片拷贝，不再 del buf[:n] 整体搬移。
+- ResponseReader：一次读取端口中已到达的全部数据（串口 in_waiting / 整个 datagram），
+  对上提供 getc/pollc 以及按截止时间等待的 read_token(timeout)。
+  read_token 的等待时间只由调用方的 timeout 决定，与端口自身的读超时无关。
+"""
+
+import logging
+from time import monotonic
+
+ACK = b'\x06'
+NAK = b'\x15'
+CAN = b'\x18'
+CRC = b'C'
+G = b'G'
+
+TOKEN_NAMES = {ACK: 'ACK', NAK: 'NAK', CAN: 'CAN', CRC: 'C', G: 'G'}
+
+# 默认缓冲容量：远大于 YMODEM 发送端会收到的应答量
+DEFAULT_CAPACITY = 4096
+
+
+def token_name(char) -> str:
+    """应答字节 → 符号名（ACK/NAK/CAN/C/G），其它字节为 "noise"。"""
+    return TOKEN_NAMES.get(char, 'noise')
+
+
+class RingBuffer(object):
+    """
+    定长字节环形缓冲区（非线程安全，由所属的 ResponseReader 在单个发送线程中使用）。
+    写满时丢弃最旧的数据并累计 dropped。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._buf = bytearray(capacity)
+        self.capacity = capacity
+        self._head = 0  # 下一个读取位置
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        n = len(data)
+        if n >= self.capacity:
+            self.dropped += self._size + n - self.capacity
+            data = data[n - self.capacity:]
+            self._head, self._size = 0, 0
+            n = self.capacity
+        overflow = self._size + n - self.capacity
+        if overflow > 0:
+            self.dropped += overflow
+            self._head = (self._head + overflow) % self.capacity
+            self._size -= overflow
+        tail = (self._head + self._size) % self.capacity
+        first = min(n, self.capacity - tail)
+        self._buf[tail:tail + first] = data[:first]
+        if first < n:
+            self._buf[0:n - first] = data[first:]
+        self._size += n
+
+    def read(self, size) -> bytes:
+        """取出最多 size 字节（缓冲为空返回 b''）。"""
+        n = min(size, self._size)
+        if n <= 0:
+            return b''
+        head = self._head
+        end = head + n
+        if end <= self.capacity:
+            out = bytes(self._buf[head:end])
+        else:
+            out = bytes(self._buf[head:]) + bytes(self._buf[:end - self.capacity])
+        self._head = end % self.capacity
+        self._size -= n
+        return out
+
+    def clear(self):
+        self._head, self._size = 0, 0
+
+
+class ResponseReader(object):
+    """
+    带环形缓冲的接收端。
+    参数：
+      fill: 读取函数 fill(timeout)：最多等待 timeout 秒，返回端口中已到达的全部数据（没有则返回 b''/None）；
+            timeout 为 0 表示不等待，为 None 表示使用端口自身的读超时。
+      capacity: 缓冲容量。
+    """
+
+    def __init__(self, fill, capacity=DEFAULT_CAPACITY):
+        self.log = logging.getLogger('YReporter')
+        self._fill = fill
+        self.ring = RingBuffer(capacity)
+        self.fills = 0  # 实际发生的端口读取次数（统计用）
+
+    def _pull(self, timeout):
+        data = self._fill(timeout)
+        if data:
+            self.fills += 1
+            self.ring.write(data)
+        return len(self.ring)
+
+    def getc(self, size, timeout=None):
+        """读取最多 size 字节；缓冲为空时等待一次端口读取（默认使用端口的读超时），仍无数据返回 None。"""
+        if not self.ring:
+            self._pull(timeout)
+        return self.ring.read(size) or None
+
+    def pollc(self, size):
+        """非阻塞读取：只取已到达的数据，没有则立即返回 None。"""
+        if not self.ring:
+            self._pull(0)
+        return self.ring.read(size) or None
+
+    def read_token(self, timeout):
+        """
+        等待下一个应答字节，最长 timeout 秒（按截止时间计算，多次端口读取共享同一截止时间）。
+        返回：
+          长度为 1 的 bytes（ACK/NAK/CAN/C/G 或其它噪声字节）；超时返回 None。
+        """
+        if not self.ring:
+            deadline = monotonic() + timeout
+            while not self._pull(max(0.0, deadline - monotonic())):
+                if monotonic() >= deadline:
+                    return None
+        return self.ring.read(1)
+
+    def clear(self):
+        self.ring.clear()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+升级任务调度器：把 N 个升级任务分配到 M 个端口上并发执行。
+- 每个任务创建独立的 FlashSession（即独立的 YMODEM 实例），按任务 ID 与端口跟踪，可单独取消。
+- 并发数可配置（不超过端口数）。
+- 调度策略：任务按文件大小排队（最短任务优先），端口按实测吞吐排名匹配任务（PortThroughput.pick）：
+  最慢的端口取最小的任务，越快的端口取越大的任务，大文件落在快端口上，缩短整批任务的完成时间；
+  各端口吞吐相同（例如尚无实测）时即为最短任务优先。
+"""
+
+import itertools
+import logging
+import os
+import threading
+
+from transport import open_port
+from upgrade_tool import FlashSession, upgrade_command_for
+
+# 尚无实测数据时的端口吞吐估计（字节/秒），约等于 115200 波特的串口
+DEFAULT_THROUGHPUT = 11520.0
+
+
+class FlashJob(object):
+    """
+    一个升级任务。
+    参数：
+      iface: 接口名（MAIN/IMU/...）。
+      file_path: 固件文件路径。
+      port: 指定端口（串口名或 "ip:port"）；为 None 时可由任意空闲端口执行。
+      job_id: 任务 ID；为 None 时由调度器分配。
+    """
+
+    def __init__(self, iface, file_path, port=None, job_id=None):
+        upgrade_command_for(iface)
+        self.iface = iface.strip().upper()
+        self.file_path = file_path
+        self.port = port
+        self.job_id = job_id
+        try:
+            self.size = os.path.getsize(file_path)
+        except OSError:
+            self.size = 0
+
+    def __repr__(self):
+        return f"FlashJob({self.job_id!r}, {self.iface}, {self.file_path!r}, port={self.port!r})"
+
+
+class PortThroughput(object):
+    """
+    各端口的实测吞吐（字节/秒，EWMA）与按吞吐的任务匹配。
+    FlashScheduler、AsyncFlashScheduler 与 workers.ProcessFlashPool 共用；本身不加锁，由调用方在各自的锁内使用。
+    """
+
+    def __init__(self, ports):
+        self.ports = list(ports)
+        self.rates = {}  # port -> 实测吞吐
+
+    def get(self, port) -> float:
+        """端口的吞吐估计：有实测用实测，否则取其它端口实测均值，再否则用默认值。"""
+        if port in self.rates:
+            return self.rates[port]
+        if self.rates:
+            return sum(self.rates.values()) / len(self.rates)
+        return DEFAULT_THROUGHPUT
+
+    def record(self, port, result):
+        """记录一次升级结果的吞吐（只统计成功的任务）。"""
+        rate = result.get("throughput") or 0.0
+        if result.get("status") != "success" or rate <= 0:
+            return
+        old = self.rates.get(port)
+        self.rates[port] = rate if old is None else 0.5 * old + 0.5 * rate
+
+    def pick(self, jobs, port):
+        """
+        为空闲端口挑选任务：jobs 为该端口可执行的任务，按大小排序后取与端口吞吐排名对应的位置
+        （比它慢的端口占全部其它端口的比例）。没有任务时返回 None。
+        """
+        if not jobs:
+            return None
+        jobs = sorted(jobs, key=lambda j: j.size)
+        others = [self.get(other) for other in self.ports if other != port]
+        if not others:
+            return jobs[0]
+        rate = self.get(port)
+        rank = sum(1 for other in others if other < rate) / len(others)
+        return jobs[round(rank * (len(jobs) - 1))]
+
+
+class FlashScheduler(object):
+    """
+    在一组端口上执行升级任务队列。
+    用法：
+        sched = FlashScheduler(["/dev/ttyUSB0", "/dev/ttyUSB1"], max_concurrency=2)
+        sched.submit(FlashJob("MAIN", "main.bin"))
+        results = sched.run()
+    """
+
+    def __init__(self, ports, max_concurrency=None, baudrate=115200, session_kwargs=None,
+                 result_callback=None, transport_factory=None, udp_hub=None):
+        """
+        参数：
+          ports: 端口列表（串口名或 "ip:port"）。
+          max_concurrency: 最大并发任务数；None 表示等于端口数。
+          baudrate: 串口波特率。
+          session_kwargs: 透传给 FlashSession 的参数（mode/handshake_policy/...）。
+          result_callback: 每个任务结束时回调 result_callback(result:dict)。
+          transport_factory: 打开端口的函数 factory(port) -> transport；默认使用 transport.open_port。
+          udp_hub: transport.UdpHub；给出时 "ip:port" 端口共用它的 socket（按对端分发），不再各开一个 socket。
+        """
+        if not ports:
+            raise ValueError("at least one port is required")
+        self.log = logging.getLogger('YReporter')
+        self.ports = list(ports)
+        self.max_concurrency = max(1, min(max_concurrency or len(self.ports), len(self.ports)))
+        self.baudrate = baudrate
+        self.session_kwargs = dict(session_kwargs or {})
+        self.result_callback = result_callback
+        self.udp_hub = udp_hub
+        self.transport_factory = transport_factory or self._open_port
+
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._pending = []
+        self._ids = itertools.count(1)
+        self._throughput = PortThroughput(self.ports)
+        self._stopping = False
+        self.sessions = {}  # job_id -> FlashSession（执行中的会话）
+        self.port_jobs = {}  # port -> job_id（各端口当前任务）
+        self.results = []
+
+    def _open_port(self, port):
+        return open_port(port, baudrate=self.baudrate, hub=self.udp_hub)
+
+    def submit(self, job) -> str:
+        """加入一个任务，返回其任务 ID。"""
+        if job.port is not None and job.port not in self.ports:
+            raise ValueError(f"job port {job.port!r} is not managed by this scheduler")
+        with self._cond:
+            if job.job_id is None:
+                job.job_id = f"job{next(self._ids)}"
+            self._pending.append(job)
+            self._cond.notify_all()
+        return job.job_id
+
+    def throughput(self, port) -> float:
+        """端口的吞吐估计（字节/秒），见 PortThroughput.get。"""
+        return self._throughput.get(port)
+
+    def expected_time(self, job, port) -> float:
+        """任务在该端口上的预计传输耗时（秒）。"""
+        return job.size / self.throughput(port)
+
+    def _pick(self, port):
+        """在锁内为端口挑选可执行的任务（按吞吐排名匹配大小，见 PortThroughput.pick）；没有则返回 None。"""
+        job = self._throughput.pick([j for j in self._pending if j.port in (None, port)], port)
+        if job is not None:
+            self._pending.remove(job)
+        return job
+
+    def cancel(self, job_id) -> bool:
+        """取消一个任务：等待中的直接移出队列，执行中的通知其 YMODEM 会话取消。"""
+        with self._cond:
+            for job in self._pending:
+                if job.job_id == job_id:
+                    self._pending.remove(job)
+                    return True
+            session = self.sessions.get(job_id)
+        if session is not None:
+            session.cancel()
+            return True
+        return False
+
+    def cancel_all(self):
+        """清空等待队列并取消所有执行中的会话。"""
+        with self._cond:
+            self._stopping = True
+            self._pending.clear()
+            sessions = list(self.sessions.values())
+            self._cond.notify_all()
+        for session in sessions:
+            session.cancel()
+
+    def _worker(self, port):
+        """端口工作线程：占用一个并发名额后挑选任务执行；队列中没有本端口可做的任务时退出。"""
+        transport = None
+        try:
+            while True:
+                self._slots.acquire()
+                with self._cond:
+                    job = None if self._stopping else self._pick(port)
+                    if job is None:
+                        self._slots.release()
+                        if self._stopping or not self._pending:
+                            return
+                        # 剩余任务都指定了其它端口：等它们被取走后再判断
+                        self._cond.wait()
+                        continue
+                try:
+                    transport, result = self._execute(job, port, transport)
+                finally:
+                    self._slots.release()
+                if self.result_callback:
+                    self.result_callback(result)
+        finally:
+            if transport is not None:
+                transport.close()
+
+    def _execute(self, job, port, transport):
+        """在端口上执行一个任务（必要时先打开端口），返回 (transport, result)。"""
+        try:
+            if transport is None or not transport.is_open:
+                transport = self.transport_factory(port)
+            session = FlashSession(transport, job.iface, job.file_path, **self.session_kwargs)
+        except Exception as e:
+            self.log.error("*** %s on %s could not start: %s", job.job_id, port, e)
+            session = None
+            result = {"iface": job.iface, "file": job.file_path, "size": job.size,
+                      "status": "fail", "reason": f"port error: {e}"}
+
+        if session is not None:
+            with self._cond:
+                self.sessions[job.job_id] = session
+                self.port_jobs[port] = job.job_id
+            try:
+                result = session.run()
+            finally:
+                with self._cond:
+                    self.sessions.pop(job.job_id, None)
+                    self.port_jobs.pop(port, None)
+
+        result["job_id"] = job.job_id
+        result["port"] = port
+        with self._cond:
+            self._throughput.record(port, result)
+            self.results.append(result)
+            self._cond.notify_all()
+        return transport, result
+
+    def run(self) -> list:
+        """
+        执行队列中的全部任务，阻塞直到结束。
+        返回：
+          list[dict] —— 各任务的 FlashSession 结果（附加 job_id/port），按完成顺序排列。
+        """
+        self._stopping = False
+        workers = [threading.Thread(target=self._worker, args=(port,), daemon=True) for port in self.ports]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return list(self.results)
@@ -0,0 +1,846 @@
+# -*- coding: utf-8 -*-
+"""
+设备模拟器：在本机模拟一个带 YMODEM Bootloader 的下位机，无需真实硬件即可驱动 YMODEM.send/FlashSession。
+- 识别 "$SH,UPGRADE,*" / "$JS,UPGRADE,*" 升级指令，进入接收模式后周期发送 'C'（流式设备发 'G'）；
+- 完整的 YMODEM 接收端：包0（文件名/大小）→ 数据包（128/1024）→ EOT → 结束空包，
+  校验块序号与 CRC（YMODEM._verify_recv_checksum），出错回 NAK，重复包只回 ACK；
+- 运行在 Linux pty 对（发送端打开从端 /dev/pts/N）或 UDP 回环上；
+- 可配置的链路损伤：波特率限速、应答延迟、误码、丢字节、写 Flash 延迟；
+- 可选的断点续传扩展（resume.py）：按镜像摘要保留未完成传输已写入的数据，下次以 '@'+偏移 接受续传；
+- 可选的压缩传输扩展（compression.py）：以 'Z' 接受 zlib 压缩流，逐包经 StreamDecoder 解压后“写入 Flash”；
+- 可选的增量升级扩展（delta.py）：基准摘要与当前镜像一致时以 'D' 接受增量流，经 DeltaApplier 得到新镜像；
+- 可选的组播升级扩展（multicast.py，仅 UDP）：以 'M' 接受后加入组播组收包，按位图应答查询并接收单播补发；
+- 可选的链路调速扩展（linktune.py）：等待包0 期间应答 $BAUD/$PING，超过 max_baud 的速率下线路严重误码。
+
+    sim = DeviceSimulator.udp(impairments=Impairments(bit_error_rate=1e-5, ack_latency=0.002))
+    sim.start()
+    flash(udp=sim.endpoint, iface="MAIN", file_path="main.bin")
+    print(sim.sessions[-1])
+
+命令行：
+    python -m simulator udp --bind 127.0.0.1:5000 --baud 115200 --bit-error-rate 1e-6
+    python -m simulator pty --flash-delay 0.01 --out-dir received/
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import select
+import socket
+import sys
+import threading
+import time
+from time import monotonic
+
+import compression
+import delta as delta_ext
+import linktune
+import multicast
+import resume as resume_ext
+from transport import parse_udp_target
+from upgrade_tool import INTERFACE_NAMES, UPGRADE_COMMANDS
+from ymodem import ACK, CAN, CRC, EOT, G, NAK, YMODEM
+
+SOH = b'\x01'
+STX = b'\x02'
+
+
+class Impairments(object):
+    """
+    链路损伤参数（默认全部关闭，即理想链路）。
+    参数：
+      baudrate: 模拟的串口波特率（8N1，每字节 10 bit）；None 表示不限速。
+      ack_latency: 设备每次应答（ACK/NAK/'C'）前的延迟（秒）。
+      bit_error_rate: 发送端 → 设备方向每个比特翻转的概率。
+      drop_rate: 发送端 → 设备方向每个字节丢失的概率。
+      flash_write_delay: 写 Flash 的耗时（秒/KiB），数据包 ACK 前计入。
+      impair_replies: True 时误码与丢字节同样作用于设备 → 发送端的应答。
+      seed: 随机数种子，便于复现同一组误码。
+    """
+
+    def __init__(self, baudrate=None, ack_latency=0.0, bit_error_rate=0.0, drop_rate=0.0,
+                 flash_write_delay=0.0, impair_replies=False, seed=None):
+        if (baudrate is not None and baudrate <= 0) or ack_latency < 0 or flash_write_delay < 0 \
+                or not 0 <= bit_error_rate < 1 or not 0 <= drop_rate < 1:
+            raise ValueError("invalid impairment parameters")
+        self.baudrate = baudrate
+        self.ack_latency = ack_latency
+        self.bit_error_rate = bit_error_rate
+        self.drop_rate = drop_rate
+        self.flash_write_delay = flash_write_delay
+        self.impair_replies = impair_replies
+        self.random = random.Random(seed)
+        self.bit_errors = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        return (f"Impairments(baudrate={self.baudrate}, ack_latency={self.ack_latency}, "
+                f"bit_error_rate={self.bit_error_rate}, drop_rate={self.drop_rate}, "
+                f"flash_write_delay={self.flash_write_delay})")
+
+    def byte_time(self, n) -> float:
+        """n 个字节在线路上的传输时间（秒）。"""
+        return n * 10.0 / self.baudrate if self.baudrate else 0.0
+
+    def _positions(self, n, rate):
+        """按几何分布抽取 [0, n) 中发生事件的位置（rate 很小时比逐个抽样快得多）。"""
+        if rate <= 0 or n <= 0:
+            return
+        log_q = math.log(1.0 - rate)
+        pos = -1
+        while True:
+            pos += int(math.log(1.0 - self.random.random()) / log_q) + 1
+            if pos >= n:
+                return
+            yield pos
+
+    def corrupt(self, data) -> bytes:
+        """对一段数据施加误码与丢字节，返回处理后的数据。"""
+        if not data or (self.bit_error_rate <= 0 and self.drop_rate <= 0):
+            return data
+        buf = bytearray(data)
+        for bit in self._positions(len(buf) * 8, self.bit_error_rate):
+            buf[bit >> 3] ^= 1 << (bit & 7)
+            self.bit_errors += 1
+        drops = list(self._positions(len(buf), self.drop_rate))
+        for pos in reversed(drops):
+            del buf[pos]
+        self.dropped += len(drops)
+        return bytes(buf)
+
+
+class UdpLink(object):
+    """设备侧 UDP 端点：应答发往最近一次收到数据的对端地址。"""
+
+    def __init__(self, bind_ip="127.0.0.1", bind_port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((bind_ip, bind_port))
+        self.peer = None
+
+    @property
+    def endpoint(self) -> str:
+        """发送端使用的地址（ip:port），可直接传给 upgrade_tool 的 --udp/--port。"""
+        ip, port = self.sock.getsockname()
+        return f"{ip}:{port}"
+
+    def recv(self, timeout):
+        if not select.select([self.sock], [], [], max(0.0, timeout))[0]:
+            return b''
+        data, self.peer = self.sock.recvfrom(65536)
+        return data
+
+    def send(self, data):
+        if self.peer is not None:
+            self.sock.sendto(data, self.peer)
+
+    def close(self):
+        self.sock.close()
+
+
+class PtyLink(object):
+    """
+    设备侧 pty：设备读写主端，发送端像打开串口一样打开从端（endpoint，如 /dev/pts/3）。
+    从端文件描述符一直保持打开，发送端关闭/重开串口时主端不会读到 EIO。
+    """
+
+    def __init__(self):
+        import tty
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.endpoint = os.ttyname(self.slave)
+
+    def recv(self, timeout):
+        if not select.select([self.master], [], [], max(0.0, timeout))[0]:
+            return b''
+        try:
+            return os.read(self.master, 4096)
+        except OSError:
+            return b''
+
+    def send(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.master, view):]
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class _Cancelled(Exception):
+    """发送端发来 CAN CAN。"""
+
+
+class DeviceSimulator(object):
+    """
+    模拟设备：空闲时等待升级指令，收到后以 YMODEM 接收端身份完成一次（批量）传输，然后回到空闲。
+    每次传输的结果追加到 sessions（dict，见 _receive）。
+    参数：
+      link: UdpLink/PtyLink（提供 recv(timeout)/send(data)/close()）。
+      impairments: Impairments；None 表示理想链路。
+      interfaces: 设备接受的接口名（如 ["MAIN"]）；None 表示接受全部升级指令。
+      streaming: True 时按 YMODEM-G 接收（就绪字节为 'G'，数据包不逐包 ACK）。
+      boot_delay: 收到升级指令到发出第一个就绪字节的时间（秒）。
+      ready_interval: 等待包0期间重发就绪字节的间隔（秒）。
+      packet_timeout: 等待下一个包的时限（秒），超时回 NAK。
+      char_timeout: 包内字节间的时限（秒），超时视为残包。
+      purge_quiet: 出错后丢弃残包，线路安静这么久（秒）才回 NAK。
+      max_errors: 连续出错次数上限，超过后发 CAN CAN 放弃本次传输。
+      nak_first_eot: True 时按经典 YMODEM 对第一个 EOT 回 NAK。
+      out_dir: 收到的文件写入该目录（None 表示只保存在内存的 session["data"] 中）。
+      resume: True 时支持断点续传扩展：包0 带 "resume=<offset>:<digest>" 时按 (接口, 文件名, 大小, 摘要)
+              保留已收数据，下次提议续传时接受 min(提议偏移, 已收字节)（按 128 对齐）。
+      decompress: True 时支持压缩传输扩展：包0 带 "zlib=..." 时回 'Z'，边收边解压；
+                  files 中的 data 为解压后的固件，wire_size 为线上收到的压缩流长度。
+      delta: True 时支持增量升级扩展：包0 带 "delta=..." 且基准摘要与该接口的当前镜像一致时回 'D'，
+             files 中的 data 为应用增量后的新镜像。
+      images: {接口名: 当前镜像 bytes}，增量升级的基准；每个文件接收成功后更新为新镜像。
+      multicast: True 时（UDP 链路）支持组播升级扩展：包0 带 "mcast=..." 时回 'M' 并加入组播组，
+                 files 中的 multicast 为 {"packets"（组播收到的包数）, "repaired"（单播补发收到的包数）}。
+      baud_switch: True 时支持链路调速扩展（$BAUD/$PING/$BAUD,COMMIT，见 linktune.py）；
+                   切换后 revert_timeout 秒内没有收到 COMMIT 即退回原速率，传输结束后同样退回。
+      max_baud: 线缆能稳定工作的最高速率；高于它时双向数据按 OVERSPEED_BIT_ERROR_RATE 误码。None 表示不限。
+    """
+
+    OVERSPEED_BIT_ERROR_RATE = 2e-3
+
+    def __init__(self, link, impairments=None, interfaces=None, streaming=False, boot_delay=0.0,
+                 ready_interval=1.0, packet_timeout=3.0, char_timeout=1.0, purge_quiet=0.02, max_errors=10,
+                 nak_first_eot=False, out_dir=None, resume=False, decompress=False, delta=False, images=None,
+                 multicast=False, baud_switch=False, max_baud=None, revert_timeout=linktune.REVERT_TIMEOUT):
+        self.log = logging.getLogger('YReporter')
+        self.link = link
+        self.impairments = impairments or Impairments()
+        commands = dict(zip(UPGRADE_COMMANDS, INTERFACE_NAMES))
+        if interfaces is not None:
+            wanted = {name.strip().upper() for name in interfaces}
+            commands = {cmd: name for cmd, name in commands.items() if name in wanted}
+        self.commands = commands
+        self.streaming = streaming
+        self.boot_delay = boot_delay
+        self.ready_interval = ready_interval
+        self.packet_timeout = packet_timeout
+        self.char_timeout = char_timeout
+        self.purge_quiet = purge_quiet
+        self.max_errors = max_errors
+        self.nak_first_eot = nak_first_eot
+        self.out_dir = out_dir
+        self.resume = resume
+        self.decompress = decompress
+        self.delta = delta
+        self.multicast = multicast
+        self.baud_switch = baud_switch
+        self.max_baud = max_baud
+        self.revert_timeout = revert_timeout
+        self.link_rate = None  # 调速后的当前速率；None 表示默认速率
+        self._base_rate = self.impairments.baudrate
+        self._revert_at = None  # 已切换但尚未 COMMIT 时退回的时刻
+        self.images = {name.strip().upper(): bytes(data) for name, data in (images or {}).items()}
+        self._partials = {}  # 续传：(接口, 文件名, 大小, 摘要) -> 未完成文件已收到的数据
+        self.session_callback = None
+        self.sessions = []
+        self._checker = YMODEM(None, None)
+        self._rx = bytearray()
+        self._line_free = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def udp(cls, bind=None, **kwargs):
+        """在指定地址（ip:port）上创建模拟设备；bind 为 None 时绑定回环地址的随机端口。"""
+        ip, port = parse_udp_target(bind) if bind else ("127.0.0.1", 0)
+        return cls(UdpLink(ip, port), **kwargs)
+
+    @classmethod
+    def pty(cls, **kwargs):
+        """在新建的 pty 对上创建模拟设备（仅 POSIX）。"""
+        return cls(PtyLink(), **kwargs)
+
+    @property
+    def endpoint(self) -> str:
+        return self.link.endpoint
+
+    # ---- 线路 ----
+
+    def _pull(self, timeout):
+        """从线路读取一块数据，按波特率延后到达时间并施加损伤后放入接收缓冲。"""
+        data = self.link.recv(timeout)
+        if not data:
+            return False
+        imp = self.impairments
+        if imp.baudrate:
+            now = monotonic()
+            self._line_free = max(now, self._line_free) + imp.byte_time(len(data))
+            time.sleep(self._line_free - now)
+        self._rx.extend(self._overspeed(imp.corrupt(data)))
+        return True
+
+    def _read(self, n, timeout):
+        """读取恰好 n 个字节；timeout 为等待首字节的时限，之后字节间按 char_timeout。不足时返回 None。"""
+        deadline = monotonic() + timeout
+        while len(self._rx) < n:
+            remaining = deadline - monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                return None
+            if self._pull(min(remaining, 0.1)):
+                deadline = monotonic() + self.char_timeout
+        out = bytes(self._rx[:n])
+        del self._rx[:n]
+        return out
+
+    def _purge(self):
+        """丢弃残包：清空缓冲并读掉线路上的后续字节，直到安静 purge_quiet 秒。"""
+        self._rx.clear()
+        while self._pull(self.purge_quiet):
+            self._rx.clear()
+
+    def _reply(self, data):
+        imp = self.impairments
+        if imp.ack_latency:
+            time.sleep(imp.ack_latency)
+        if imp.impair_replies:
+            data = imp.corrupt(data)
+        data = self._overspeed(data)
+        if imp.baudrate:
+            time.sleep(imp.byte_time(len(data)))
+        self.link.send(data)
+
+    def _overspeed(self, data):
+        """当前速率超过 max_baud 时按 OVERSPEED_BIT_ERROR_RATE 翻转比特（线缆跟不上）。"""
+        if not data or self.link_rate is None or self.max_baud is None or self.link_rate <= self.max_baud:
+            return data
+        buf = bytearray(data)
+        for bit in self.impairments._positions(len(buf) * 8, self.OVERSPEED_BIT_ERROR_RATE):
+            buf[bit >> 3] ^= 1 << (bit & 7)
+        return bytes(buf)
+
+    def _set_rate(self, rate):
+        """切换线路速率：rate 为 None 时回到默认速率（Impairments 限速时同时改变每字节耗时）。"""
+        if self.impairments.baudrate:
+            self.impairments.baudrate = rate or self._base_rate
+        self.link_rate = rate
+
+    # ---- 设备行为 ----
+
+    def start(self):
+        """在后台线程中运行设备，直到 stop()。"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.serve_forever, name="device-simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.link.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def serve_forever(self):
+        """空闲：按行解析指令；收到本设备支持的升级指令即进入接收。"""
+        line = bytearray()
+        while not self._stop.is_set():
+            if not self._rx and not self._pull(0.1):
+                continue
+            while self._rx:
+                char = self._rx[0]
+                del self._rx[0]
+                if char != 0x0a:
+                    line.append(char)
+                    continue
+                command = line.decode('utf-8', 'replace').strip()
+                line.clear()
+                iface = self.commands.get(command)
+                if iface is None:
+                    if command:
+                        self.log.debug("sim: ignored %r", command)
+                    continue
+                self.log.info("sim: %s entering bootloader", iface)
+                session = self._receive(iface)
+                self.sessions.append(session)
+                if self.session_callback:
+                    self.session_callback(session)
+                line.clear()
+
+    def _receive(self, iface) -> dict:
+        """
+        执行一次 YMODEM 接收。
+        返回：
+          dict，字段：
+            iface / status（"success" | "fail" | "cancel"）/ reason
+            files: [{"name", "size", "data", "path", "resumed_from", "wire_size"}]（批量传输时有多个）
+            packets / naks / duplicates / eot_naks: 收包统计
+            bit_errors / dropped: 本次传输期间施加的误码比特数与丢弃字节数
+            baudrate: 链路调速后传输使用的速率（未调速为 None）
+            elapsed: 从升级指令到结束空包的时间（秒）
+        """
+        imp = self.impairments
+        bit_errors, dropped = imp.bit_errors, imp.dropped
+        session = {"iface": iface, "status": "fail", "reason": None, "files": [], "packets": 0, "naks": 0,
+                   "duplicates": 0, "eot_naks": 0, "bit_errors": 0, "dropped": 0, "elapsed": 0.0}
+        t_start = monotonic()
+        self._base_rate = imp.baudrate
+        try:
+            self._receive_files(session)
+        except _Cancelled:
+            session["status"] = "cancel"
+            session["reason"] = "sender canceled"
+        finally:
+            session["baudrate"] = self.link_rate
+            self._set_rate(None)  # 重启后以默认速率运行
+            self._revert_at = None
+            session["elapsed"] = monotonic() - t_start
+            session["bit_errors"] = imp.bit_errors - bit_errors
+            session["dropped"] = imp.dropped - dropped
+            self._rx.clear()
+        self.log.info("sim: %s %s %s", iface, session["status"], session["reason"] or "")
+        return session
+
+    def _fail(self, session, reason):
+        self.log.warning("sim: %s aborting: %s", session["iface"], reason)
+        self._reply(CAN + CAN)
+        session["reason"] = reason
+
+    def _receive_files(self, session):
+        ready = G if self.streaming else CRC
+        if self.boot_delay:
+            time.sleep(self.boot_delay)
+        self._rx.clear()
+        stage = "header"  # header: 等待包0；data: 接收数据；end: EOT 之后等待下一个包0/结束空包
+        current = None
+        expected = 1
+        errors = 0
+        eot_naked = False
+        self._reply(ready)
+        while not self._stop.is_set():
+            timeout = self.ready_interval if stage == "header" else self.packet_timeout
+            if self._revert_at is not None:
+                if monotonic() >= self._revert_at:
+                    self.log.info("sim: no baud commit, back to the default rate")
+                    self._set_rate(None)
+                    self._revert_at = None
+                    self._rx.clear()
+                    continue
+                timeout = min(timeout, self._revert_at - monotonic())
+            char = self._read(1, timeout)
+            if char is None:
+                if self._revert_at is not None:
+                    continue
+                errors += 1
+                if errors > self.max_errors:
+                    return self._fail(session, f"timeout in {stage}")
+                self._reply(ready if stage == "header" else NAK)
+                continue
+            if char == CAN:
+                if self._read(1, self.char_timeout) == CAN:
+                    raise _Cancelled()
+                continue
+            if char == EOT:
+                if stage != "data":
+                    self._reply(ACK)
+                    continue
+                if self.nak_first_eot and not eot_naked:
+                    eot_naked = True
+                    session["eot_naks"] += 1
+                    self._reply(NAK)
+                    continue
+                if current["size"] is not None and len(current["data"]) < current["size"]:
+                    return self._fail(session, f"file truncated: received {len(current['data'])} "
+                                               f"of {current['size']} bytes")
+                try:
+                    self._finish_file(current)
+                except compression.DecodeError as e:
+                    return self._fail(session, f"decompression failed: {e}")
+                except delta_ext.DeltaError as e:
+                    return self._fail(session, f"delta failed: {e}")
+                self._partials.pop(current["resume_key"], None)
+                self.images[session["iface"]] = current["data"]
+                session["files"].append(current)
+                current, stage = None, "end"
+                self._reply(ACK + ready)
+                continue
+            if char == b'$' and stage == "header" and self.baud_switch:
+                self._baud_command()
+                continue
+            if char not in (SOH, STX):
+                continue  # 线路杂字节
+
+            size = 128 if char == SOH else 1024
+            body = self._read(size + 4, self.char_timeout)
+            valid = body is not None and body[0] ^ body[1] == 0xff
+            if valid:
+                valid, payload = self._checker._verify_recv_checksum(body[2:])
+            if not valid:
+                errors += 1
+                session["naks"] += 1
+                if errors > self.max_errors:
+                    return self._fail(session, f"too many bad packets in {stage}")
+                if self.streaming and stage == "data":
+                    return self._fail(session, "bad packet in ymodem-g stream")
+                self._purge()
+                self._reply(NAK)
+                continue
+            errors = 0
+            sequence = body[0]
+            session["packets"] += 1
+
+            if stage in ("header", "end"):
+                if sequence != 0:
+                    if stage == "end":
+                        self._reply(ACK)  # 上一个文件最后一个数据包的重发
+                        session["duplicates"] += 1
+                    continue
+                name, _, rest = bytes(payload).partition(b'\x00')
+                if not name:
+                    self._reply(ACK)
+                    session["status"] = "success"
+                    return
+                try:
+                    file_size = int(rest.split(b'\x00')[0].split(b' ')[0])
+                except ValueError:
+                    file_size = None
+                current = {"name": name.decode('utf-8', 'replace'), "size": file_size,
+                           "data": bytearray(), "path": None, "resumed_from": 0, "resume_key": None,
+                           "decoder": None, "applier": None, "image": None, "wire_size": file_size,
+                           "multicast": None}
+                current["ready"] = (self._accept_compression(current, rest) + self._accept_delta(session, current, rest)
+                                    + self._accept_multicast(current, rest)
+                                    + self._accept_resume(session, current, rest) + ready)
+                stage, expected, eot_naked = "data", 1, False
+                self._reply(ACK + current["ready"])
+                if current["multicast"] is not None:
+                    if not self._receive_multicast(session, current):
+                        return
+                    expected = (current["multicast"]["count"] + 1) & 0xff
+                continue
+
+            if sequence == 0 and len(current["data"]) == current["resumed_from"]:
+                session["duplicates"] += 1  # 包0 的重发（ACK 丢失）
+                self._reply(ACK + current["ready"])
+            elif sequence == expected:
+                try:
+                    written = self._store_payload(current, payload)
+                except compression.DecodeError as e:
+                    return self._fail(session, f"decompression failed: {e}")
+                except delta_ext.DeltaError as e:
+                    return self._fail(session, f"delta failed: {e}")
+                if self.impairments.flash_write_delay:
+                    time.sleep(self.impairments.flash_write_delay * written / 1024.0)
+                current["data"].extend(payload)
+                expected = (expected + 1) & 0xff
+                if not self.streaming:
+                    self._reply(ACK)
+            elif sequence == (expected - 1) & 0xff:
+                session["duplicates"] += 1
+                self._reply(ACK)
+            else:
+                return self._fail(session, f"sequence error: got {sequence}, expected {expected}")
+        session["reason"] = "simulator stopped"
+
+    def _baud_command(self):
+        """链路调速扩展：处理等待包0 期间收到的一行 $BAUD/$PING 指令（'$' 已读出）。"""
+        line = bytearray(b'$')
+        while len(line) < 512:
+            timeout = self.char_timeout
+            if self._revert_at is not None:  # 乱码行不能拖过退回时刻
+                timeout = min(timeout, max(0.0, self._revert_at - monotonic()))
+            char = self._read(1, timeout)
+            if char is None:
+                return
+            if char == b'\n':
+                break
+            line += char
+        text = line.decode('ascii', 'replace').strip()
+        if text.startswith("$PING,"):
+            self._reply(f"$PONG,{text[len('$PING,'):]}\r\n".encode('ascii', 'replace'))
+        elif text == "$BAUD,COMMIT":
+            if self.link_rate is not None:  # 重复的 COMMIT（应答丢失）同样确认
+                self._revert_at = None
+                self.log.info("sim: link committed at %d baud", self.link_rate)
+                self._reply(b"$BAUD,COMMIT,OK\r\n")
+        elif text.startswith("$BAUD,"):
+            try:
+                rate = int(text[len("$BAUD,"):])
+            except ValueError:
+                return
+            if rate not in linktune.DEFAULT_RATES:
+                self._reply(f"$BAUD,{rate},NO\r\n".encode('ascii'))
+                return
+            self._reply(f"$BAUD,{rate},OK\r\n".encode('ascii'))
+            time.sleep(linktune.SWITCH_DELAY)
+            self._rx.clear()
+            self._set_rate(rate)
+            self._revert_at = monotonic() + self.revert_timeout
+
+    def _accept_compression(self, current, rest) -> bytes:
+        """
+        压缩扩展：包0 带压缩标记且本设备支持时创建解压器。
+        返回：
+          就绪字节之前的应答（接受时为 'Z'，否则为空；不支持的设备不回 'Z'，发送端会放弃）。
+        """
+        tag = compression.parse_tag(rest) if self.decompress else None
+        if tag is None or current["size"] is None:
+            return b''
+        current["decoder"] = compression.StreamDecoder(*tag)
+        current["image"] = bytearray()
+        self.log.info("sim: %s is compressed (%d -> %d bytes)", current["name"], tag[0], current["size"])
+        return compression.COMPRESS_MARK
+
+    def _accept_delta(self, session, current, rest) -> bytes:
+        """
+        增量扩展：包0 带增量标记、且基准摘要与该接口的当前镜像一致时创建 DeltaApplier。
+        返回：
+          就绪字节之前的应答（接受时为 'D'，否则为空；发送端随后放弃并改为完整发送）。
+        """
+        tag = delta_ext.parse_tag(rest) if self.delta else None
+        if tag is None or current["size"] is None:
+            return b''
+        new_size, block_size, digest = tag
+        base = self.images.get(session["iface"])
+        if base is None or hashlib.sha256(base).hexdigest()[:delta_ext.DIGEST_LEN] != digest:
+            self.log.info("sim: %s delta base %s does not match the current image", session["iface"], digest)
+            return b''
+        current["applier"] = delta_ext.DeltaApplier(base, new_size, block_size)
+        if current["image"] is None:
+            current["image"] = bytearray()
+        self.log.info("sim: %s accepting a delta for %s (%d bytes)", session["iface"], current["name"], new_size)
+        return delta_ext.DELTA_MARK
+
+    def _accept_multicast(self, current, rest) -> bytes:
+        """
+        组播扩展：包0 带组播标记、本设备支持且链路为 UDP 时加入组播组。
+        返回：
+          就绪字节之前的应答（接受时为 'M'，否则为空；发送端随后放弃并改为单播发送）。
+        """
+        tag = multicast.parse_tag(rest) if self.multicast and isinstance(self.link, UdpLink) else None
+        if tag is None or current["size"] is None or current["decoder"] is not None or current["applier"] is not None:
+            return b''
+        group, session_id, packet_size = tag
+        local_ip = self.link.sock.getsockname()[0]
+        try:
+            sock = multicast.open_group_socket(group, "" if local_ip == "0.0.0.0" else local_ip)
+        except OSError as e:
+            self.log.warning("sim: cannot join multicast group %s:%d: %s", group[0], group[1], e)
+            return b''
+        count = (current["size"] + packet_size - 1) // packet_size
+        current["multicast"] = {"sock": sock, "session": session_id, "packet_size": packet_size, "count": count,
+                                "chunks": [None] * count, "packets": 0, "repaired": 0}
+        self.log.info("sim: joined multicast group %s:%d for %s (%d packets)", group[0], group[1], current["name"], count)
+        return multicast.MULTICAST_MARK
+
+    def _store_multicast(self, session, mc, session_id, index, frame, repair):
+        """校验一个组播/补发数据包（完整 YMODEM 帧）并按包序号存放；重复或损坏的包忽略（由位图查询补发）。"""
+        size = mc["packet_size"]
+        if session_id != mc["session"] or not 0 <= index < mc["count"] or mc["chunks"][index] is not None:
+            return
+        if len(frame) != size + 5 or frame[:1] != (SOH if size == 128 else STX) \
+                or frame[1] != (index + 1) & 0xff or frame[1] ^ frame[2] != 0xff:
+            session["naks"] += 1
+            return
+        valid, payload = self._checker._verify_recv_checksum(frame[3:])
+        if not valid:
+            session["naks"] += 1
+            return
+        mc["chunks"][index] = bytes(payload)
+        mc["repaired" if repair else "packets"] += 1
+        session["packets"] += 1
+        if self.impairments.flash_write_delay:
+            time.sleep(self.impairments.flash_write_delay * size / 1024.0)
+
+    def _receive_multicast(self, session, current) -> bool:
+        """
+        组播阶段：同时接收组播数据与单播控制（位图查询、补发、组播结束），直到收到 "YME" 且已收齐。
+        返回：
+          True 表示数据已收齐（current["data"] 已就绪，接着等待 EOT）；False 表示已放弃本次传输。
+        """
+        mc = current["multicast"]
+        sock = mc["sock"]
+        idle = 0
+        self._rx.clear()
+        try:
+            while not self._stop.is_set():
+                ready = select.select([sock, self.link.sock], [], [], self.packet_timeout)[0]
+                if not ready:
+                    idle += 1
+                    if idle > self.max_errors:
+                        self._fail(session, "timeout in multicast")
+                        return False
+                    continue
+                idle = 0
+                for source in ready:
+                    repair = source is not sock
+                    datagram = self.link.recv(0) if repair else sock.recvfrom(65536)[0]
+                    datagram = self.impairments.corrupt(datagram)
+                    data = multicast.parse_data(datagram)
+                    if data is not None:
+                        self._store_multicast(session, mc, *data, repair)
+                        continue
+                    if not repair:
+                        continue
+                    if datagram.startswith(CAN + CAN):
+                        raise _Cancelled()
+                    if datagram[:1] == SOH:
+                        session["duplicates"] += 1  # 包0 的重发（ACK 丢失）
+                        self._reply(ACK + current["ready"])
+                    elif datagram == multicast.make_control(multicast.QUERY_MAGIC, mc["session"]):
+                        self._reply(multicast.make_bitmap(mc["session"], [c is not None for c in mc["chunks"]]))
+                    elif datagram == multicast.make_control(multicast.END_MAGIC, mc["session"]):
+                        if any(chunk is None for chunk in mc["chunks"]):
+                            self._reply(NAK)
+                            continue
+                        current["data"] = bytearray(b''.join(mc["chunks"]))
+                        current["multicast"] = {"packets": mc["packets"], "repaired": mc["repaired"],
+                                                "count": mc["count"]}
+                        self._reply(ACK)
+                        return True
+            session["reason"] = "simulator stopped"
+            return False
+        finally:
+            sock.close()
+
+    def _accept_resume(self, session, current, rest) -> bytes:
+        """
+        续传扩展：包0 带提议时，把已保留的数据接到 current["data"]，并登记本次写入的数据以备下次续传。
+        返回：
+          就绪字节之前的应答（接受续传时为 '@'+偏移，否则为空）。
+        """
+        offer = resume_ext.parse_offer(rest) if self.resume else None
+        if offer is None:
+            return b''
+        offset, digest = offer
+        key = current["resume_key"] = (session["iface"], current["name"], current["size"], digest)
+        partial = self._partials.get(key, b'')
+        accepted = min(offset, len(partial)) // resume_ext.RESUME_ALIGN * resume_ext.RESUME_ALIGN
+        current["data"] = self._partials[key] = bytearray(partial[:accepted])
+        current["resumed_from"] = accepted
+        if not accepted:
+            return b''
+        self.log.info("sim: %s resuming %s at %d", session["iface"], current["name"], accepted)
+        return resume_ext.RESUME_MARK + str(accepted).encode('ascii')
+
+    def _store_payload(self, current, payload) -> int:
+        """
+        处理一个数据包的负载：线上字节 → 解压（压缩流）→ 应用增量（增量流）或写入镜像。
+        返回：
+          本包写入 Flash 的字节数（用于模拟写 Flash 耗时）。
+        """
+        if current["decoder"] is None and current["applier"] is None:
+            return len(payload)
+        # 只把包0 大小以内的字节送入解压器/增量应用，末包填充不属于流
+        remaining = max(0, current["size"] - len(current["data"]))
+        out = bytes(payload[:remaining])
+        if current["decoder"] is not None:
+            out = current["decoder"].feed(out)
+        if current["applier"] is not None:
+            current["applier"].feed(out)
+        else:
+            current["image"].extend(out)
+        return len(out)
+
+    def _finish_file(self, current):
+        """按包0中的大小截掉填充（压缩流则完成解压并校验，增量流则应用并校验），并按需写入 out_dir。"""
+        data = current["data"]
+        if current["size"] is not None:
+            del data[current["size"]:]
+        current["wire_size"] = len(data)
+        if current["decoder"] is not None:
+            out = current["decoder"].finish()
+            if current["applier"] is not None:
+                current["applier"].feed(out)
+            else:
+                current["image"].extend(out)
+            data = current["image"]
+        if current["applier"] is not None:
+            data = current["applier"].finish()
+        current["data"] = bytes(data)
+        if self.out_dir:
+            os.makedirs(self.out_dir, exist_ok=True)
+            current["path"] = os.path.join(self.out_dir, os.path.basename(current["name"]) or "unnamed.bin")
+            with open(current["path"], "wb") as f:
+                f.write(current["data"])
+
+
+def _session_summary(session) -> dict:
+    """去掉文件内容，便于以 JSON 输出。"""
+    summary = dict(session)
+    summary["files"] = [{"name": f["name"], "size": f["size"], "received": len(f["data"]), "path": f["path"],
+                         "resumed_from": f["resumed_from"], "wire_size": f["wire_size"],
+                         "multicast": f["multicast"]} for f in session["files"]]
+    return summary
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="simulator", description="YMODEM bootloader device simulator")
+    parser.add_argument("link", choices=["udp", "pty"], help="udp: loopback socket; pty: pseudo-terminal pair")
+    parser.add_argument("--bind", default="127.0.0.1:5000", help="udp bind address ip:port (default 127.0.0.1:5000)")
+    parser.add_argument("--iface", action="append", help="accept only these interfaces (repeatable)")
+    parser.add_argument("--streaming", action="store_true", help="behave as a YMODEM-G device ('G' instead of 'C')")
+    parser.add_argument("--baud", type=int, default=None, help="pace the link at this baud rate (8N1)")
+    parser.add_argument("--ack-latency", type=float, default=0.0, help="delay before every reply (seconds)")
+    parser.add_argument("--bit-error-rate", type=float, default=0.0, help="bit flip probability, sender -> device")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="byte drop probability, sender -> device")
+    parser.add_argument("--flash-delay", type=float, default=0.0, help="flash write time per KiB (seconds)")
+    parser.add_argument("--impair-replies", action="store_true", help="also corrupt/drop the device's replies")
+    parser.add_argument("--boot-delay", type=float, default=0.0, help="delay before the first 'C' (seconds)")
+    parser.add_argument("--nak-first-eot", action="store_true", help="NAK the first EOT like classic receivers")
+    parser.add_argument("--resume", action="store_true", help="support the resume extension (keep partial images)")
+    parser.add_argument("--decompress", action="store_true", help="support the zlib compressed transfer extension")
+    parser.add_argument("--delta", action="store_true", help="support the block delta upgrade extension")
+    parser.add_argument("--multicast", action="store_true", help="support the multicast upgrade extension (udp)")
+    parser.add_argument("--baud-switch", action="store_true", help="support the link tuning extension ($BAUD)")
+    parser.add_argument("--max-baud", type=int, default=None,
+                        help="fastest rate the simulated cable carries cleanly (with --baud-switch)")
+    parser.add_argument("--current", help="image currently on the device (delta base for every interface)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible errors")
+    parser.add_argument("--out-dir", help="write received files into this directory")
+    parser.add_argument("-v", "--verbose", action="store_true", help="protocol debug logging")
+    return parser
+
+
+def main(argv=None) -> int:
+    """命令行入口：启动模拟设备，打印其端点，每完成一次传输输出一行 JSON；Ctrl+C 退出。"""
+    args = _build_parser().parse_args(argv)
+    logging.getLogger('YReporter').setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    try:
+        impairments = Impairments(args.baud, args.ack_latency, args.bit_error_rate, args.drop_rate,
+                                  args.flash_delay, args.impair_replies, args.seed)
+        kwargs = {"impairments": impairments, "interfaces": args.iface, "streaming": args.streaming,
+                  "boot_delay": args.boot_delay, "nak_first_eot": args.nak_first_eot, "out_dir": args.out_dir,
+                  "resume": args.resume, "decompress": args.decompress, "delta": args.delta,
+                  "multicast": args.multicast, "baud_switch": args.baud_switch, "max_baud": args.max_baud}
+        if args.current:
+            with open(args.current, "rb") as f:
+                current = f.read()
+            kwargs["images"] = {name: current for name in INTERFACE_NAMES}
+        sim = DeviceSimulator.udp(args.bind, **kwargs) if args.link == "udp" else DeviceSimulator.pty(**kwargs)
+    except (OSError, ValueError) as e:
+        print(f"simulator: {e}", file=sys.stderr)
+        return 2
+
+    sim.session_callback = lambda s: print(json.dumps(_session_summary(s), ensure_ascii=False), flush=True)
+    print(f"simulator listening on {sim.endpoint} ({impairments!r})", flush=True)
+    try:
+        sim.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.link.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
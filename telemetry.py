@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+逐包遥测：YMODEM 发送时记录每个数据包的发送时刻、ACK 延迟、重试次数、出错原因与线上字节数。
+数据存放在预分配的 array 列中（写满时按倍数扩容），记录一包只是几次数组赋值，
+不产生日志、不分配对象；传输结束后再生成会话汇总（吞吐、RTT p50/p99、重传率）并导出 JSON/CSV。
+
+    tel = PacketTelemetry()
+    sender = YMODEM(getc, putc, telemetry=tel)
+    sender.send(...)
+    print(tel.summary())
+    tel.to_csv("session.csv")
+"""
+
+import csv
+import json
+import math
+from array import array
+from time import monotonic
+
+# 出错原因（每包取最严重的一种）
+CAUSE_OK = 0
+CAUSE_TIMEOUT = 1  # 等待应答超时
+CAUSE_NOISE = 2  # 收到非 ACK/NAK 的字节
+CAUSE_NAK = 3  # 接收端回 NAK
+CAUSE_NAMES = ("ok", "timeout", "noise", "nak")
+
+FIELDS = ("seq", "send_time", "ack_latency", "retries", "cause", "wire_bytes", "block_size")
+
+DEFAULT_CAPACITY = 4096
+
+
+def _percentile(sorted_values, q):
+    """最近秩百分位（sorted_values 已升序）；空序列返回 None。"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class PacketTelemetry(object):
+    """
+    一次会话（或多次会话，需先 reset()）的逐包记录。
+    列：
+      seq: 块序号（0~255 循环）
+      send_time: 首次发出该包的时刻（相对 begin() 的秒数）
+      ack_latency: 最后一次发出到收到 ACK 的时间（秒）
+      retries: 收到 ACK 之前的 NAK/杂字节/超时次数
+      cause: 出错原因 CAUSE_*（无错为 CAUSE_OK）
+      wire_bytes: 该包累计写出的字节数（含重发）
+      block_size: 数据块长度（128/1024）
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        n = self.capacity
+        self.seq = array('B', bytes(n))
+        self.send_time = array('d', bytes(8 * n))
+        self.ack_latency = array('d', bytes(8 * n))
+        self.retries = array('H', bytes(2 * n))
+        self.cause = array('B', bytes(n))
+        self.wire_bytes = array('I', bytes(4 * n))
+        self.block_size = array('H', bytes(2 * n))
+        self.count = 0
+        self.t0 = monotonic()
+        self.last_ack = 0.0  # 最后一个包收到 ACK 的时刻（相对 begin() 的秒数）
+        self.phases = {}
+
+    def begin(self):
+        """会话开始：清空记录并以当前时刻为时间零点。"""
+        self.reset()
+
+    def _grow(self):
+        for name in ("seq", "send_time", "ack_latency", "retries", "cause", "wire_bytes", "block_size"):
+            column = getattr(self, name)
+            column.extend(array(column.typecode, bytes(column.itemsize * self.capacity)))
+        self.capacity *= 2
+
+    def record(self, seq, sent_at, acked_at, retries, cause, wire_bytes, block_size, last_sent_at=None):
+        """
+        记录一个已被 ACK 的数据包。
+        参数：
+          sent_at: 首次发出时刻（time.monotonic()）；acked_at: 收到 ACK 的时刻。
+          last_sent_at: 最后一次（重）发出的时刻，ACK 延迟从它算起；None 表示没有重发（同 sent_at）。
+          其余见类说明。
+        """
+        i = self.count
+        if i >= self.capacity:
+            self._grow()
+        self.seq[i] = seq & 0xff
+        self.send_time[i] = sent_at - self.t0
+        self.ack_latency[i] = acked_at - (sent_at if last_sent_at is None else last_sent_at)
+        self.retries[i] = min(retries, 0xffff)
+        self.cause[i] = cause
+        self.wire_bytes[i] = wire_bytes
+        self.block_size[i] = block_size
+        self.count = i + 1
+        self.last_ack = acked_at - self.t0
+
+    def finish(self, phases=None):
+        """会话结束：记录各阶段耗时（YMODEM.timings）。"""
+        if phases:
+            self.phases = dict(phases)
+
+    def rows(self):
+        """逐包记录的元组迭代器（字段顺序同 FIELDS，cause 为名称）。"""
+        for i in range(self.count):
+            yield (self.seq[i], round(self.send_time[i], 6), round(self.ack_latency[i], 6), self.retries[i],
+                   CAUSE_NAMES[self.cause[i]], self.wire_bytes[i], self.block_size[i])
+
+    def summary(self) -> dict:
+        """
+        会话汇总：
+          packets / payload_bytes / wire_bytes / duration（首包发出到末包 ACK）/ throughput（有效载荷字节/秒）
+          rtt_p50 / rtt_p99 / rtt_max（ACK 延迟，即最后一次发出到 ACK 的往返时间，秒；不含超时等待与重发）
+          retries（应答出错/超时总次数）/ retransmit_ratio（重发字节占线上字节比例）/ causes（各原因的包数）/ phases
+        """
+        n = self.count
+        latencies = sorted(self.ack_latency[:n])
+        payload = sum(self.block_size[:n])
+        wire = sum(self.wire_bytes[:n])
+        frame_bytes = sum(b + 5 for b in self.block_size[:n])
+        duration = (self.last_ack - self.send_time[0]) if n else 0.0
+        causes = {name: 0 for name in CAUSE_NAMES}
+        for c in self.cause[:n]:
+            causes[CAUSE_NAMES[c]] += 1
+        return {
+            "packets": n,
+            "payload_bytes": payload,
+            "wire_bytes": wire,
+            "duration": duration,
+            "throughput": payload / duration if duration > 0 else 0.0,
+            "rtt_p50": _percentile(latencies, 50),
+            "rtt_p99": _percentile(latencies, 99),
+            "rtt_max": latencies[-1] if latencies else None,
+            "retries": sum(self.retries[:n]),
+            "retransmit_ratio": (wire - frame_bytes) / wire if wire else 0.0,
+            "causes": causes,
+            "phases": dict(self.phases),
+        }
+
+    def to_json(self, path, packets=True):
+        """导出为 JSON：{"summary": {...}, "fields": [...], "packets": [[...], ...]}。"""
+        doc = {"summary": self.summary()}
+        if packets:
+            doc["fields"] = list(FIELDS)
+            doc["packets"] = [list(row) for row in self.rows()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False)
+
+    def to_csv(self, path):
+        """导出逐包记录为 CSV（首行为字段名）。"""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(self.rows())
+
+    def export(self, path):
+        """按扩展名导出：.json 为 JSON，其余为 CSV。"""
+        if str(path).lower().endswith(".json"):
+            self.to_json(path)
+        else:
+            self.to_csv(path)
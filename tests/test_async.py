@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""AsyncFlashSession / AsyncFlashScheduler 对 UDP 回环上的 DeviceSimulator 的端到端升级：比较设备收到的镜像。"""
+
+import asyncio
+import random
+import time
+
+import pytest
+
+from async_ymodem import AsyncFlashScheduler, AsyncFlashSession, AsyncUdpTransport
+from scheduler import FlashJob
+from simulator import DeviceSimulator, Impairments
+from transport import parse_udp_target
+
+
+def make_image(size, seed=1) -> bytes:
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+@pytest.fixture
+def write_image(tmp_path):
+    def write(data, name="main.bin"):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def device():
+    started = []
+
+    def start(**kwargs):
+        kwargs.setdefault("ready_interval", 0.2)
+        sim = DeviceSimulator.udp(**kwargs).start()
+        started.append(sim)
+        return sim
+
+    yield start
+    for sim in started:
+        sim.stop()
+
+
+def sessions(sim, count, timeout=5.0) -> list:
+    """等待设备结束 count 次接收，返回全部记录。"""
+    deadline = time.monotonic() + timeout
+    while len(sim.sessions) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(sim.sessions) >= count, "device did not finish the session"
+    return sim.sessions
+
+
+def received(sim_session) -> bytes:
+    assert sim_session["status"] == "success", sim_session["reason"]
+    return bytes(sim_session["files"][0]["data"])
+
+
+async def flash(sim, file_path, **kwargs) -> dict:
+    transport = await AsyncUdpTransport.open(*parse_udp_target(sim.endpoint))
+    try:
+        return await AsyncFlashSession(transport, "MAIN", file_path, **kwargs).run()
+    finally:
+        transport.close()
+
+
+def test_plain(device, write_image):
+    data = make_image(200000)
+    sim = device()
+    progress = []
+    result = asyncio.run(flash(sim, write_image(data), progress_callback=progress.append))
+    assert result["status"] == "success", result["reason"]
+    assert received(sessions(sim, 1)[-1]) == data
+    assert result["block_counts"] == {1024: 196}
+    assert progress[-1] == 100
+
+
+def test_bit_errors(device, write_image):
+    data = make_image(60000)
+    sim = device(impairments=Impairments(bit_error_rate=2e-5, seed=5))
+    result = asyncio.run(flash(sim, write_image(data)))
+    assert result["status"] == "success", result["reason"]
+    assert received(sessions(sim, 1)[-1]) == data
+    assert sim.sessions[-1]["naks"] > 0
+
+
+def test_ymodem_g(device, write_image):
+    data = make_image(32 * 1024 + 100)
+    sim = device(streaming=True)
+    result = asyncio.run(flash(sim, write_image(data)))
+    assert result["status"] == "success", result["reason"]
+    assert received(sessions(sim, 1)[-1]) == data
+
+
+def test_cancel(device, write_image):
+    data = make_image(300000)
+    sim = device(impairments=Impairments(baudrate=1000000))
+
+    async def run_and_cancel():
+        transport = await AsyncUdpTransport.open(*parse_udp_target(sim.endpoint))
+        session = AsyncFlashSession(transport, "MAIN", write_image(data))
+        task = asyncio.ensure_future(session.run())
+        await asyncio.sleep(0.5)
+        task.cancel()
+        await asyncio.wait({task})
+        transport.close()
+        return session.result
+
+    result = asyncio.run(run_and_cancel())
+    assert result["status"] == "cancel"
+    assert sessions(sim, 1)[-1]["status"] != "success"
+
+
+def test_scheduler(device, write_image):
+    sims = [device(), device()]
+    images = {f"job{i}.bin": make_image(20000 + 5000 * i, seed=i) for i in range(4)}
+    paths = {name: write_image(data, name) for name, data in images.items()}
+    endpoints = [sim.endpoint for sim in sims]
+    sched = AsyncFlashScheduler(endpoints, max_concurrency=2)
+    for name in images:
+        sched.submit(FlashJob("MAIN", paths[name]))
+    results = asyncio.run(sched.run())
+    assert len(results) == 4
+    assert all(r["status"] == "success" for r in results), [r["reason"] for r in results]
+    assert {r["port"] for r in results} <= set(endpoints)
+    counts = {endpoint: sum(1 for r in results if r["port"] == endpoint) for endpoint in endpoints}
+    got = {}
+    for sim, endpoint in zip(sims, endpoints):
+        for sim_session in sessions(sim, counts[endpoint]):
+            got[sim_session["files"][0]["name"]] = received(sim_session)
+    assert got == images
+    assert all(sched.throughput(endpoint) > 0 for endpoint in endpoints if counts[endpoint])
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""握手的就绪字节判定：应用回复/横幅里的 'C'/'G' 不能被当作 bootloader 的就绪字节。"""
+
+import pytest
+
+from bootloader import HandshakePolicy, ReadyDetector, enter_bootloader
+
+
+class ScriptedLine(object):
+    """
+    按脚本回复的假线路：script 为若干“突发”，每次发送升级指令后依次放出；
+    一个突发内的字节连续到达，突发之间线路安静（read_token 超时返回 None）。
+    """
+
+    def __init__(self, *bursts):
+        self.bursts = [bytes(b) for b in bursts]
+        self.pending = bytearray()
+        self.sent = []
+
+    def putc(self, data):
+        self.sent.append(data)
+
+    def read_token(self, timeout):
+        if not self.pending:
+            if not self.bursts:
+                return None
+            burst = self.bursts.pop(0)
+            if not burst:  # 空突发：一段安静
+                return None
+            self.pending.extend(burst)
+        char = bytes(self.pending[:1])
+        del self.pending[:1]
+        return char
+
+    def getc(self, size):
+        return self.read_token(None)
+
+
+def handshake(line, **kwargs):
+    policy = HandshakePolicy(deadline=0.2, resend_interval=0.2, max_resends=0)
+    return enter_bootloader(line.getc, line.putc, "$SH,UPGRADE,MAIN", policy, read_token=line.read_token, **kwargs)
+
+
+def feed(detector, data):
+    for i in range(len(data)):
+        ready = detector.feed(data[i:i + 1])
+        if ready is not None:
+            return ready
+    return None
+
+
+def test_lone_ready_byte_is_confirmed_by_quiet():
+    result = handshake(ScriptedLine(b"C"))
+    assert result["status"] == "ready"
+    assert result["ready"] == b"C"
+
+
+def test_repeated_ready_byte_is_accepted_at_once():
+    line = ScriptedLine(b"CC")
+    assert handshake(line)["ready"] == b"C"
+
+
+@pytest.mark.parametrize("banner", [b"Command OK\r\n", b"Going to boot...\r\n", b"\r\nCRC check passed\r\n",
+                                    b"$SH,UPGRADE,MAIN\r\n", b"Go", b"Cx"])
+def test_banner_is_not_ready(banner):
+    result = handshake(ScriptedLine(banner))
+    assert result["status"] == "timeout"
+    assert result["ready"] is None
+
+
+@pytest.mark.parametrize("banner", [b"Command OK\r\n", b"Going to boot...\r\n", b"\r\nCRC check passed\r\n"])
+def test_ready_byte_after_banner(banner):
+    result = handshake(ScriptedLine(banner, b"", b"C"))
+    assert result["status"] == "ready"
+    assert result["ready"] == b"C"
+
+
+def test_streaming_device_after_banner():
+    # 横幅开头的 'G' 不能把会话切到 ymodem-g，真正的 'G' 才行
+    assert handshake(ScriptedLine(b"Going to boot\r\n", b"G"))["ready"] == b"G"
+    assert handshake(ScriptedLine(b"Going to boot\r\n", b"C"))["ready"] == b"C"
+
+
+def test_detector_rules():
+    assert feed(ReadyDetector(), b"Command") is None
+    assert feed(ReadyDetector(), b"\r\nCC") == b"C"
+    assert feed(ReadyDetector(), b"UPGRADE") is None
+    detector = ReadyDetector()
+    assert feed(detector, b"OK\r\nC") is None
+    assert detector.pending
+    assert detector.quiet() == b"C"
+    detector = ReadyDetector()
+    feed(detector, b"ABC")  # 前一个字节是字母：不是候选
+    assert not detector.pending
+    assert detector.quiet() is None
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""crc16 各后端与 YMODEM.crctable 逐字节参照实现的交叉校验。"""
+
+import random
+
+import pytest
+
+import crc16
+from ymodem import YMODEM
+
+EDGE_CASES = [b"", b"\x00", b"\xff", b"\x01\x02\x03", b"123456789", b"\x00" * 1024, b"\x1a" * 1024,
+              b"\xff" * 129, bytes(range(256)) * 5]
+_rng = random.Random(20240611)
+RANDOM_CASES = [bytes(_rng.getrandbits(8) for _ in range(n)) for n in (1, 2, 3, 127, 128, 129, 1023, 1024, 1025, 4099)]
+
+
+def reference(data, crc=0):
+    """原 YMODEM.calc_crc 的逐字节实现（YMODEM.crctable）。"""
+    table = YMODEM.crctable
+    for char in bytearray(data):
+        crc = ((crc << 8) ^ table[((crc >> 8) ^ char) & 0xff]) & 0xffff
+    return crc
+
+
+@pytest.fixture(params=sorted(crc16.BACKENDS))
+def backend(request):
+    return crc16.BACKENDS[request.param]
+
+
+def test_generated_table_matches_ymodem():
+    assert crc16._T0 == YMODEM.crctable
+
+
+def test_check_value():
+    # CRC-16/XMODEM 的标准校验值
+    for fn in crc16.BACKENDS.values():
+        assert fn(b"123456789") == 0x31c3
+
+
+@pytest.mark.parametrize("data", EDGE_CASES + RANDOM_CASES, ids=lambda d: str(len(d)))
+@pytest.mark.parametrize("init", [0, 0x1234, 0xffff])
+def test_backend_matches_reference(backend, data, init):
+    expected = reference(data, init)
+    assert backend(data, init) == expected
+    assert backend(bytearray(data), init) == expected
+    assert backend(memoryview(data), init) == expected
+
+
+@pytest.mark.parametrize("data", EDGE_CASES + RANDOM_CASES, ids=lambda d: str(len(d)))
+def test_incremental(backend, data):
+    expected = reference(data)
+    for cut in sorted({0, 1, len(data) // 2, len(data)}):
+        assert backend(data[cut:], backend(data[:cut])) == expected
+
+
+@pytest.mark.parametrize("name", sorted(crc16.BACKENDS))
+def test_calc_crc_uses_selected_backend(name):
+    previous = crc16.get_backend()
+    try:
+        crc16.set_backend(name)
+        sender = YMODEM(None, None)
+        for data in RANDOM_CASES:
+            assert sender.calc_crc(data) == reference(data)
+            assert crc16.Crc16(data[:5]).update(data[5:]).value == reference(data)
+    finally:
+        crc16.set_backend(previous)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        crc16.set_backend("nope")
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""FramedImage 的帧布局与零拷贝缓冲；FramedImageCache 的命中、按预算 LRU 淘汰与文件改写后的失效。"""
+
+import os
+import random
+
+import pytest
+
+import framing
+from framing import FramedImage, FramedImageCache
+
+
+def make_data(size, seed=1) -> bytes:
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+@pytest.fixture
+def write_file(tmp_path):
+    def write(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+def test_frames_match_make_frame():
+    data = make_data(1000)
+    image = FramedImage(data, "main.bin", packet_size=128)
+    assert image.count == 8
+    assert bytes(image.header_packet) == framing.make_frame(framing.make_header_payload("main.bin", 1000),
+                                                           0, 128, b'\x00')
+    for index in range(image.count):
+        assert bytes(image.packet(index)) == framing.make_frame(data[index * 128:(index + 1) * 128],
+                                                               index + 1, 128, b'\x1a')
+    assert bytes(image.end_packet) == framing.make_frame(b'\x00', 0, 128, b'\x00')
+    assert image.payload(100, 200) == data[100:300]
+    # 块长不同时现场组帧
+    assert bytes(image.frame_at(0, 1024, 1)) == framing.make_frame(data, 1, 1024, b'\x1a')
+
+
+def test_buffer_is_a_read_only_view_without_copy():
+    image = FramedImage(make_data(5000), "main.bin", packet_size=1024)
+    assert isinstance(image.buffer, memoryview)
+    assert image.buffer.readonly
+    # 视图直接引用组帧用的 bytearray，没有另存一份 bytes
+    assert isinstance(image.buffer.obj, bytearray)
+    assert image.nbytes == len(image.buffer) == 2 * FramedImage.HEADER_FRAME_LEN + 5 * 1029
+    assert image.packet(0).obj is image.buffer.obj
+    with pytest.raises(TypeError):
+        image.buffer[0] = 0
+
+
+def test_cache_hits_and_separate_keys(write_file):
+    path = write_file("main.bin", make_data(3000))
+    cache = FramedImageCache()
+    first = cache.get(path, 1024)
+    assert cache.get(path, 1024) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    # 包长不同是另一份镜像
+    assert cache.get(path, 128) is not first
+    assert len(cache) == 2
+    assert cache.nbytes == first.nbytes + cache.get(path, 128).nbytes
+
+
+def test_cache_evicts_least_recently_used(write_file):
+    paths = [write_file(f"img{i}.bin", make_data(10 * 1024, seed=i)) for i in range(3)]
+    size = FramedImage(make_data(10 * 1024), "img0.bin", 1024).nbytes
+    cache = FramedImageCache(budget=2 * size)
+    a = cache.get(paths[0], 1024)
+    cache.get(paths[1], 1024)
+    assert cache.get(paths[0], 1024) is a  # img0 变为最近使用
+    cache.get(paths[2], 1024)  # 超出预算：淘汰 img1
+    assert len(cache) == 2 and cache.nbytes == 2 * size
+    assert cache.get(paths[0], 1024) is a
+    misses = cache.misses
+    cache.get(paths[1], 1024)
+    assert cache.misses == misses + 1
+
+
+def test_cache_skips_images_over_budget(write_file):
+    path = write_file("big.bin", make_data(4096))
+    cache = FramedImageCache(budget=1024)
+    image = cache.get(path, 1024)
+    assert image.count == 4
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_cache_invalidated_when_file_changes(write_file):
+    old = make_data(2048, seed=1)
+    path = write_file("main.bin", old)
+    cache = FramedImageCache()
+    first = cache.get(path, 1024)
+    # 同样大小的新内容，只有 mtime 变化
+    new = make_data(2048, seed=2)
+    write_file("main.bin", new)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    second = cache.get(path, 1024)
+    assert second is not first
+    assert second.payload(0, 2048) == new
+    # 旧版本已移出缓存，不占预算
+    assert len(cache) == 1 and cache.nbytes == second.nbytes
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""链路调速：FlashSession(tune=...) 对支持/不支持 $BAUD 的 DeviceSimulator，检查协商结果与 TuneStore 记录。"""
+
+import random
+import time
+
+import pytest
+
+from linktune import LinkTuner, TuneStore, link_key
+from simulator import DeviceSimulator
+from transport import UdpTransport, parse_udp_target
+from upgrade_tool import FlashSession
+
+REVERT = 0.2  # 设备与发送端一致的退回时限，缩短降速测试的等待
+
+
+class BaudUdpTransport(UdpTransport):
+    """
+    UDP 回环上的“串口”：模拟设备按调速结果决定线路质量（max_baud），与真实链路无关，
+    这里只需要 SerialTransport 的 set_baudrate/baudrate 接口。
+    """
+
+    def __init__(self, endpoint, baudrate=115200):
+        super(BaudUdpTransport, self).__init__(*parse_udp_target(endpoint))
+        self.baudrate = baudrate
+
+    def set_baudrate(self, baudrate):
+        self.reader.clear()
+        self.baudrate = baudrate
+
+
+@pytest.fixture(params=["udp", "pty"])
+def link(request):
+    """按参数启动模拟设备并打开发送端传输；pty 需要 pyserial 与 POSIX pty。"""
+    opened = []
+
+    def start(**kwargs):
+        kwargs.setdefault("ready_interval", 0.2)
+        kwargs.setdefault("revert_timeout", REVERT)
+        if request.param == "udp":
+            sim = DeviceSimulator.udp(**kwargs).start()
+            transport = BaudUdpTransport(sim.endpoint)
+        else:
+            pytest.importorskip("serial")
+            from transport import SerialTransport
+            sim = DeviceSimulator.pty(**kwargs).start()
+            transport = SerialTransport(sim.endpoint, baudrate=115200)
+        opened.append((sim, transport))
+        return sim, transport
+
+    yield start
+    for sim, transport in opened:
+        transport.close()
+        sim.stop()
+
+
+def make_tuner(tmp_path, **kwargs):
+    kwargs.setdefault("rates", (921600, 460800, 230400))
+    kwargs.setdefault("revert_timeout", REVERT)
+    kwargs.setdefault("reply_timeout", 0.2)
+    return LinkTuner(TuneStore(str(tmp_path / "links.json")), **kwargs)
+
+
+def flash(transport, tmp_path, tuner, data) -> dict:
+    path = tmp_path / "main.bin"
+    path.write_bytes(data)
+    return FlashSession(transport, "MAIN", str(path), tune=tuner).run()
+
+
+def last_session(sim, count, timeout=5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while len(sim.sessions) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(sim.sessions) >= count, "device did not finish the session"
+    return sim.sessions[-1]
+
+
+def image(size=20000) -> bytes:
+    return random.Random(3).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+def test_tuning_succeeds(link, tmp_path):
+    sim, transport = link(baud_switch=True)
+    tuner = make_tuner(tmp_path)
+    data = image()
+    result = flash(transport, tmp_path, tuner, data)
+    assert result["status"] == "success", result["reason"]
+    assert result["link"]["baudrate"] == 921600
+    assert result["link"]["tried"] == [(921600, "ok")]
+    session = last_session(sim, 1)
+    assert session["baudrate"] == 921600
+    assert bytes(session["files"][0]["data"]) == data
+    assert tuner.store.get(link_key(transport)) == {"rate": 921600, "failed": [], "supported": True}
+    # 传输结束后发送端恢复默认波特率（设备重启后以默认速率运行）
+    assert transport.baudrate == 115200
+
+
+def test_device_without_baud_switch_is_remembered(link, tmp_path):
+    sim, transport = link()
+    tuner = make_tuner(tmp_path)
+    data = image()
+    result = flash(transport, tmp_path, tuner, data)
+    assert result["status"] == "success", result["reason"]
+    assert result["link"]["baudrate"] == 115200
+    assert result["link"]["supported"] is False
+    assert bytes(last_session(sim, 1)["files"][0]["data"]) == data
+    # 记录持久化到文件：新打开的记录同样不再请求调速，也不为等待应答花费 reply_timeout
+    reopened = make_tuner(tmp_path)
+    assert reopened.store.get(link_key(transport))["supported"] is False
+    result = flash(transport, tmp_path, reopened, data)
+    assert result["status"] == "success", result["reason"]
+    assert result["link"]["supported"] is False
+    assert result["link"]["tried"] == []
+    assert result["timings"]["tune"] < 0.05
+
+
+def test_probe_failure_steps_down(link, tmp_path):
+    # 线缆只能稳定工作在 460800：921600 下往返测试误码，双方退回默认速率后再试下一档
+    sim, transport = link(baud_switch=True, max_baud=460800)
+    tuner = make_tuner(tmp_path)
+    data = image()
+    result = flash(transport, tmp_path, tuner, data)
+    assert result["status"] == "success", result["reason"]
+    assert result["link"]["tried"] == [(921600, "probe failed"), (460800, "ok")]
+    assert result["link"]["baudrate"] == 460800
+    session = last_session(sim, 1)
+    assert session["baudrate"] == 460800
+    assert bytes(session["files"][0]["data"]) == data
+    assert tuner.store.get(link_key(transport))["rate"] == 460800
+    # 下次直接从记录的稳定速率开始
+    assert tuner.candidates(link_key(transport), 115200) == [460800, 230400]
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""MulticastSession 对回环地址上多台 DeviceSimulator 的组播升级：单播回退、丢包补发与补发轮的位图读取。"""
+
+import random
+import time
+
+import pytest
+
+import multicast
+from multicast import MulticastSession
+from simulator import DeviceSimulator, Impairments
+from transport import UdpHub
+
+
+@pytest.fixture(scope="module", autouse=True)
+def loopback_multicast():
+    try:
+        multicast.open_group_socket(multicast.DEFAULT_GROUP, "127.0.0.1").close()
+    except OSError as e:
+        pytest.skip(f"multicast is not available on loopback: {e}")
+
+
+@pytest.fixture
+def image(tmp_path):
+    data = random.Random(1).getrandbits(8 * 200000).to_bytes(200000, 'little')
+    path = tmp_path / "main.bin"
+    path.write_bytes(data)
+    return str(path), data
+
+
+@pytest.fixture
+def devices():
+    """devices(spec, ...)：每个 spec 为 DeviceSimulator.udp 的参数 dict，测试结束时全部停止。"""
+    started = []
+
+    def start(*specs):
+        for kwargs in specs:
+            kwargs.setdefault("ready_interval", 0.2)
+            started.append(DeviceSimulator.udp(**kwargs).start())
+        return list(started)
+
+    yield start
+    for sim in started:
+        sim.stop()
+
+
+def run(sims, file_path, **kwargs) -> dict:
+    hub = UdpHub("127.0.0.1", 0)
+    try:
+        return MulticastSession(hub, [sim.endpoint for sim in sims], "MAIN", file_path,
+                                interface_ip="127.0.0.1", **kwargs).run()
+    finally:
+        hub.close()
+
+
+def last_file(sim, timeout=5.0) -> dict:
+    """等待设备记录一次成功的接收（单播回退的设备之前还有一次被取消的会话），返回收到的文件。"""
+    deadline = time.monotonic() + timeout
+    while (not sim.sessions or sim.sessions[-1]["status"] != "success") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sim.sessions, "device did not finish the session"
+    session = sim.sessions[-1]
+    assert session["status"] == "success", session["reason"]
+    return session["files"][0]
+
+
+def test_multicast_and_unicast_fallback(devices, image):
+    path, data = image
+    sims = devices({"multicast": True}, {"multicast": True}, {})
+    result = run(sims, path)
+    assert result["status"] == "success"
+    assert [d["mode"] for d in result["devices"]] == ["multicast", "multicast", "unicast"]
+    assert all(d["status"] == "success" for d in result["devices"])
+    for sim in sims:
+        assert bytes(last_file(sim)["data"]) == data
+    # 组播设备的包来自组播（没有损伤时无需补发），普通设备走单播
+    for sim in sims[:2]:
+        assert last_file(sim)["multicast"]["packets"] == 196
+    assert last_file(sims[2])["multicast"] is None
+    assert result["multicast_bytes"] < 2 * len(data)
+    assert result["repair_bytes"] == 0
+
+
+def test_lost_packets_are_repaired(devices, image):
+    path, data = image
+    sims = devices({"multicast": True, "impairments": Impairments(bit_error_rate=2e-6, seed=1)},
+                   {"multicast": True, "impairments": Impairments(bit_error_rate=2e-6, seed=2)})
+    result = run(sims, path)
+    assert result["status"] == "success"
+    assert result["rounds"] >= 2
+    assert result["repair_bytes"] > 0
+    for sim, device in zip(sims, result["devices"]):
+        received = last_file(sim)
+        assert bytes(received["data"]) == data
+        assert received["multicast"]["repaired"] == device["repaired"] > 0
+
+
+def test_slow_repairs_do_not_stale_later_bitmaps(devices, image):
+    # 第一台缺的包多，限速补发它们的时间长于 response_timeout；其余设备的位图仍须在同一轮读到，
+    # 否则留在缓冲里的旧位图会在下一轮被当作新的，已收到的包被重复补发
+    path, data = image
+    sims = devices({"multicast": True, "impairments": Impairments(bit_error_rate=1e-5, seed=20)},
+                   {"multicast": True, "impairments": Impairments(bit_error_rate=2e-6, seed=21)},
+                   {"multicast": True, "impairments": Impairments(bit_error_rate=2e-6, seed=22)})
+    result = run(sims, path, rate=512 * 1024, response_timeout=0.01)
+    assert result["status"] == "success", result["devices"]
+    assert result["rounds"] <= 3
+    for sim, device in zip(sims, result["devices"]):
+        received = last_file(sim)
+        assert bytes(received["data"]) == data
+        if sim is not sims[0]:
+            assert device["repaired"] == received["multicast"]["repaired"]
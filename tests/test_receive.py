@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""YMODEM.recv / ReceiveSession：由测试脚本充当发送端逐帧驱动接收端，检查落盘文件、NAK、重复包与取消。"""
+
+import queue
+import random
+import threading
+import time
+
+import pytest
+
+import framing
+from rxbuffer import ResponseReader
+from upgrade_tool import ReceiveSession
+from ymodem import ACK, CAN, CRC, EOT, NAK, YMODEM
+
+PAD = b'\x1a'
+
+
+class PipeTransport(object):
+    """接收端一侧的内存线路：测试线程用 send() 写入帧，用 expect() 读取接收端的应答。"""
+
+    def __init__(self):
+        self._inbound = queue.Queue()
+        self._outbound = queue.Queue()
+        self._seen = bytearray()
+        self.reader = ResponseReader(self._fill)
+
+    def _fill(self, timeout):
+        try:
+            return self._inbound.get(timeout=0.05 if timeout is None else timeout)
+        except queue.Empty:
+            return None
+
+    # 接收端使用的接口
+    def getc(self, size):
+        return self.reader.getc(size)
+
+    def pollc(self, size):
+        return self.reader.pollc(size)
+
+    def read_token(self, timeout):
+        return self.reader.read_token(timeout)
+
+    def putc(self, data):
+        self._outbound.put(bytes(data))
+
+    def describe(self):
+        return "pipe"
+
+    # 测试脚本（发送端）使用的接口
+    def send(self, data):
+        self._inbound.put(bytes(data))
+
+    def expect(self, token, timeout=3.0):
+        """等待接收端发出 token（之前的字节，如周期重发的 'C'，一并丢弃）。"""
+        deadline = time.monotonic() + timeout
+        while True:
+            index = self._seen.find(token)
+            if index >= 0:
+                del self._seen[:index + len(token)]
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AssertionError(f"receiver did not send {token!r} (got {bytes(self._seen)!r})")
+            try:
+                self._seen += self._outbound.get(timeout=remaining)
+            except queue.Empty:
+                pass
+
+
+def make_data(size, seed=1) -> bytes:
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+def header(name, size=None) -> bytes:
+    payload = framing.make_header_payload(name, size) if size is not None else name.encode() + b'\x00'
+    return framing.make_frame(payload, 0, 128, b'\x00')
+
+
+def frames(data, packet_size=1024):
+    for index, offset in enumerate(range(0, len(data), packet_size)):
+        yield framing.make_frame(data[offset:offset + packet_size], index + 1, packet_size, PAD)
+
+
+def send_file(line, name, data, size=True, packet_size=1024):
+    """按 YMODEM 发送一个文件（包0 → 数据包 → EOT），每帧等待接收端的应答。"""
+    line.send(header(name, len(data) if size else None))
+    line.expect(ACK + CRC)
+    for frame in frames(data, packet_size):
+        line.send(frame)
+        line.expect(ACK)
+    line.send(EOT)
+    line.expect(ACK + CRC)
+
+
+def end_batch(line):
+    line.send(framing.make_frame(b'', 0, 128, b'\x00'))
+    line.expect(ACK)
+
+
+@pytest.fixture
+def receive(tmp_path):
+    """在后台线程运行 ReceiveSession；返回 (line, session, 取结果的函数)。"""
+    threads = []
+
+    def start(**kwargs):
+        line = PipeTransport()
+        session = ReceiveSession(line, str(tmp_path / "out"), timeout=2, **kwargs)
+        holder = {}
+        thread = threading.Thread(target=lambda: holder.update(session.run()), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+        def result():
+            thread.join(timeout=10)
+            assert not thread.is_alive(), "receiver did not return"
+            return holder
+        return line, session, result
+
+    yield start
+    for thread in threads:
+        thread.join(timeout=10)
+
+
+def test_batch(receive, tmp_path):
+    line, _, result = receive(command="DUMP")
+    line.expect(b"DUMP\r\n")
+    line.expect(CRC)
+    first, second = make_data(5000, 1), make_data(1500, 2)
+    send_file(line, "crash.bin", first)
+    send_file(line, "calib.bin", second, packet_size=128)
+    end_batch(line)
+    res = result()
+    assert res["status"] == "success", res["reason"]
+    assert [f["name"] for f in res["files"]] == ["crash.bin", "calib.bin"]
+    assert (tmp_path / "out" / "crash.bin").read_bytes() == first
+    assert (tmp_path / "out" / "calib.bin").read_bytes() == second
+    assert res["bytes"] == len(first) + len(second)
+    assert res["port"] == "pipe"
+
+
+def test_last_packet_padding_is_trimmed(receive, tmp_path):
+    line, _, result = receive()
+    line.expect(CRC)
+    # 给出大小：按大小截断（末尾恰好是 0x1A 的数据也保留）
+    sized = make_data(3000) + PAD * 3
+    send_file(line, "sized.bin", sized)
+    # 未给出大小：EOT 时去掉末包尾部的填充字节
+    unsized = make_data(2100, 3) + b'\x00'
+    send_file(line, "unsized.bin", unsized, size=False)
+    end_batch(line)
+    res = result()
+    assert res["status"] == "success", res["reason"]
+    assert (tmp_path / "out" / "sized.bin").read_bytes() == sized
+    assert (tmp_path / "out" / "unsized.bin").read_bytes() == unsized
+    assert [f["size"] for f in res["files"]] == [len(sized), len(unsized)]
+
+
+def test_bad_crc_is_naked(receive, tmp_path):
+    line, _, result = receive()
+    line.expect(CRC)
+    data = make_data(2048)
+    packets = list(frames(data))
+    line.send(header("log.bin", len(data)))
+    line.expect(ACK + CRC)
+    broken = bytearray(packets[0])
+    broken[-1] ^= 0xff
+    line.send(broken)
+    line.expect(NAK)
+    for frame in packets:
+        line.send(frame)
+        line.expect(ACK)
+    line.send(EOT)
+    line.expect(ACK + CRC)
+    end_batch(line)
+    res = result()
+    assert res["status"] == "success", res["reason"]
+    assert res["naks"] == 1
+    assert (tmp_path / "out" / "log.bin").read_bytes() == data
+
+
+def test_duplicate_packets_are_acked_once_written(receive, tmp_path):
+    line, _, result = receive()
+    line.expect(CRC)
+    data = make_data(3072)
+    packets = list(frames(data))
+    line.send(header("log.bin", len(data)))
+    line.expect(ACK + CRC)
+    # 包0 的 ACK 丢失：发送端重发包0
+    line.send(header("log.bin", len(data)))
+    line.expect(ACK + CRC)
+    for frame in packets:
+        line.send(frame)
+        line.expect(ACK)
+    # 末包的 ACK 丢失：重发末包，之后 EOT 前后的重发同样只应答不写入
+    line.send(packets[-1])
+    line.expect(ACK)
+    line.send(EOT)
+    line.expect(ACK + CRC)
+    line.send(packets[-1])
+    line.expect(ACK)
+    end_batch(line)
+    res = result()
+    assert res["status"] == "success", res["reason"]
+    assert res["duplicates"] == 3
+    assert (tmp_path / "out" / "log.bin").read_bytes() == data
+
+
+def test_sender_cancel(receive):
+    line, _, result = receive()
+    line.expect(CRC)
+    data = make_data(4096)
+    line.send(header("log.bin", len(data)))
+    line.expect(ACK + CRC)
+    line.send(next(frames(data)))
+    line.expect(ACK)
+    line.send(CAN + CAN)
+    res = result()
+    assert res["status"] == "cancel"
+    assert res["reason"] == "sender canceled"
+    assert res["files"] == []
+
+
+def test_local_cancel(receive):
+    line, session, result = receive()
+    line.expect(CRC)
+    data = make_data(4096)
+    line.send(header("log.bin", len(data)))
+    line.expect(ACK + CRC)
+    session.cancel()
+    line.expect(CAN + CAN)
+    res = result()
+    assert res["status"] == "cancel"
+    assert res["reason"] == "canceled"
+
+
+def test_recv_gives_up_after_repeated_timeouts(tmp_path):
+    line = PipeTransport()
+    receiver = YMODEM(line.getc, line.putc, readtoken=line.read_token)
+    res = receiver.recv(str(tmp_path / "out"), retry=1, timeout=0.2)
+    assert res["status"] == "fail"
+    assert res["reason"] == "timeout"
+    line.expect(CAN + CAN)
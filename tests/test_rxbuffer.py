@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""RingBuffer 的回绕与溢出计数；ResponseReader 的 getc/pollc 与按截止时间等待的 read_token。"""
+
+import time
+
+from rxbuffer import ACK, CRC, NAK, ResponseReader, RingBuffer, token_name
+
+
+def test_wraparound():
+    ring = RingBuffer(8)
+    ring.write(b'abcdef')
+    assert ring.read(4) == b'abcd'
+    # 写入跨过缓冲末尾：前 4 字节写在尾部，其余回到开头
+    ring.write(b'ghijkl')
+    assert len(ring) == 8
+    assert ring.read(3) == b'efg'
+    assert ring.read(100) == b'hijkl'
+    assert ring.read(1) == b''
+    assert ring.dropped == 0
+
+
+def test_overflow_drops_oldest():
+    ring = RingBuffer(8)
+    ring.write(b'012345')
+    ring.write(b'6789')
+    assert ring.dropped == 2
+    assert ring.read(8) == b'23456789'
+    # 单次写入超过容量：只保留最后 capacity 字节，缓冲中原有的数据一并计入 dropped
+    ring.write(b'xy')
+    ring.write(bytes(range(20)))
+    assert ring.dropped == 2 + 2 + 12
+    assert ring.read(8) == bytes(range(12, 20))
+
+
+def test_overflow_after_wraparound():
+    ring = RingBuffer(4)
+    ring.write(b'ab')
+    ring.read(1)
+    ring.write(b'cdef')  # head=1 时溢出 1 字节
+    assert ring.dropped == 1
+    assert ring.read(4) == b'cdef'
+    ring.write(memoryview(b'gh'))
+    ring.clear()
+    assert len(ring) == 0 and ring.read(1) == b''
+
+
+class ScriptedFill(object):
+    """按顺序返回预置的数据块；没有数据时等待给定的 timeout（模拟端口读超时）。"""
+
+    def __init__(self, chunks, idle=0.05):
+        self.chunks = list(chunks)
+        self.idle = idle
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.chunks:
+            return self.chunks.pop(0)
+        time.sleep(self.idle if timeout is None else min(timeout, self.idle))
+        return b''
+
+
+def test_reader_reads_whole_chunks():
+    fill = ScriptedFill([ACK + CRC + NAK])
+    reader = ResponseReader(fill)
+    assert reader.read_token(1.0) == ACK
+    assert reader.getc(2) == CRC + NAK
+    # 三个字节只读了一次端口
+    assert reader.fills == 1
+    assert reader.pollc(1) is None
+    assert fill.timeouts[-1] == 0
+    assert reader.getc(1) is None
+    assert fill.timeouts[-1] is None
+
+
+def test_read_token_deadline():
+    reader = ResponseReader(ScriptedFill([], idle=0.02))
+    t_start = time.monotonic()
+    assert reader.read_token(0.15) is None
+    elapsed = time.monotonic() - t_start
+    # 多次端口读取共享同一截止时间：不因每次读取各等一个读超时而拖长
+    assert 0.14 <= elapsed < 0.3
+
+
+def test_read_token_waits_for_late_data():
+    fill = ScriptedFill([b'', b'', NAK], idle=0.0)
+    reader = ResponseReader(fill)
+    assert reader.read_token(1.0) == NAK
+    assert all(0 <= t <= 1.0 for t in fill.timeouts)
+
+
+def test_reader_overflow_and_clear():
+    reader = ResponseReader(ScriptedFill([b'x' * 10, b'y' * 4]), capacity=8)
+    assert reader.getc(1) == b'x'
+    reader.clear()
+    assert reader.getc(8) == b'yyyy'
+    reader = ResponseReader(ScriptedFill([b'x' * 10]), capacity=8)
+    assert reader.getc(8) == b'x' * 8
+    assert reader.ring.dropped == 2
+
+
+def test_token_name():
+    assert token_name(ACK) == 'ACK'
+    assert token_name(b'C') == 'C'
+    assert token_name(b'\x00') == 'noise'
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""PortThroughput 的按吞吐排名挑选任务；FlashScheduler 以假会话检查并发上限、任务与端口的匹配以及取消。"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import FlashJob, FlashScheduler, PortThroughput
+
+
+class FakeTransport(object):
+    def __init__(self, port):
+        self.port = port
+        self.is_open = True
+        self.closed = False
+
+    def close(self):
+        self.is_open = False
+        self.closed = True
+
+
+class FakeSession(object):
+    """
+    代替 FlashSession：按端口速率（字节/秒）睡眠 size/rate 秒后返回成功结果；
+    可被 cancel()；hold 事件置位前不结束（用于在任务执行中途取消）。
+    """
+
+    rates = {}
+    hold = None
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+    started = []
+
+    def __init__(self, transport, iface, file_path, **kwargs):
+        self.transport = transport
+        self.iface = iface
+        self.file_path = file_path
+        self.kwargs = kwargs
+        self.cancelled = threading.Event()
+
+    @classmethod
+    def reset(cls, rates=None, hold=None):
+        cls.rates = dict(rates or {})
+        cls.hold = hold
+        cls.running = cls.peak = 0
+        cls.started = []
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        cls = type(self)
+        with cls.lock:
+            cls.running += 1
+            cls.peak = max(cls.peak, cls.running)
+            cls.started.append((self.transport.port, self.file_path))
+        try:
+            size = os.path.getsize(self.file_path)
+            rate = cls.rates.get(self.transport.port, 1e6)
+            deadline = time.monotonic() + size / rate
+            while time.monotonic() < deadline or (cls.hold is not None and not cls.hold.is_set()):
+                if self.cancelled.wait(0.005):
+                    return {"iface": self.iface, "file": self.file_path, "size": size,
+                            "status": "cancel", "reason": "canceled"}
+            return {"iface": self.iface, "file": self.file_path, "size": size, "status": "success",
+                    "reason": None, "throughput": rate}
+        finally:
+            with cls.lock:
+                cls.running -= 1
+
+
+@pytest.fixture
+def fake_sessions(monkeypatch):
+    FakeSession.reset()
+    monkeypatch.setattr(scheduler, "FlashSession", FakeSession)
+    return FakeSession
+
+
+@pytest.fixture
+def make_job(tmp_path):
+    def make(size, name=None, port=None):
+        path = tmp_path / (name or f"img{size}.bin")
+        path.write_bytes(b'\x00' * size)
+        return FlashJob("MAIN", str(path), port=port)
+    return make
+
+
+def test_pick_matches_job_size_to_port_rank(make_job):
+    meter = PortThroughput(["slow", "mid", "fast"])
+    for port, rate in (("slow", 10000.0), ("mid", 20000.0), ("fast", 40000.0)):
+        meter.record(port, {"status": "success", "throughput": rate})
+    jobs = [make_job(size) for size in (5000, 100, 2000, 800, 300)]
+    assert meter.pick(jobs, "slow").size == 100
+    assert meter.pick(jobs, "mid").size == 800
+    assert meter.pick(jobs, "fast").size == 5000
+    assert meter.pick([], "fast") is None
+
+
+def test_pick_without_measurements_and_single_port(make_job):
+    jobs = [make_job(size) for size in (3000, 1000, 2000)]
+    # 没有实测时各端口相同（排名 0）：都先取最小的任务
+    meter = PortThroughput(["a", "b"])
+    assert meter.pick(jobs, "a").size == 1000
+    assert meter.get("a") == scheduler.DEFAULT_THROUGHPUT
+    assert PortThroughput(["only"]).pick(jobs, "only").size == 1000
+
+
+def test_record_ignores_failures_and_averages():
+    meter = PortThroughput(["a", "b"])
+    meter.record("a", {"status": "fail", "throughput": 99999.0})
+    meter.record("a", {"status": "success", "throughput": 0.0})
+    assert "a" not in meter.rates
+    meter.record("a", {"status": "success", "throughput": 1000.0})
+    meter.record("a", {"status": "success", "throughput": 3000.0})
+    assert meter.get("a") == 2000.0
+    # 没有实测的端口取其它端口实测的均值
+    assert meter.get("b") == 2000.0
+
+
+def test_concurrency_limit(fake_sessions, make_job):
+    ports = ["p1", "p2", "p3", "p4"]
+    sched = FlashScheduler(ports, max_concurrency=2, transport_factory=FakeTransport)
+    for i in range(6):
+        sched.submit(make_job(50000 + i, name=f"job{i}.bin"))
+    results = sched.run()
+    assert len(results) == 6
+    assert all(r["status"] == "success" for r in results)
+    assert fake_sessions.peak == 2
+    assert sorted(r["job_id"] for r in results) == [f"job{i}" for i in range(1, 7)]
+
+
+def test_pinned_jobs_run_on_their_port(fake_sessions, make_job):
+    sched = FlashScheduler(["a", "b"], transport_factory=FakeTransport)
+    pinned = [make_job(1000, name=f"a{i}.bin", port="a") for i in range(3)]
+    for job in pinned:
+        sched.submit(job)
+    free = sched.submit(make_job(1000, name="free.bin"))
+    results = {r["job_id"]: r for r in sched.run()}
+    assert all(results[job.job_id]["port"] == "a" for job in pinned)
+    assert results[free]["status"] == "success"
+    with pytest.raises(ValueError):
+        sched.submit(make_job(10, port="c"))
+
+
+def test_fast_port_takes_the_largest_job(fake_sessions, make_job):
+    fake_sessions.reset(rates={"slow": 200000.0, "fast": 800000.0})
+    sched = FlashScheduler(["slow", "fast"], transport_factory=FakeTransport)
+    # 第一轮测出各端口吞吐
+    sched.submit(make_job(20000, port="slow"))
+    sched.submit(make_job(20000, port="fast"))
+    sched.run()
+    assert sched.throughput("fast") > sched.throughput("slow")
+    small = sched.submit(make_job(10000, name="small.bin"))
+    large = sched.submit(make_job(80000, name="large.bin"))
+    results = {r["job_id"]: r for r in sched.run()}
+    assert results[large]["port"] == "fast"
+    assert results[small]["port"] == "slow"
+    assert sched.expected_time(FlashJob("MAIN", results[large]["file"]), "fast") == pytest.approx(0.1)
+
+
+def test_cancel_pending_and_running(fake_sessions, make_job):
+    hold = threading.Event()
+    fake_sessions.reset(hold=hold)
+    sched = FlashScheduler(["a"], transport_factory=FakeTransport)
+    running = sched.submit(make_job(100, name="running.bin"))
+    pending = sched.submit(make_job(200, name="pending.bin"))
+    runner = threading.Thread(target=sched.run, daemon=True)
+    runner.start()
+    deadline = time.monotonic() + 5.0
+    while sched.port_jobs.get("a") != running and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert sched.cancel(pending)
+    assert sched.cancel(running)
+    assert not sched.cancel("job99")
+    runner.join(timeout=5.0)
+    assert not runner.is_alive()
+    assert [(r["job_id"], r["status"]) for r in sched.results] == [(running, "cancel")]
+    assert len(fake_sessions.started) == 1
+
+
+def test_cancel_all(fake_sessions, make_job):
+    fake_sessions.reset(hold=threading.Event())
+    sched = FlashScheduler(["a", "b"], transport_factory=FakeTransport)
+    for i in range(5):
+        sched.submit(make_job(100 + i))
+    runner = threading.Thread(target=sched.run, daemon=True)
+    runner.start()
+    deadline = time.monotonic() + 5.0
+    while len(sched.sessions) < 2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    sched.cancel_all()
+    runner.join(timeout=5.0)
+    assert not runner.is_alive()
+    assert [r["status"] for r in sched.results] == ["cancel", "cancel"]
+
+
+def test_port_error_fails_the_job(fake_sessions, make_job):
+    def broken(port):
+        raise OSError("no such port")
+
+    sched = FlashScheduler(["a"], transport_factory=broken)
+    sched.submit(make_job(100))
+    results = sched.run()
+    assert results[0]["status"] == "fail"
+    assert results[0]["reason"] == "port error: no such port"
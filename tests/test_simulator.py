@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""FlashSession 对 UDP 回环上的 DeviceSimulator 的端到端升级：检查设备收到的镜像与各扩展的结果。"""
+
+import random
+import time
+
+import pytest
+
+from simulator import DeviceSimulator, Impairments
+from transport import UdpTransport, parse_udp_target
+from upgrade_tool import FlashSession
+
+
+def make_image(size, seed=1) -> bytes:
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+@pytest.fixture
+def write_image(tmp_path):
+    def write(data, name="main.bin"):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def device():
+    """按参数启动模拟设备，测试结束时停止。"""
+    started = []
+
+    def start(**kwargs):
+        kwargs.setdefault("ready_interval", 0.2)
+        sim = DeviceSimulator.udp(**kwargs).start()
+        started.append(sim)
+        return sim
+
+    yield start
+    for sim in started:
+        sim.stop()
+
+
+def flash(sim, file_path, **kwargs) -> dict:
+    transport = UdpTransport(*parse_udp_target(sim.endpoint))
+    try:
+        return FlashSession(transport, "MAIN", file_path, **kwargs).run()
+    finally:
+        transport.close()
+
+
+def session(sim, count=1, timeout=5.0) -> dict:
+    """等待设备结束第 count 次接收（设备在应答结束包之后才记录会话），返回最后一次的记录。"""
+    deadline = time.monotonic() + timeout
+    while len(sim.sessions) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(sim.sessions) >= count, "device did not finish the session"
+    return sim.sessions[-1]
+
+
+def received(sim_session) -> bytes:
+    assert sim_session["status"] == "success", sim_session["reason"]
+    return bytes(sim_session["files"][0]["data"])
+
+
+def test_plain(device, write_image):
+    data = make_image(300000)
+    sim = device()
+    result = flash(sim, write_image(data))
+    assert result["status"] == "success", result["reason"]
+    assert received(session(sim)) == data
+    assert result["block_counts"] == {1024: 293}
+    # 握手收到的 'C' 直接用于发送包0，不再等待设备的下一个周期 'C'
+    assert result["timings"]["start"] < 0.1
+
+
+def test_progress_goes_to_the_log_not_stdout(device, write_image, capsys, caplog):
+    sim = device()
+    with caplog.at_level("INFO", logger="YReporter"):
+        result = flash(sim, write_image(make_image(5000)))
+    assert result["status"] == "success", result["reason"]
+    assert capsys.readouterr().out == ""
+    assert "*** 升级成功" in caplog.messages
+
+
+def test_ymodem_g(device, write_image):
+    # UDP 上的流式发送没有流控，镜像不宜超过 socket 接收缓冲
+    data = make_image(32 * 1024 + 100)
+    sim = device(streaming=True)
+    result = flash(sim, write_image(data))
+    assert result["status"] == "success", result["reason"]
+    assert received(session(sim)) == data
+    assert result["block_counts"] == {1024: 33}
+
+
+def test_nak_first_eot(device, write_image):
+    data = make_image(50000)
+    sim = device(nak_first_eot=True)
+    result = flash(sim, write_image(data))
+    assert result["status"] == "success", result["reason"]
+    sim_session = session(sim)
+    assert received(sim_session) == data
+    assert sim_session["eot_naks"] == 1
+    # NAK 后立即重发 EOT，不等重发超时，也不丢弃“重复 ACK”
+    assert result["timings"]["finish"] < 0.5
+
+
+def test_bit_errors_fall_back_to_128(device, write_image):
+    data = make_image(64 * 1024)
+    sim = device(impairments=Impairments(bit_error_rate=1e-4, seed=3))
+    result = flash(sim, write_image(data), mode='auto')
+    assert result["status"] == "success", result["reason"]
+    sim_session = session(sim)
+    assert received(sim_session) == data
+    assert sim_session["naks"] > 0
+    assert result["block_counts"].get(128, 0) > 0
+
+
+def test_delta(device, write_image):
+    old = make_image(200000, seed=2)
+    new = bytearray(old)
+    new[5000:5100] = b'x' * 100
+    new = bytes(new) + b'tail' * 300
+    sim = device(delta=True, images={"MAIN": old})
+    result = flash(sim, write_image(new), delta=write_image(old, "old.bin"))
+    assert result["status"] == "success", result["reason"]
+    assert received(session(sim)) == new
+    assert result["delta"]["status"] == "sent"
+    assert result["wire_size"] < len(new) // 4
+
+
+def test_delta_rejected_falls_back_to_full_image(device, write_image):
+    old = make_image(100000, seed=2)
+    new = old[:50000] + b'changed' + old[50007:]
+    sim = device()  # 不支持增量扩展的设备
+    result = flash(sim, write_image(new), delta=write_image(old, "old.bin"))
+    assert result["status"] == "success", result["reason"]
+    assert result["delta"]["status"] == "rejected"
+    assert received(session(sim, count=2)) == new
+    assert result["wire_size"] == len(new)
+
+
+def test_resume(device, write_image, tmp_path):
+    data = make_image(120000)
+    path = write_image(data)
+    store = str(tmp_path / "resume.json")
+    sim = device(resume=True)
+
+    def cancel_halfway(percent):
+        if percent >= 50:
+            first_session.cancel()
+
+    transport = UdpTransport(*parse_udp_target(sim.endpoint))
+    try:
+        first_session = FlashSession(transport, "MAIN", path, resume=store, progress_callback=cancel_halfway)
+        first = first_session.run()
+    finally:
+        transport.close()
+    assert first["status"] == "cancel"
+    assert session(sim)["status"] == "cancel"
+
+    second = flash(sim, path, resume=store)
+    assert second["status"] == "success", second["reason"]
+    sim_session = session(sim, count=2)
+    assert received(sim_session) == data
+    assert 0 < second["resumed_from"] < len(data)
+    assert sim_session["files"][0]["resumed_from"] == second["resumed_from"]
+
+
+def test_compressed(device, write_image):
+    data = make_image(2000) * 50 + b'\xff' * 50000  # 可压缩的镜像（重复距离在 4 KB 窗口内）
+    sim = device(decompress=True)
+    result = flash(sim, write_image(data), compress=True)
+    assert result["status"] == "success", result["reason"]
+    assert result["compression"] == "sent"
+    sim_session = session(sim)
+    assert received(sim_session) == data
+    assert result["wire_size"] < len(data) // 2
+    assert sim_session["files"][0]["wire_size"] == result["wire_size"]
+
+
+def test_compressed_rejected_falls_back_to_plain_image(device, write_image):
+    data = make_image(100000)
+    sim = device()  # 不支持压缩扩展的设备
+    result = flash(sim, write_image(data), compress=True)
+    assert result["status"] == "success", result["reason"]
+    assert result["compression"] == "rejected"
+    assert received(session(sim, count=2)) == data
+    assert result["wire_size"] == len(data)
+
+
+def test_compressed_rejected_strict(device, write_image):
+    sim = device()
+    result = flash(sim, write_image(make_image(20000)), compress=True, compress_fallback=False)
+    assert result["status"] == "fail"
+    assert result["compression"] == "rejected"
+    assert result["reason"] == "device does not support compressed transfer"
+    assert session(sim)["status"] == "cancel"
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""逐包遥测：ACK 延迟从最后一次发出算起，重发前的超时等待不计入 RTT。"""
+
+import random
+
+from rtt import RttEstimator
+from simulator import DeviceSimulator, Impairments
+from telemetry import CAUSE_NAK, CAUSE_OK, CAUSE_TIMEOUT, PacketTelemetry
+from transport import UdpTransport, parse_udp_target
+from upgrade_tool import FlashSession
+from ymodem import ACK, NAK, FrameWait
+
+
+def acked(wait, replies):
+    """按 [(时刻, 应答字节或 None), ...] 驱动 FrameWait，返回最后的动作。"""
+    action = None
+    for now, char in replies:
+        action = wait.on_reply(char, now)
+    return action
+
+
+def test_retried_packet_latency_starts_at_last_send():
+    tel = PacketTelemetry()
+    wait = FrameWait(RttEstimator(initial=1.0), 1029, retry=10, timeout=15)
+    wait.start(tel.t0 + 10.0)
+    # 1 秒没有应答 → 超时重发；重发后 20ms 收到 ACK
+    assert wait.on_reply(None, tel.t0 + 11.0) == FrameWait.RESEND
+    assert acked(wait, [(tel.t0 + 11.02, ACK)]) == FrameWait.ACK
+    sent_at, last_sent_at, retries, cause, wire_bytes, _, timed_out = wait.stats
+    tel.record(1, sent_at, tel.t0 + 11.02, retries, cause, wire_bytes, 1024, last_sent_at)
+
+    assert timed_out and retries == 1 and cause == CAUSE_TIMEOUT and wire_bytes == 2 * 1029
+    assert abs(tel.send_time[0] - 10.0) < 1e-9
+    assert abs(tel.ack_latency[0] - 0.02) < 1e-9
+    summary = tel.summary()
+    assert abs(summary["rtt_max"] - 0.02) < 1e-9
+    # 总耗时仍从首次发出算到 ACK
+    assert abs(summary["duration"] - 1.02) < 1e-9
+
+
+def test_nak_resend_latency():
+    tel = PacketTelemetry()
+    wait = FrameWait(RttEstimator(initial=1.0), 133, retry=10, timeout=15)
+    wait.start(tel.t0 + 1.0)
+    assert wait.on_reply(NAK, tel.t0 + 1.01) == FrameWait.RESEND
+    assert wait.on_reply(ACK, tel.t0 + 1.03) == FrameWait.ACK
+    sent_at, last_sent_at, retries, cause, wire_bytes, _, _ = wait.stats
+    tel.record(2, sent_at, tel.t0 + 1.03, retries, cause, wire_bytes, 128, last_sent_at)
+    tel.record(3, tel.t0 + 1.03, tel.t0 + 1.04, 0, CAUSE_OK, 133, 128)
+    assert cause == CAUSE_NAK
+    assert [round(x, 6) for x in tel.ack_latency[:2]] == [0.02, 0.01]
+    assert abs(tel.summary()["duration"] - 0.04) < 1e-9
+
+
+def test_session_rtt_excludes_timeout_waits(tmp_path):
+    data = random.Random(5).getrandbits(8 * 64 * 1024).to_bytes(64 * 1024, 'little')
+    path = tmp_path / "main.bin"
+    path.write_bytes(data)
+    sim = DeviceSimulator.udp(ready_interval=0.2, impairments=Impairments(drop_rate=1e-4, seed=7)).start()
+    transport = UdpTransport(*parse_udp_target(sim.endpoint))
+    try:
+        session = FlashSession(transport, "MAIN", str(path), mode='ymodem', telemetry=True)
+        result = session.run()
+    finally:
+        transport.close()
+        sim.stop()
+    assert result["status"] == "success", result["reason"]
+    tel = session.telemetry
+    # 丢字节的包要等设备的字节间超时（1 秒）才回 NAK，期间发送端已超时重发过
+    retried = [i for i in range(tel.count) if tel.retries[i]]
+    assert retried, "expected packets that were resent"
+    assert result["timings"]["data"] > 0.5
+    for i in retried:
+        assert tel.ack_latency[i] < 0.1
+    assert result["telemetry"]["rtt_max"] < 0.1
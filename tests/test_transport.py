@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""PortLeases：同一端口同一时刻只借给一个持有者，公共连接只创建一个传输对象。"""
+
+import pytest
+
+from transport import PortLeases
+
+
+class FakeTransport(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def counting_factory(name="shared"):
+    created = []
+
+    def factory():
+        created.append(FakeTransport(name))
+        return created[-1]
+    return factory, created
+
+
+def test_shared_port_refuses_second_row():
+    leases = PortLeases()
+    factory, created = counting_factory()
+    first = leases.acquire("/dev/ttyUSB0", "interface1", factory, shared=True)
+    with pytest.raises(ValueError, match="in use by interface1"):
+        leases.acquire("/dev/ttyUSB0", "interface2", factory, shared=True)
+    assert leases.owner("/dev/ttyUSB0") == "interface1"
+
+    assert leases.release("/dev/ttyUSB0", "interface1") == 0
+    assert leases.owner("/dev/ttyUSB0") is None
+    # 归还后下一行拿到的是同一个传输对象（同一接收缓冲），不再新建包装
+    assert leases.acquire("/dev/ttyUSB0", "interface2", factory, shared=True) is first
+    assert len(created) == 1
+
+
+def test_same_owner_is_refcounted():
+    leases = PortLeases()
+    factory, _ = counting_factory()
+    leases.acquire("udp://127.0.0.1:5000", "interface1", factory, shared=True)
+    leases.acquire("udp://127.0.0.1:5000", "interface1", factory, shared=True)
+    assert leases.release("udp://127.0.0.1:5000", "interface1") == 1
+    with pytest.raises(ValueError):
+        leases.acquire("udp://127.0.0.1:5000", "interface2", factory, shared=True)
+    assert leases.release("udp://127.0.0.1:5000", "interface1") == 0
+    leases.acquire("udp://127.0.0.1:5000", "interface2", factory, shared=True)
+
+
+def test_release_by_other_owner_is_ignored():
+    leases = PortLeases()
+    factory, _ = counting_factory()
+    leases.acquire("COM3", "interface1", factory, shared=True)
+    assert leases.release("COM3", "interface2") == 0
+    assert leases.owner("COM3") == "interface1"
+
+
+def test_dedicated_port_is_dropped_on_release():
+    leases = PortLeases()
+    factory, created = counting_factory("own")
+    leases.acquire("/dev/ttyUSB1", "interface3", factory)
+    with pytest.raises(ValueError):
+        leases.acquire("/dev/ttyUSB1", "interface4", factory)
+    leases.release("/dev/ttyUSB1", "interface3")
+    leases.acquire("/dev/ttyUSB1", "interface4", factory)
+    assert len(created) == 2
+
+
+def test_dedicated_open_of_shared_port_is_refused():
+    leases = PortLeases()
+    shared, _ = counting_factory()
+    own, created = counting_factory("own")
+    leases.acquire("/dev/ttyUSB0", "interface1", shared, shared=True)
+    leases.release("/dev/ttyUSB0", "interface1")
+    # 公共串口空闲时也不能被某一行当作独占端口再打开（结束时会被关闭）
+    with pytest.raises(ValueError, match="shared connection"):
+        leases.acquire("/dev/ttyUSB0", "interface2", own)
+    assert not created
+
+
+def test_discard_and_factory_errors():
+    leases = PortLeases()
+    factory, created = counting_factory()
+    first = leases.acquire("/dev/ttyUSB0", "interface1", factory, shared=True)
+    leases.release("/dev/ttyUSB0", "interface1")
+    leases.discard("/dev/ttyUSB0")
+    assert leases.acquire("/dev/ttyUSB0", "interface1", factory, shared=True) is not first
+
+    def broken():
+        raise OSError("no such port")
+    with pytest.raises(OSError):
+        leases.acquire("/dev/ttyUSB9", "interface2", broken)
+    assert leases.owner("/dev/ttyUSB9") is None
+    leases.acquire("/dev/ttyUSB9", "interface2", factory)
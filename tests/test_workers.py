@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""ProcessFlashPool：工作进程对 UDP 回环上的 DeviceSimulator 完成升级；进程卡死或崩溃时任务判定失败。"""
+
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+import pytest
+
+from scheduler import FlashJob
+from simulator import DeviceSimulator
+from workers import ProcessFlashPool
+
+
+def make_image(size, seed=1) -> bytes:
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+@pytest.fixture
+def silent_port():
+    """只收不回的 UDP 端点：握手一直等不到 'C'，工作进程在此期间不发任何消息。"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    yield "%s:%d" % sock.getsockname()
+    sock.close()
+
+
+def test_job_completes(tmp_path):
+    data = make_image(100000)
+    path = tmp_path / "main.bin"
+    path.write_bytes(data)
+    sim = DeviceSimulator.udp(ready_interval=0.2).start()
+    endpoint = sim.endpoint
+    progress = []
+    try:
+        pool = ProcessFlashPool([endpoint], progress_callback=lambda job_id, p: progress.append((job_id, p)))
+        job_id = pool.submit(FlashJob("MAIN", str(path)))
+        results = pool.run()
+        deadline = time.monotonic() + 5.0
+        while not sim.sessions and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sim.stop()
+    assert len(results) == 1
+    result = results[0]
+    assert result["status"] == "success", result["reason"]
+    assert result["job_id"] == job_id and result["port"] == endpoint
+    assert sim.sessions[-1]["status"] == "success"
+    assert bytes(sim.sessions[-1]["files"][0]["data"]) == data
+    assert progress and progress[-1] == (job_id, 100)
+    assert pool.throughput(endpoint) > 0
+    assert not pool.workers
+
+
+def test_stalled_worker_fails_job(tmp_path, silent_port):
+    path = tmp_path / "main.bin"
+    path.write_bytes(make_image(1000))
+    pool = ProcessFlashPool([silent_port], stall_timeout=1.0)
+    pool.submit(FlashJob("MAIN", str(path)))
+    t_start = time.monotonic()
+    results = pool.run()
+    # 握手时限为 10 秒：远早于握手超时就因无消息被判定卡死
+    assert time.monotonic() - t_start < 8.0
+    assert len(results) == 1
+    assert results[0]["status"] == "fail"
+    assert "stalled" in results[0]["reason"]
+    assert not pool.workers
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_crashed_worker_fails_job(tmp_path, silent_port):
+    path = tmp_path / "main.bin"
+    path.write_bytes(make_image(1000))
+    pool = ProcessFlashPool([silent_port], stall_timeout=30.0)
+    pool.submit(FlashJob("MAIN", str(path)))
+
+    def kill_worker():
+        deadline = time.monotonic() + 10.0
+        while time.monotonic() < deadline:
+            worker = pool.workers.get(silent_port)
+            if worker is not None and worker.process.pid is not None:
+                time.sleep(0.5)
+                os.kill(worker.process.pid, signal.SIGKILL)
+                return
+            time.sleep(0.05)
+
+    killer = threading.Thread(target=kill_worker, daemon=True)
+    killer.start()
+    results = pool.run()
+    killer.join()
+    assert len(results) == 1
+    assert results[0]["status"] == "fail"
+    assert results[0]["reason"] == f"worker exited with code {-signal.SIGKILL}"
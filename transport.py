@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+传输层：为 YMODEM 提供 getc/putc 回调的串口与 UDP 实现。
+与 Tk 界面无关，可被 GUI（main.py）与无界面引擎（upgrade_tool.py）共同使用。
+接收侧经 rxbuffer.ResponseReader 缓冲：每次端口读取取走已到达的全部数据，协议层按字节从缓冲区取用。
+UdpHub 用一个 socket 同时服务多台网络设备：按来源地址把 datagram 分发到各设备的 UdpPeer。
+PortLeases 保证同一端口同一时刻只被一个持有者使用。
+"""
+
+import collections
+import logging
+import select
+import socket
+import threading
+
+from rxbuffer import ResponseReader
+
+
+class SerialTransport(object):
+    """
+    串口传输：封装一个 serial.Serial 对象，提供 YMODEM 所需的 getc/putc。
+    pyserial 在构造时才导入，纯 UDP 场景下无需安装。
+    """
+
+    def __init__(self, port, baudrate=115200, timeout=0.2):
+        """
+        打开串口（8N1，无流控）。
+        参数：
+          port: 串口名，例如 COM3 或 /dev/ttyUSB0。
+          baudrate: 波特率。
+          timeout: 单次 read 的超时（秒）。
+        """
+        import serial
+
+        self.log = logging.getLogger('YReporter')
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = serial.Serial(port=port,
+                                 baudrate=baudrate,
+                                 bytesize=8,
+                                 stopbits=1,
+                                 timeout=timeout,
+                                 xonxoff=False,
+                                 rtscts=False,
+                                 parity="N")
+        self.reader = ResponseReader(self._fill)
+
+    @classmethod
+    def from_serial(cls, ser):
+        """
+        包装一个已由调用方创建/管理的 serial.Serial 对象（例如 GUI 顶部的公共串口）。
+        close() 同样会关闭该对象，调用方如需保留请勿调用 close()。
+        """
+        self = cls.__new__(cls)
+        self.log = logging.getLogger('YReporter')
+        self.port = ser.port
+        self.baudrate = ser.baudrate
+        self.ser = ser
+        self.reader = ResponseReader(self._fill)
+        return self
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self.ser and self.ser.is_open)
+
+    def describe(self) -> str:
+        return f"{self.port}@{self.baudrate}"
+
+    def _fill(self, timeout):
+        """
+        取走串口中已到达的全部数据；没有数据时最多等待 timeout 秒（None 表示串口自身的读超时）。
+        能取得文件描述符时用 select 按 timeout 等待，否则退化为一次 read(1)（受串口读超时约束）。
+        """
+        ser = self.ser
+        waiting = ser.in_waiting
+        if waiting:
+            return ser.read(waiting)
+        if timeout == 0:
+            return None
+        if timeout is not None and hasattr(ser, 'fileno'):
+            try:
+                if not select.select([ser.fileno()], [], [], timeout)[0]:
+                    return None
+            except (OSError, ValueError, AttributeError):
+                pass
+        first = ser.read(1)
+        if not first:
+            return None
+        waiting = ser.in_waiting
+        return first + ser.read(waiting) if waiting else first
+
+    def getc(self, size):
+        """读取最多 size 字节；超时返回 None。"""
+        return self.reader.getc(size)
+
+    def pollc(self, size):
+        """非阻塞读取：只取已到达的数据（最多 size 字节），没有则返回 None。"""
+        return self.reader.pollc(size)
+
+    def read_token(self, timeout):
+        """等待下一个应答字节，最长 timeout 秒；超时返回 None。"""
+        return self.reader.read_token(timeout)
+
+    def putc(self, data):
+        """写出 bytes 数据。"""
+        self.ser.write(data)
+
+    def set_baudrate(self, baudrate):
+        """
+        切换波特率（链路调速用）：等待已写出的数据发完，丢弃旧速率下残留的接收数据后再切换。
+        """
+        try:
+            self.ser.flush()
+            self.ser.reset_input_buffer()
+        except (OSError, AttributeError):
+            pass
+        self.reader.clear()
+        self.ser.baudrate = baudrate
+        self.baudrate = baudrate
+
+    def close(self):
+        try:
+            if self.ser.is_open:
+                self.ser.close()
+        except Exception:
+            pass
+
+
+class UdpTransport(object):
+    """
+    UDP 传输：connect() 到设备端的 server_ip:server_port。
+    为适配 YMODEM 的“字节流”语义，收到的 datagram 整个放入接收缓冲，再按字节取用。
+    """
+
+    def __init__(self, server_ip, server_port, local_ip="", local_port=0, timeout=1.0):
+        """
+        创建 UDP socket，必要时 bind(local_ip, local_port)，然后 connect(server_ip, server_port)。
+        参数：
+          server_ip/server_port: 设备端地址。
+          local_ip/local_port: 本地绑定地址，留空/0 表示由系统选择。
+          timeout: 单次 recv 的超时（秒）。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.server = (server_ip, int(server_port))
+        self.reader = ResponseReader(self._fill)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.settimeout(timeout)
+            if local_ip or local_port:
+                sock.bind((local_ip, int(local_port)))
+            sock.connect(self.server)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+    @property
+    def is_open(self) -> bool:
+        return self.sock is not None
+
+    def describe(self) -> str:
+        return f"udp://{self.server[0]}:{self.server[1]}"
+
+    def _fill(self, timeout):
+        """
+        接收一个 datagram；没有数据时最多等待 timeout 秒（None 表示 socket 自身的超时）。
+        socket 超时/异常时返回 None，让上层继续轮询。
+        """
+        try:
+            if timeout is not None and not select.select([self.sock], [], [], timeout)[0]:
+                return None
+            return self.sock.recv(4096)
+        except socket.timeout:
+            return None
+        except Exception:
+            return None
+
+    def getc(self, size):
+        """读取最多 size 字节；超时返回 None。"""
+        return self.reader.getc(size)
+
+    def pollc(self, size):
+        """非阻塞读取：只取已到达的数据（最多 size 字节），没有则返回 None。"""
+        return self.reader.pollc(size)
+
+    def read_token(self, timeout):
+        """等待下一个应答字节，最长 timeout 秒；超时返回 None。"""
+        return self.reader.read_token(timeout)
+
+    def putc(self, data):
+        """发送 bytes 数据；发送异常吞掉，由上层根据 ACK/NAK 超时判断。"""
+        try:
+            self.sock.send(data)
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            if self.sock:
+                self.sock.close()
+        finally:
+            self.sock = None
+            self.reader.clear()
+
+
+class UdpHub(object):
+    """
+    UDP 集线器：绑定一个本地 socket，由一个接收线程按来源地址（ip, port）把 datagram 分发给各对端的接收队列。
+    每台设备经 open(ip, port) 得到一个 UdpPeer（与 UdpTransport 相同的 getc/pollc/read_token/putc 接口），
+    一整架网络设备可共用一个 socket 与一个线程同时升级。未登记对端发来的 datagram 丢弃并计入 unknown。
+
+        hub = UdpHub("0.0.0.0", 5000)
+        a = hub.open("192.168.1.201", 5000)
+        b = hub.open("192.168.1.202", 5000)
+        ...
+        hub.close()
+    """
+
+    QUEUE_LIMIT = 256  # 每个对端最多排队的 datagram 数，超过时丢弃最旧的
+
+    def __init__(self, local_ip="", local_port=0):
+        """
+        参数：
+          local_ip/local_port: 本地绑定地址，留空/0 表示由系统选择。
+        """
+        self.log = logging.getLogger('YReporter')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((local_ip, int(local_port)))
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self.local = sock.getsockname()
+        self.unknown = 0  # 来自未登记对端的 datagram 数
+        self._peers = {}  # (ip, port) -> UdpPeer
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._receive_loop, name=f"udp-hub-{self.local[1]}", daemon=True)
+        self._thread.start()
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed.is_set()
+
+    def describe(self) -> str:
+        return f"udp://{self.local[0]}:{self.local[1]} ({len(self._peers)} peers)"
+
+    @staticmethod
+    def _address(ip, port):
+        """解析为 recvfrom 返回的地址形式（主机名 → IPv4 地址），作为分发的键。"""
+        return socket.getaddrinfo(ip, int(port), socket.AF_INET, socket.SOCK_DGRAM)[0][4][:2]
+
+    def open(self, server_ip, server_port, timeout=1.0):
+        """
+        登记一台设备。
+        返回：
+          UdpPeer；同一对端已被占用或集线器已关闭时抛出 ValueError。
+        """
+        address = self._address(server_ip, server_port)
+        with self._lock:
+            if self._closed.is_set():
+                raise ValueError("UDP hub is closed")
+            if address in self._peers:
+                raise ValueError(f"udp://{address[0]}:{address[1]} is already in use")
+            peer = self._peers[address] = UdpPeer(self, address, timeout)
+        return peer
+
+    def _release(self, peer):
+        with self._lock:
+            if self._peers.get(peer.server) is peer:
+                del self._peers[peer.server]
+
+    def _receive_loop(self):
+        while not self._closed.is_set():
+            try:
+                if not select.select([self.sock], [], [], 0.5)[0]:
+                    continue
+                data, address = self.sock.recvfrom(65535)
+            except (OSError, ValueError):
+                if self._closed.is_set():
+                    return
+                continue
+            peer = self._peers.get(address[:2])
+            if peer is None:
+                self.unknown += 1
+                self.log.debug("udp hub: dropping %d bytes from unknown peer %s:%s", len(data), *address[:2])
+                continue
+            peer._deliver(data)
+
+    def sendto(self, data, address):
+        self.sock.sendto(data, address)
+
+    def close(self):
+        """关闭 socket 并注销全部对端（各 UdpPeer 随之失效）。"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        with self._lock:
+            peers = list(self._peers.values())
+            self._peers.clear()
+        for peer in peers:
+            peer._wake()
+        self._thread.join(timeout=2.0)
+        self.sock.close()
+
+
+class UdpPeer(object):
+    """
+    UdpHub 上的一台设备：只收该对端的 datagram，发送时 sendto 到该对端。由 UdpHub.open() 创建。
+    close() 只注销本对端，不关闭集线器的 socket。
+    """
+
+    def __init__(self, hub, server, timeout=1.0):
+        self.log = logging.getLogger('YReporter')
+        self.hub = hub
+        self.server = server
+        self.timeout = timeout
+        self.reader = ResponseReader(self._fill)
+        self._queue = collections.deque(maxlen=hub.QUEUE_LIMIT)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed and self.hub.is_open
+
+    def describe(self) -> str:
+        return f"udp://{self.server[0]}:{self.server[1]}"
+
+    def _deliver(self, data):
+        """接收线程调用：把 datagram 放入本对端的队列。"""
+        with self._cond:
+            self._queue.append(data)
+            self._cond.notify()
+
+    def _wake(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _fill(self, timeout):
+        """
+        取走队列中已到达的全部 datagram；没有数据时最多等待 timeout 秒（None 表示 open() 时给定的超时）。
+        """
+        with self._cond:
+            if not self._queue and timeout != 0:
+                self._cond.wait(self.timeout if timeout is None else timeout)
+            if not self._queue:
+                return None
+            data = b''.join(self._queue)
+            self._queue.clear()
+            return data
+
+    def getc(self, size):
+        """读取最多 size 字节；超时返回 None。"""
+        return self.reader.getc(size)
+
+    def pollc(self, size):
+        """非阻塞读取：只取已到达的数据（最多 size 字节），没有则返回 None。"""
+        return self.reader.pollc(size)
+
+    def read_token(self, timeout):
+        """等待下一个应答字节，最长 timeout 秒；超时返回 None。"""
+        return self.reader.read_token(timeout)
+
+    def putc(self, data):
+        """发送 bytes 数据；发送异常吞掉，由上层根据 ACK/NAK 超时判断。"""
+        if self._closed:
+            return
+        try:
+            self.hub.sendto(data, self.server)
+        except Exception:
+            pass
+
+    def close(self):
+        self.hub._release(self)
+        self._wake()
+        self.reader.clear()
+
+
+class PortLeases(object):
+    """
+    端口租约表：同一端口同一时刻只借给一个持有者（例如 GUI 的一行），避免两行在同一串口/UDP 上互相读走对方的 ACK/'C'。
+    公共连接（shared=True，例如 GUI 顶部的公共串口）只创建一个传输对象并缓存：所有使用它的行共用同一接收缓冲，
+    引用计数归零后仍保留，直到连接关闭时 discard()。独占端口（shared=False）在引用计数归零时移出租约表，由调用方关闭。
+
+        leases = PortLeases()
+        t = leases.acquire("/dev/ttyUSB0", "interface1", lambda: SerialTransport.from_serial(ser), shared=True)
+        leases.acquire("/dev/ttyUSB0", "interface2", ...)  # ValueError: 正被 interface1 使用
+        leases.release("/dev/ttyUSB0", "interface1")
+    """
+
+    def __init__(self):
+        self._entries = {}  # key -> {"transport", "shared", "owner", "refs"}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, owner, factory, shared=False):
+        """
+        借用端口 key。
+        参数：
+          key: 端口标识（串口名或 "udp://ip:port"）。
+          owner: 持有者标识，同一持有者可重复借用（引用计数 +1）。
+          factory: 无参可调用对象，首次借用时创建传输；抛出的异常原样传给调用方。
+          shared: True 表示公共连接，传输对象在归还后继续缓存。
+        返回：
+          传输对象；端口正被其他持有者使用，或已作为另一种（公共/独占）连接打开时抛出 ValueError。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["shared"] != shared:
+                    kind = "shared" if entry["shared"] else "dedicated"
+                    raise ValueError(f"{key} is already open as a {kind} connection")
+                if entry["refs"] and entry["owner"] != owner:
+                    raise ValueError(f"{key} is already in use by {entry['owner']}")
+            else:
+                entry = {"transport": factory(), "shared": shared, "owner": None, "refs": 0}
+                self._entries[key] = entry
+            entry["owner"] = owner
+            entry["refs"] += 1
+            return entry["transport"]
+
+    def release(self, key, owner):
+        """
+        归还端口 key（引用计数 -1）。非持有者的归还被忽略。
+        返回：
+          剩余引用数。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["owner"] != owner or not entry["refs"]:
+                return 0
+            entry["refs"] -= 1
+            if not entry["refs"]:
+                entry["owner"] = None
+                if not entry["shared"]:
+                    del self._entries[key]
+            return entry["refs"]
+
+    def owner(self, key):
+        """返回端口 key 的当前持有者，空闲时返回 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["owner"] if entry is not None else None
+
+    def discard(self, key):
+        """公共连接关闭时丢弃缓存的传输（不关闭它，底层连接由调用方管理）。"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def parse_udp_target(text):
+    """
+    解析 "ip:port" / "[ipv6]:port" 形式的目标地址。
+    返回：
+      (ip, port) 元组；格式非法时抛出 ValueError。
+    """
+    text = (text or "").strip()
+    if text.startswith("["):
+        ip, _, rest = text[1:].partition("]")
+        port = rest.lstrip(":")
+    else:
+        ip, _, port = text.rpartition(":")
+    if not ip or not port.isdigit() or not (1 <= int(port) <= 65535):
+        raise ValueError(f"invalid UDP target: {text!r}")
+    return ip, int(port)
+
+
+def open_port(spec, baudrate=115200, hub=None):
+    """
+    按端口描述打开传输："ip:port" 打开 UdpTransport（给出 hub 时为该 UdpHub 上的 UdpPeer），
+    其余按串口名打开 SerialTransport。
+    """
+    try:
+        ip, port = parse_udp_target(spec)
+    except ValueError:
+        return SerialTransport(spec, baudrate=baudrate)
+    return hub.open(ip, port) if hub is not None else UdpTransport(ip, port)
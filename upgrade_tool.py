@@ -0,0 +1,687 @@
+# -*- coding: utf-8 -*-
+"""
+无界面升级引擎与命令行入口。
+与 SerialFlasherApp 使用相同的升级指令表与 YMODEM.send，但不依赖 Tk，
+可在没有显示器的工位控制机上由脚本批量调用，例如：
+
+    python -m upgrade_tool flash --port /dev/ttyUSB0 --baud 115200 --iface MAIN --file main.bin
+    python -m upgrade_tool flash --udp 192.168.1.200:5000 --iface IMU --file imu.bin --json
+    python -m upgrade_tool batch --port /dev/ttyUSB0 --port /dev/ttyUSB1 --job MAIN=main.bin --job IMU=imu.bin
+    python -m upgrade_tool receive --port /dev/ttyUSB0 --out-dir dumps/
+    python -m upgrade_tool multicast --udp 192.168.1.201:5000 --udp 192.168.1.202:5000 --iface MAIN --file main.bin
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import delta as delta_ext
+import framing
+import linktune
+import resume as resume_ext
+from bootloader import HandshakePolicy, enter_bootloader
+from telemetry import PacketTelemetry
+from transport import SerialTransport, UdpHub, UdpTransport, parse_udp_target
+from ymodem import YMODEM
+
+# 接口名与进入升级模式的指令（顺序即 GUI 中的行顺序）
+INTERFACE_NAMES = ["MAIN", "IMU", "M1", "M2", "M3", "MP", "MOTOR", "JS_IMU"]
+UPGRADE_COMMANDS = ["$SH,UPGRADE,MAIN", "$SH,UPGRADE,IMU", "$SH,UPGRADE,M1", "$SH,UPGRADE,M2",
+                    "$SH,UPGRADE,M3", "$SH,UPGRADE,MP", "$JS,UPGRADE,MOTOR", "$JS,UPGRADE,IMU"]
+
+
+def upgrade_command_for(iface) -> str:
+    """
+    根据接口名（不区分大小写）查找升级指令。
+    返回：
+      str —— 例如 "$SH,UPGRADE,MAIN"；接口名未知时抛出 ValueError。
+    """
+    name = (iface or "").strip().upper()
+    try:
+        return UPGRADE_COMMANDS[INTERFACE_NAMES.index(name)]
+    except ValueError:
+        raise ValueError(f"unknown interface {iface!r}, expected one of {', '.join(INTERFACE_NAMES)}")
+
+
+class FlashSession(object):
+    """
+    单次升级会话：发送升级指令 → 等待握手 'C'（收到即开始，不固定等待）→ YMODEM 发送文件。
+    每个会话持有自己的 YMODEM 实例，cancel() 只影响本会话。
+    """
+
+    def __init__(self, transport, iface, file_path, mode='auto', handshake_policy=None,
+                 progress_callback=None, image_cache=framing.default_cache, telemetry=False, resume=None,
+                 compress=False, delta=None, tune=None, compress_fallback=True):
+        """
+        参数：
+          transport: 提供 getc/putc 的传输对象（SerialTransport/UdpTransport）。
+          iface: 接口名（MAIN/IMU/...），用于查找升级指令。
+          file_path: 固件文件路径。
+          mode: YMODEM 模式（auto / ymodem128 / ymodem / ymodem-g）；auto 先用 1K 块、出错率高时降为 128 字节块；
+                握手时设备回 'G' 则自动改用 ymodem-g。
+          handshake_policy: 握手时限与指令重发策略（bootloader.HandshakePolicy）；None 使用默认策略。
+          progress_callback: 进度回调 callback(percent:int)，可为 None。
+          image_cache: 预组帧镜像缓存（framing.FramedImageCache）；None 表示逐包读取文件并现场组帧。
+          telemetry: True 时逐包记录遥测（self.telemetry），run() 结果中附带会话汇总。
+          resume: 断点续传记录（resume.ResumeStore，True 为默认文件，字符串为文件路径）；None 表示不续传。
+                  失败/取消后记录最后被 ACK 的偏移，下次升级同一设备、同一镜像时在包0 中提议从该偏移继续。
+          compress: True 时以 zlib 压缩流发送（设备须支持压缩扩展，见 compression.py）；压缩传输不续传。
+          compress_fallback: 设备不确认压缩扩展时，True 重新握手后不压缩完整发送；
+                             False 直接失败（reason 为 "device does not support compressed transfer"）。
+          delta: 设备当前镜像（旧固件文件路径、块哈希清单 .json 路径或 delta.make_manifest() 的结果），
+                 提供时只发送变化的块（见 delta.py）；设备不接受时重新握手并完整发送。增量升级不续传。
+          tune: 链路调速（linktune.LinkTuner/TuneStore，True 为默认记录文件，字符串为文件路径）；None 表示不调速。
+                握手后请求设备切换到更高的波特率（仅串口），传输结束后恢复原波特率。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.transport = transport
+        self.iface = iface.strip().upper()
+        self.upgrade_command = upgrade_command_for(self.iface)
+        self.file_path = file_path
+        self.handshake_policy = handshake_policy
+        self.handshake_result = None
+        self.progress_callback = progress_callback
+        self.image_cache = image_cache
+        self.cancel_event = threading.Event()
+        self.telemetry = PacketTelemetry() if telemetry else None
+        self.compress = compress
+        self.compress_fallback = compress_fallback
+        self.delta = delta
+        self.resume_store = None if compress or delta else resume_ext.open_store(resume)
+        self.tuner = linktune.open_store(tune)
+        self.base_rate = getattr(transport, "baudrate", None)
+        self.ymodem_sender = YMODEM(transport.getc, transport.putc, mode=mode,
+                                    pollc=getattr(transport, 'pollc', None),
+                                    readtoken=getattr(transport, 'read_token', None),
+                                    telemetry=self.telemetry)
+
+    def cancel(self):
+        """请求取消：置位本会话事件并通知 YMODEM（flash_status=2）。"""
+        self.cancel_event.set()
+        self.ymodem_sender.update_flash_status(2)
+
+    def _cancelled(self) -> bool:
+        return self.cancel_event.is_set() or self.ymodem_sender._check_cancel()
+
+    def handshake(self) -> bool:
+        """
+        发送升级指令并等待设备进入 YMODEM 接收（回 'C'，支持流式的设备回 'G'）。
+        设备回 'G' 时本会话自动切换为 ymodem-g 流式发送。完整结果（含重发次数与耗时）保存在 handshake_result。
+        返回：
+          True 表示收到 'C'/'G'；False 表示超时或被取消。
+        """
+        self.handshake_result = enter_bootloader(self.transport.getc, self.transport.putc, self.upgrade_command,
+                                                 self.handshake_policy, cancelled=self._cancelled, label=self.iface,
+                                                 read_token=self.transport.read_token)
+        if self.handshake_result["ready"] == b'G':
+            self.log.info("<<< %s received 'G', using ymodem-g", self.iface)
+            self.ymodem_sender.mode = 'ymodem-g'
+        return self.handshake_result["status"] == "ready"
+
+    def run(self) -> dict:
+        """
+        执行完整升级流程并返回结构化结果。
+        返回：
+          dict，字段：
+            iface / port / file / size: 基本信息
+            status: "success" | "fail" | "cancel"
+            reason: 失败原因（成功时为 None）
+            timings: {"handshake": 秒, "transfer": 秒, "total": 秒,
+                      "first_byte": 指令发出到收到首字节, "ready": 指令发出到收到 'C'/'G',
+                      "header": 包0 发出到 ACK+'C', "data": 数据包阶段, "finish": EOT 与结束包}
+            resends: 握手阶段升级指令的重发次数
+            throughput: 传输阶段的平均速率（字节/秒）
+            block_counts: 各块长发送的数据包数量 {1024: n, 128: m}
+            telemetry: 逐包遥测汇总（telemetry.PacketTelemetry.summary()，仅在启用遥测时存在）
+            resumed_from: 续传起始偏移（完整发送为 0）
+            wire_size: 线上发送的文件字节数（压缩/增量传输时为实际发送的流长度，否则等于 size）
+            delta: 增量升级统计 {"changed_blocks", "total_blocks", "block_size", "stream_size",
+                   "status": "sent" | "rejected"（设备不接受，已改为完整发送）| "full"（变化过多，完整发送）}；
+                   未启用增量时为 None
+            compression: 压缩传输 "sent" | "rejected"（设备不支持压缩扩展：已改为不压缩发送，或按
+                         compress_fallback=False 失败）；未启用压缩时为 None
+            link: 链路调速结果（linktune.LinkTuner.tune() 的返回值）；未启用调速时为 None
+        """
+        result = {
+            "iface": self.iface,
+            "port": self.transport.describe(),
+            "file": self.file_path,
+            "size": 0,
+            "status": "fail",
+            "reason": None,
+            "timings": {"handshake": 0.0, "transfer": 0.0, "total": 0.0},
+            "resends": 0,
+            "throughput": 0.0,
+            "block_counts": {},
+            "resumed_from": 0,
+            "wire_size": 0,
+            "delta": None,
+            "compression": "sent" if self.compress else None,
+            "link": None,
+        }
+        t_start = time.perf_counter()
+        try:
+            file_size = os.path.getsize(self.file_path)
+        except OSError as e:
+            result["reason"] = f"file error: {e}"
+            return result
+        result["size"] = file_size
+        manifest = None
+        if self.delta is not None:
+            try:
+                manifest = self.delta if isinstance(self.delta, dict) else delta_ext.load_manifest(self.delta)
+            except (OSError, ValueError) as e:
+                result["reason"] = f"delta base error: {e}"
+                return result
+
+        ok = self.handshake()
+        t_handshake = time.perf_counter()
+        result["timings"]["handshake"] = t_handshake - t_start
+        result["timings"].update(self.handshake_result["timings"])
+        result["resends"] = self.handshake_result["resends"]
+        if not ok:
+            if self._cancelled():
+                result["status"] = "cancel"
+                result["reason"] = "canceled before transfer"
+            else:
+                result["reason"] = "handshake timeout"
+            result["timings"]["total"] = t_handshake - t_start
+            return result
+        try:
+            return self._run_transfer(result, file_size, manifest, t_start, t_handshake)
+        finally:
+            self._restore_rate()
+
+    def _tune(self, result):
+        """握手之后协商波特率，结果记入 result["link"]（多次握手时保留最后一次）。"""
+        if self.tuner is None or self._cancelled():
+            return
+        self.link_key = linktune.link_key(self.transport)
+        result["link"] = self.tuner.tune(self.transport, self.link_key, self.base_rate, cancelled=self._cancelled)
+        result["timings"]["tune"] = result["timings"].get("tune", 0.0) + result["link"]["elapsed"]
+
+    def _restore_rate(self):
+        """恢复调速前的波特率（设备升级完成后重启，以默认波特率运行）。"""
+        if self.tuner is not None and self.base_rate and getattr(self.transport, "baudrate", None) != self.base_rate:
+            self.transport.set_baudrate(self.base_rate)
+
+    def _run_transfer(self, result, file_size, manifest, t_start, t_handshake):
+        """run() 的传输阶段：握手成功之后调用（调速 → 续传/增量准备 → 发送 → 汇总结果）。"""
+        self._tune(result)
+        offer = None
+        if self.resume_store is not None:
+            resume_key = resume_ext.device_key(self.transport.describe(), self.iface)
+            digest = resume_ext.file_digest(self.file_path)
+            offer = self.resume_store.offer(resume_key, digest, file_size)
+        image = None
+        if manifest is not None:
+            with open(self.file_path, 'rb') as f:
+                image = delta_ext.frame_delta(f.read(), manifest, os.path.basename(self.file_path),
+                                              framing.packet_size_for(self.ymodem_sender.mode), compress=self.compress)
+            if image is not None:
+                result["delta"] = dict(image.delta, status="sent")
+            else:
+                result["delta"] = {"status": "full"}
+        res = self._transfer(file_size, image, offer)
+        # 设备不接受增量（不支持或当前镜像与基准不符）或压缩：重新进入升级模式后完整/不压缩发送。
+        # 压缩的增量流被拒时先退回压缩的完整镜像，仍被拒再不压缩发送，最多重试两次
+        for _ in range(2):
+            sender = self.ymodem_sender
+            if res is not False or self.cancel_event.is_set():
+                break
+            if sender.delta_rejected:
+                self.log.warning("<<< %s rejected the delta, retrying with the full image", self.iface)
+                result["delta"]["status"] = "rejected"
+            elif sender.compress_rejected:
+                result["compression"] = "rejected"
+                if not self.compress_fallback:
+                    break
+                self.log.warning("<<< %s does not support compressed transfer, retrying uncompressed", self.iface)
+                self.compress = False
+            else:
+                break
+            sender.update_flash_status(0)  # 失败时置的 2 会被当作取消请求
+            self._restore_rate()
+            if not self.handshake():
+                break
+            self._tune(result)
+            res = self._transfer(file_size, None, None)
+        t_end = time.perf_counter()
+        result["resumed_from"] = self.ymodem_sender.resume_offset
+        result["wire_size"] = self.ymodem_sender.wire_size
+        # 包0 未被应答时不知道设备的状态，保留原有记录
+        if self.resume_store is not None and "header" in self.ymodem_sender.timings:
+            self.resume_store.record(resume_key, digest, file_size, self.ymodem_sender.acked_offset, ok=res is True)
+        result["block_counts"] = dict(self.ymodem_sender.block_counts)
+        result["timings"].update(self.ymodem_sender.timings)
+        result["timings"]["transfer"] = t_end - t_handshake
+        result["timings"]["total"] = t_end - t_start
+        if self.telemetry is not None:
+            result["telemetry"] = self.telemetry.summary()
+        link = result["link"]
+        if res is False and link is not None and link["baudrate"] != link["base"]:
+            # 在调速后的速率下传输失败：记下该速率，下次从更低的速率开始
+            self.tuner.record_failure(self.link_key, link["baudrate"])
+
+        if res is True:
+            result["status"] = "success"
+            if t_end > t_handshake:
+                result["throughput"] = (file_size - result["resumed_from"]) / (t_end - t_handshake)
+        elif res == "cancel":
+            result["status"] = "cancel"
+            result["reason"] = "canceled during transfer"
+        elif result["compression"] == "rejected" and not self.compress_fallback:
+            result["reason"] = "device does not support compressed transfer"
+        else:
+            result["reason"] = "ymodem transfer failed"
+        return result
+
+    def _transfer(self, file_size, image, offer):
+        """
+        发送一次：image 为 None 时取缓存中的完整镜像（未启用缓存则逐包读取文件）。返回 YMODEM.send() 的结果。
+        握手已收到的就绪字节传给 send()，设备正在等待包0，不再等它的下一个周期 'C'。
+        """
+        ready = self.handshake_result["ready"]
+        if image is None and self.image_cache is not None:
+            image = self.image_cache.get(self.file_path, framing.packet_size_for(self.ymodem_sender.mode),
+                                         compress=self.compress)
+        if image is not None:
+            return self.ymodem_sender.send(None, image.file_name, image.file_size,
+                                           callback=self.progress_callback, image=image, resume=offer, ready=ready)
+        with open(self.file_path, 'rb') as file_stream:
+            return self.ymodem_sender.send(file_stream, os.path.basename(self.file_path), file_size,
+                                           callback=self.progress_callback, resume=offer, compress=self.compress,
+                                           ready=ready)
+
+
+class ReceiveSession(object):
+    """
+    从设备拉取文件（崩溃转储、标定表、日志等）：可选地先发送一条指令，然后以 YMODEM 接收端身份接收（支持批量）。
+    """
+
+    def __init__(self, transport, out_dir, command=None, mode='ymodem', progress_callback=None, timeout=10):
+        """
+        参数：
+          transport: 提供 getc/putc 的传输对象。
+          out_dir: 保存目录。
+          command: 接收前发送给设备的指令（不含 "\r\n"）；None 表示由设备自行开始发送。
+          mode: 'ymodem-g' 时按流式接收（就绪字节 'G'），其它值按 CRC 模式接收。
+          progress_callback: 进度回调 callback(percent:int)，按当前文件计算。
+          timeout: 等待下一个包的时限（秒）。
+        """
+        self.log = logging.getLogger('YReporter')
+        self.transport = transport
+        self.out_dir = out_dir
+        self.command = command
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+        self.receiver = YMODEM(transport.getc, transport.putc, mode=mode,
+                               pollc=getattr(transport, 'pollc', None),
+                               readtoken=getattr(transport, 'read_token', None))
+
+    def cancel(self):
+        self.receiver.update_flash_status(2)
+
+    def run(self) -> dict:
+        """
+        返回：
+          YMODEM.recv() 的结果，另加 port 字段。
+        """
+        if self.command:
+            self.transport.putc((self.command + "\r\n").encode('UTF-8'))
+            self.log.info(">>> send instruction: '%s'", self.command)
+        result = self.receiver.recv(self.out_dir, timeout=self.timeout, callback=self.progress_callback)
+        result["port"] = self.transport.describe()
+        return result
+
+
+def open_transport(port=None, baudrate=115200, udp=None, local=None):
+    """
+    按命令行参数打开传输：udp 优先，否则打开串口。
+    参数：
+      port: 串口名。
+      baudrate: 串口波特率。
+      udp: "ip:port" 形式的设备地址。
+      local: 可选的本地绑定地址 "ip:port"。
+    """
+    if udp:
+        ip, udp_port = parse_udp_target(udp)
+        lip, lpt = parse_udp_target(local) if local else ("", 0)
+        return UdpTransport(ip, udp_port, local_ip=lip, local_port=lpt)
+    if not port:
+        raise ValueError("either --port or --udp is required")
+    return SerialTransport(port, baudrate=baudrate)
+
+
+def flash(port=None, iface="MAIN", file_path="", baudrate=115200, udp=None, mode='auto', **kwargs) -> dict:
+    """
+    便捷函数：打开传输、执行一次升级并关闭传输。
+    额外关键字参数透传给 FlashSession（handshake_policy/progress_callback/...）。
+    """
+    transport = open_transport(port, baudrate=baudrate, udp=udp, local=kwargs.pop("local", None))
+    try:
+        return FlashSession(transport, iface, file_path, mode=mode, **kwargs).run()
+    finally:
+        transport.close()
+
+
+def _add_handshake_args(parser):
+    parser.add_argument("--handshake-timeout", type=float, default=10.0,
+                        help="seconds to wait for the device's 'C' after the upgrade command (default 10)")
+    parser.add_argument("--resend-interval", type=float, default=3.0,
+                        help="re-send the upgrade command after this many seconds without 'C' (default 3)")
+    parser.add_argument("--max-resends", type=int, default=2, help="upgrade command re-sends (default 2, 0 = never)")
+
+
+def _add_resume_arg(parser):
+    parser.add_argument("--resume", nargs="?", const=True, default=None, metavar="STORE",
+                        help="remember the last acknowledged offset after a failure and offer to resume from it "
+                             "in packet 0 (devices without the extension get a full send); "
+                             f"STORE defaults to {resume_ext.DEFAULT_PATH}")
+
+
+def _add_compress_arg(parser):
+    parser.add_argument("--compress", action="store_true",
+                        help="send the image as a zlib stream; the device must confirm the extension with 'Z' "
+                             "(plain bootloaders are never flashed with compressed data: they get a new handshake "
+                             "and the uncompressed image)")
+    parser.add_argument("--compress-strict", action="store_true",
+                        help="with --compress, fail devices that do not support compressed transfer "
+                             "instead of sending them the uncompressed image")
+
+
+def _add_delta_arg(parser):
+    parser.add_argument("--delta", metavar="BASE",
+                        help="send only the blocks that differ from the device's current image: BASE is that image "
+                             "or its block manifest (.json, see 'python -m delta manifest'); devices that do not "
+                             "accept the delta get a full send")
+
+
+def _add_tune_arg(parser):
+    parser.add_argument("--tune", nargs="?", const=True, default=None, metavar="STORE",
+                        help="after the handshake ask the device to switch to the fastest baud rate the link passes "
+                             "a round-trip test at, stepping down on errors (serial only; devices without the "
+                             f"extension stay at --baud); best rates per adapter are kept in STORE "
+                             f"(default {linktune.DEFAULT_PATH})")
+
+
+def _handshake_policy(args):
+    return HandshakePolicy(args.handshake_timeout, args.resend_interval, args.max_resends)
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="upgrade_tool", description="8-port YMODEM upgrade tool (headless)")
+    sub = parser.add_subparsers(dest="command")
+
+    p_flash = sub.add_parser("flash", help="flash one interface")
+    p_flash.add_argument("--port", help="serial port, e.g. COM3 or /dev/ttyUSB0")
+    p_flash.add_argument("--baud", type=int, default=115200, help="serial baud rate (default 115200)")
+    p_flash.add_argument("--udp", help="device UDP endpoint ip:port (instead of --port)")
+    p_flash.add_argument("--local", help="local UDP bind address ip:port")
+    p_flash.add_argument("--iface", required=True, help="interface: " + ", ".join(INTERFACE_NAMES))
+    p_flash.add_argument("--file", required=True, help="firmware image")
+    p_flash.add_argument("--mode", default="auto", choices=["auto", "ymodem128", "ymodem", "ymodem-g"],
+                         help="YMODEM block mode: auto starts with 1K blocks and falls back to 128 on errors "
+                              "(ymodem-g is also chosen automatically when the device offers 'G')")
+    _add_handshake_args(p_flash)
+    _add_resume_arg(p_flash)
+    _add_compress_arg(p_flash)
+    _add_delta_arg(p_flash)
+    _add_tune_arg(p_flash)
+    p_flash.add_argument("--telemetry", metavar="FILE",
+                         help="record per-packet telemetry and write it to FILE (.json: summary + packets, else CSV)")
+    p_flash.add_argument("--json", action="store_true", help="print the result as one JSON line")
+    p_flash.add_argument("-v", "--verbose", action="store_true", help="protocol debug logging")
+
+    p_batch = sub.add_parser("batch", help="run a queue of flash jobs over several ports")
+    p_batch.add_argument("--port", action="append", required=True,
+                         help="serial port or UDP ip:port; repeat for every port")
+    p_batch.add_argument("--job", action="append", required=True,
+                         help="IFACE=FILE or IFACE=FILE@PORT; repeat for every job")
+    p_batch.add_argument("--concurrency", type=int, default=None, help="max jobs in flight (default: all ports)")
+    p_batch.add_argument("--baud", type=int, default=115200, help="serial baud rate (default 115200)")
+    p_batch.add_argument("--mode", default="auto", choices=["auto", "ymodem128", "ymodem", "ymodem-g"],
+                         help="YMODEM block mode: auto starts with 1K blocks and falls back to 128 on errors "
+                              "(ymodem-g is also chosen automatically when the device offers 'G')")
+    _add_handshake_args(p_batch)
+    p_batch.add_argument("--engine", default="threads", choices=["threads", "async", "processes"],
+                         help="threads: one thread per port; async: one asyncio event loop for all ports; "
+                              "processes: one worker process per port")
+    _add_resume_arg(p_batch)
+    _add_compress_arg(p_batch)
+    _add_delta_arg(p_batch)
+    _add_tune_arg(p_batch)
+    p_batch.add_argument("--udp-hub", nargs="?", const="", metavar="LOCAL",
+                         help="send to all UDP ports through one socket (bound to LOCAL ip:port if given) "
+                              "(threads engine; replies are routed by source address)")
+    p_batch.add_argument("--telemetry", action="store_true",
+                         help="record per-packet telemetry and add its summary to every result")
+    p_batch.add_argument("--json", action="store_true", help="print every result as one JSON line")
+    p_batch.add_argument("-v", "--verbose", action="store_true", help="protocol debug logging")
+
+    p_recv = sub.add_parser("receive", help="pull files from a device over YMODEM")
+    p_recv.add_argument("--port", help="serial port, e.g. COM3 or /dev/ttyUSB0")
+    p_recv.add_argument("--baud", type=int, default=115200, help="serial baud rate (default 115200)")
+    p_recv.add_argument("--udp", help="device UDP endpoint ip:port (instead of --port)")
+    p_recv.add_argument("--local", help="local UDP bind address ip:port")
+    p_recv.add_argument("--out-dir", required=True, help="directory for the received files")
+    p_recv.add_argument("--command", help="instruction sent to the device first, e.g. a dump request")
+    p_recv.add_argument("--streaming", action="store_true", help="receive as YMODEM-G ('G' instead of 'C')")
+    p_recv.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for each packet (default 10)")
+    p_recv.add_argument("--json", action="store_true", help="print the result as one JSON line")
+    p_recv.add_argument("-v", "--verbose", action="store_true", help="protocol debug logging")
+
+    p_mcast = sub.add_parser("multicast", help="flash the same image to many UDP devices with one multicast stream")
+    p_mcast.add_argument("--udp", action="append", required=True, help="device UDP endpoint ip:port; repeat per device")
+    p_mcast.add_argument("--iface", required=True, help="interface: " + ", ".join(INTERFACE_NAMES))
+    p_mcast.add_argument("--file", required=True, help="firmware image")
+    p_mcast.add_argument("--group", default="239.255.42.99:5099", help="multicast group ip:port (default %(default)s)")
+    p_mcast.add_argument("--local", help="local UDP bind address ip:port (its ip is also the multicast interface)")
+    p_mcast.add_argument("--interface", help="local interface address for sending multicast")
+    p_mcast.add_argument("--ttl", type=int, default=1, help="multicast TTL (default 1: stay on the segment)")
+    p_mcast.add_argument("--rate", type=float, default=1024 * 1024,
+                         help="multicast send rate limit in bytes/s (default 1 MiB/s, 0 = unlimited)")
+    p_mcast.add_argument("--rounds", type=int, default=8, help="max repair rounds (default 8)")
+    _add_handshake_args(p_mcast)
+    p_mcast.add_argument("--json", action="store_true", help="print the result as one JSON line")
+    p_mcast.add_argument("-v", "--verbose", action="store_true", help="protocol debug logging")
+
+    sub.add_parser("ifaces", help="list interfaces and their upgrade commands")
+    return parser
+
+
+def parse_job_spec(text):
+    """
+    解析批量任务描述 "IFACE=FILE" 或 "IFACE=FILE@PORT"。
+    返回：
+      (iface, file_path, port|None)；格式非法时抛出 ValueError。
+    """
+    iface, sep, rest = (text or "").partition("=")
+    if not sep or not iface or not rest:
+        raise ValueError(f"invalid job {text!r}, expected IFACE=FILE[@PORT]")
+    file_path, _, port = rest.rpartition("@") if "@" in rest else (rest, "", "")
+    upgrade_command_for(iface)
+    return iface, file_path, port or None
+
+
+def _print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+        return
+    print(f"{result.get('job_id', result['iface'])}: {result['iface']} {result['status']}"
+          + (f" ({result['reason']})" if result.get('reason') else "")
+          + (f" resumed at {result['resumed_from']}" if result.get('resumed_from') else "")
+          + (f" delta {result['delta']['changed_blocks']}/{result['delta']['total_blocks']} blocks"
+             if (result.get('delta') or {}).get('status') == "sent" else "")
+          + (f" at {result['link']['baudrate']} baud"
+             if result.get('link') and result['link']['baudrate'] != result['link']['base'] else "")
+          + (f" ({result['size']} bytes as {result['wire_size']} on the wire)"
+             if result.get('wire_size') and result['wire_size'] != result['size'] else "")
+          + (f" in {result['timings']['total']:.2f}s" if 'timings' in result else ""), flush=True)
+
+
+def _run_batch(args) -> int:
+    from scheduler import FlashJob, FlashScheduler
+
+    if args.engine == "async":
+        import asyncio
+        from async_ymodem import AsyncFlashScheduler as scheduler_class
+    elif args.engine == "processes":
+        from workers import ProcessFlashPool as scheduler_class
+    else:
+        scheduler_class = FlashScheduler
+    hub = None
+    try:
+        jobs = [FlashJob(*parse_job_spec(spec)) for spec in args.job]
+        extra = {}
+        if args.udp_hub is not None:
+            if args.engine != "threads":
+                raise ValueError("--udp-hub requires --engine threads")
+            extra["udp_hub"] = hub = UdpHub(*(parse_udp_target(args.udp_hub) if args.udp_hub else ("", 0)))
+        session_kwargs = {"mode": args.mode, "handshake_policy": _handshake_policy(args),
+                          "telemetry": args.telemetry, "resume": args.resume,
+                          "compress": args.compress, "compress_fallback": not args.compress_strict,
+                          "delta": args.delta}
+        if args.tune:
+            if args.engine == "async":
+                raise ValueError("--tune requires --engine threads or processes")
+            session_kwargs["tune"] = args.tune
+        sched = scheduler_class(args.port, max_concurrency=args.concurrency, baudrate=args.baud,
+                               session_kwargs=session_kwargs,
+                               result_callback=lambda r: _print_result(r, args.json), **extra)
+        for job in jobs:
+            sched.submit(job)
+    except Exception as e:
+        if hub is not None:
+            hub.close()
+        print(f"upgrade_tool: {e}", file=sys.stderr)
+        return 2
+
+    try:
+        results = asyncio.run(sched.run()) if args.engine == "async" else sched.run()
+    except KeyboardInterrupt:
+        sched.cancel_all()
+        return 130
+    finally:
+        if hub is not None:
+            hub.close()
+    return 0 if all(r["status"] == "success" for r in results) else 1
+
+
+def _run_receive(args) -> int:
+    try:
+        transport = open_transport(args.port, baudrate=args.baud, udp=args.udp, local=args.local)
+    except Exception as e:
+        print(f"upgrade_tool: {e}", file=sys.stderr)
+        return 2
+    session = ReceiveSession(transport, args.out_dir, command=args.command,
+                             mode='ymodem-g' if args.streaming else 'ymodem', timeout=args.timeout)
+    try:
+        result = session.run()
+    except KeyboardInterrupt:
+        session.cancel()
+        result = {"status": "cancel", "reason": "interrupted", "files": []}
+    finally:
+        transport.close()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+    else:
+        for f in result["files"]:
+            print(f"{f['path']}: {f['received']} bytes", flush=True)
+        print(f"receive {result['status']}" + (f" ({result['reason']})" if result.get('reason') else "")
+              + (f", {result['throughput'] / 1024:.1f} KiB/s" if result.get('throughput') else ""), flush=True)
+    return {"success": 0, "cancel": 130}.get(result["status"], 1)
+
+
+def _run_multicast(args) -> int:
+    from multicast import MulticastSession
+
+    hub = None
+    try:
+        hub = UdpHub(*(parse_udp_target(args.local) if args.local else ("", 0)))
+        session = MulticastSession(hub, args.udp, args.iface, args.file, group=parse_udp_target(args.group),
+                                   interface_ip=args.interface, ttl=args.ttl, rate=args.rate, max_rounds=args.rounds,
+                                   handshake_policy=_handshake_policy(args))
+    except Exception as e:
+        if hub is not None:
+            hub.close()
+        print(f"upgrade_tool: {e}", file=sys.stderr)
+        return 2
+    try:
+        result = session.run()
+    except KeyboardInterrupt:
+        session.cancel()
+        return 130
+    finally:
+        hub.close()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+    else:
+        for device in result["devices"]:
+            print(f"{device['target']}: {device['status']} ({device['mode']}"
+                  + (f", {device['repaired']} packets repaired" if device['repaired'] else "") + ")"
+                  + (f" {device['reason']}" if device['reason'] else ""), flush=True)
+        print(f"multicast {result['status']}: {result['multicast_bytes']} bytes multicast, "
+              f"{result['repair_bytes']} bytes repaired in {result['rounds']} rounds"
+              + (f", {result['timings']['total']:.2f}s" if 'total' in result['timings'] else ""), flush=True)
+    return {"success": 0, "cancel": 130}.get(result["status"], 1)
+
+
+def main(argv=None) -> int:
+    """
+    命令行入口。
+    返回码：0=成功，1=失败，2=参数错误，130=取消（Ctrl+C）。
+    """
+    args = _build_parser().parse_args(argv)
+    if args.command == "ifaces":
+        for name, cmd in zip(INTERFACE_NAMES, UPGRADE_COMMANDS):
+            print(f"{name}\t{cmd}")
+        return 0
+    if args.command == "batch":
+        logging.getLogger('YReporter').setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        return _run_batch(args)
+    if args.command == "receive":
+        logging.getLogger('YReporter').setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        return _run_receive(args)
+    if args.command == "multicast":
+        logging.getLogger('YReporter').setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        return _run_multicast(args)
+    if args.command != "flash":
+        _build_parser().print_help()
+        return 2
+
+    logging.getLogger('YReporter').setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    try:
+        upgrade_command_for(args.iface)
+        policy = _handshake_policy(args)
+        transport = open_transport(args.port, baudrate=args.baud, udp=args.udp, local=args.local)
+    except Exception as e:
+        print(f"upgrade_tool: {e}", file=sys.stderr)
+        return 2
+
+    session = FlashSession(transport, args.iface, args.file, mode=args.mode, handshake_policy=policy,
+                           telemetry=bool(args.telemetry), resume=args.resume, compress=args.compress,
+                           compress_fallback=not args.compress_strict, delta=args.delta, tune=args.tune)
+    try:
+        result = session.run()
+    except KeyboardInterrupt:
+        session.cancel()
+        result = {"iface": session.iface, "status": "cancel", "reason": "interrupted"}
+    finally:
+        transport.close()
+    if args.telemetry and session.telemetry.count:
+        try:
+            session.telemetry.export(args.telemetry)
+        except OSError as e:
+            print(f"upgrade_tool: cannot write telemetry: {e}", file=sys.stderr)
+
+    _print_result(result, args.json)
+    return {"success": 0, "cancel": 130}.get(result["status"], 1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+多进程升级：每个端口由独立的工作进程执行升级（进程自己打开传输、创建 FlashSession/YMODEM），
+主进程只负责调度，并经由管道接收紧凑的进度/结果消息。
+- CRC、逐包日志与回调都在各自进程中执行，不再争用同一个 GIL；
+- 某个会话卡死或进程崩溃只影响该端口：主进程判定该任务失败并在需要时重启工作进程。
+
+管道消息（均为元组）：
+  主 → 工：("job", job_id, iface, file_path, session_kwargs) / ("cancel", job_id) / None（退出）
+  工 → 主：("p", job_id, percent) / ("r", job_id, result)
+"""
+
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from multiprocessing.connection import wait
+
+from scheduler import PortThroughput
+
+# 工作进程超过该时间（秒）没有任何消息即视为卡死：终止进程并判定任务失败
+DEFAULT_STALL_TIMEOUT = 60.0
+
+
+def _worker_main(port, baudrate, conn, log_level):
+    """
+    工作进程主体：循环接收任务并在本进程中执行；传输在多个任务间复用。
+    SIGINT 被忽略，由主进程通过 ("cancel", job_id) 统一取消。
+    """
+    from transport import open_port
+    from upgrade_tool import FlashSession
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 逐包日志都经由 YReporter，按 log_level 过滤；不再重定向 stdout（进程内其它输出照常可见）
+    logging.getLogger('YReporter').setLevel(log_level)
+    send_lock = threading.Lock()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    transport = None
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                return
+            if msg is None:
+                return
+            if msg[0] != "job":
+                continue
+            _, job_id, iface, file_path, session_kwargs = msg
+            try:
+                if transport is None or not transport.is_open:
+                    transport = open_port(port, baudrate=baudrate)
+            except Exception as e:
+                send(("r", job_id, {"iface": iface, "file": file_path, "status": "fail",
+                                    "reason": f"port error: {e}"}))
+                continue
+
+            last = [-1]
+
+            def progress(percent, job_id=job_id):
+                if percent != last[0]:
+                    last[0] = percent
+                    send(("p", job_id, percent))
+
+            session = FlashSession(transport, iface, file_path, progress_callback=progress, **session_kwargs)
+            holder = {}
+
+            def run_session():
+                try:
+                    holder["result"] = session.run()
+                except Exception as e:
+                    holder["result"] = {"iface": iface, "file": file_path, "status": "fail",
+                                        "reason": f"error: {e}"}
+
+            runner = threading.Thread(target=run_session, daemon=True)
+            runner.start()
+            # 会话运行期间仍监听管道，以便即时取消
+            while runner.is_alive():
+                if conn.poll(0.1):
+                    try:
+                        msg = conn.recv()
+                    except EOFError:
+                        session.cancel()
+                        runner.join()
+                        return
+                    if msg is None or (msg[0] == "cancel" and msg[1] == job_id):
+                        session.cancel()
+            send(("r", job_id, holder["result"]))
+    finally:
+        if transport is not None:
+            transport.close()
+
+
+class _Worker(object):
+    """主进程中对一个工作进程的记录。"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.job = None
+        self.last_seen = time.monotonic()
+
+
+class ProcessFlashPool(object):
+    """
+    以工作进程执行升级任务（接口与 scheduler.FlashScheduler 相同）。
+    用法：
+        pool = ProcessFlashPool(["/dev/ttyUSB0", "/dev/ttyUSB1"], max_concurrency=2)
+        pool.submit(FlashJob("MAIN", "main.bin"))
+        results = pool.run()
+    """
+
+    def __init__(self, ports, max_concurrency=None, baudrate=115200, session_kwargs=None,
+                 result_callback=None, progress_callback=None, stall_timeout=DEFAULT_STALL_TIMEOUT,
+                 log_level=logging.WARNING):
+        """
+        参数：
+          ports/max_concurrency/baudrate/session_kwargs/result_callback: 同 FlashScheduler。
+          progress_callback: 进度回调 progress_callback(job_id, percent)，在调用 run() 的线程中执行。
+          stall_timeout: 工作进程无消息超过该时间即判定卡死（秒）。
+          log_level: 工作进程中 'YReporter' 日志的级别。
+        """
+        if not ports:
+            raise ValueError("at least one port is required")
+        self.log = logging.getLogger('YReporter')
+        self.ports = list(ports)
+        self.max_concurrency = max(1, min(max_concurrency or len(self.ports), len(self.ports)))
+        self.baudrate = baudrate
+        self.session_kwargs = dict(session_kwargs or {})
+        self.result_callback = result_callback
+        self.progress_callback = progress_callback
+        self.stall_timeout = stall_timeout
+        self.log_level = log_level
+        # spawn：工作进程不继承主进程的线程与 Tk 状态
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._pending = []
+        self._next_id = 1
+        self._stopping = False
+        self._throughput = PortThroughput(self.ports)
+        self.workers = {}  # port -> _Worker
+        self.results = []
+
+    def submit(self, job) -> str:
+        """加入一个任务（scheduler.FlashJob），返回其任务 ID。"""
+        if job.port is not None and job.port not in self.ports:
+            raise ValueError(f"job port {job.port!r} is not managed by this pool")
+        with self._lock:
+            if job.job_id is None:
+                job.job_id = f"job{self._next_id}"
+                self._next_id += 1
+            self._pending.append(job)
+        return job.job_id
+
+    def throughput(self, port) -> float:
+        return self._throughput.get(port)
+
+    def cancel(self, job_id) -> bool:
+        """取消一个任务：等待中的移出队列，执行中的通知其工作进程。"""
+        with self._lock:
+            for job in self._pending:
+                if job.job_id == job_id:
+                    self._pending.remove(job)
+                    return True
+            for worker in self.workers.values():
+                if worker.job is not None and worker.job.job_id == job_id:
+                    worker.conn.send(("cancel", job_id))
+                    return True
+        return False
+
+    def cancel_all(self):
+        with self._lock:
+            self._stopping = True
+            self._pending.clear()
+            for worker in self.workers.values():
+                if worker.job is not None:
+                    worker.conn.send(("cancel", worker.job.job_id))
+
+    def _spawn(self, port):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, name=f"flash-{port}",
+                                    args=(port, self.baudrate, child_conn, self.log_level), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = self.workers[port] = _Worker(process, parent_conn)
+        return worker
+
+    def _dispatch(self):
+        """在锁内把等待中的任务分配给空闲端口（按吞吐排名匹配任务大小，见 scheduler.PortThroughput），不超过并发上限。"""
+        busy = sum(1 for w in self.workers.values() if w.job is not None)
+        idle = [p for p in self.ports if p not in self.workers or self.workers[p].job is None]
+        # 并发受限时快端口先取任务
+        for port in sorted(idle, key=self._throughput.get, reverse=True):
+            if busy >= self.max_concurrency or self._stopping:
+                return
+            job = self._throughput.pick([j for j in self._pending if j.port in (None, port)], port)
+            if job is None:
+                continue
+            self._pending.remove(job)
+            worker = self.workers.get(port)
+            if worker is None or not worker.process.is_alive():
+                worker = self._spawn(port)
+            worker.job = job
+            worker.last_seen = time.monotonic()
+            worker.conn.send(("job", job.job_id, job.iface, job.file_path, self.session_kwargs))
+            busy += 1
+
+    def _finish(self, port, worker, result):
+        job = worker.job
+        worker.job = None
+        result["job_id"] = job.job_id
+        result["port"] = port
+        self._throughput.record(port, result)
+        self.results.append(result)
+        if self.result_callback:
+            self.result_callback(result)
+
+    def _fail(self, port, worker, reason=None):
+        """
+        工作进程崩溃/卡死：终止进程并判定其当前任务失败；下次分配到该端口时重新启动。
+        reason 为 None 表示进程已自行退出，原因取其退出码。
+        """
+        if worker.process.is_alive() and reason is not None:
+            worker.process.terminate()
+        worker.process.join(timeout=1.0)
+        if reason is None:
+            reason = f"worker exited with code {worker.process.exitcode}"
+        self.log.error("*** %s on %s: %s", worker.job.job_id, port, reason)
+        worker.conn.close()
+        self.workers.pop(port, None)
+        job = worker.job
+        self._finish(port, worker, {"iface": job.iface, "file": job.file_path, "size": job.size,
+                                    "status": "fail", "reason": reason})
+
+    def run(self) -> list:
+        """
+        执行队列中的全部任务，阻塞直到结束。
+        返回：
+          list[dict] —— 各任务的 FlashSession 结果（附加 job_id/port），按完成顺序排列。
+        """
+        self._stopping = False
+        try:
+            while True:
+                with self._lock:
+                    self._dispatch()
+                    active = {p: w for p, w in self.workers.items() if w.job is not None}
+                if not active:
+                    break
+                by_handle = {}
+                for port, worker in active.items():
+                    by_handle[worker.conn] = port
+                    by_handle[worker.process.sentinel] = port
+                for handle in wait(list(by_handle), timeout=0.5):
+                    port = by_handle[handle]
+                    worker = self.workers.get(port)
+                    if worker is None or worker.job is None:
+                        continue
+                    if handle is worker.conn:
+                        self._drain(port, worker)
+                    elif worker.job is not None and not worker.conn.poll():
+                        self._fail(port, worker)
+                now = time.monotonic()
+                for port, worker in list(self.workers.items()):
+                    if worker.job is not None and now - worker.last_seen > self.stall_timeout:
+                        self._fail(port, worker, f"worker stalled (no response for {self.stall_timeout:.0f}s)")
+        finally:
+            self._shutdown()
+        return list(self.results)
+
+    def _drain(self, port, worker):
+        try:
+            while worker.job is not None and worker.conn.poll():
+                kind, job_id, payload = worker.conn.recv()
+                worker.last_seen = time.monotonic()
+                if job_id != worker.job.job_id:
+                    continue
+                if kind == "p":
+                    if self.progress_callback:
+                        self.progress_callback(job_id, payload)
+                elif kind == "r":
+                    self._finish(port, worker, payload)
+        except (EOFError, OSError):
+            self._fail(port, worker)
+
+    def _shutdown(self):
+        for worker in self.workers.values():
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers.values():
+            worker.process.join(timeout=2.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self.workers.clear()
@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import io
 import logging
 import math
-from time import sleep
+import os
+from collections import deque
+from time import monotonic
+
+import compression
+import crc16
+import delta as delta_ext
+import firmware
+import framing
+import resume as resume_ext
+import rtt
+import telemetry as packet_telemetry
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -14,15 +26,156 @@ ACK = b'\x06'
 NAK = b'\x15'
 CAN = b'\x18'
 CRC = b'C'
+G = b'G'  # YMODEM-G：接收端以 'G' 代替 'C' 发起，表示支持流式传输（逐包不回 ACK）
+
+
+class FrameWait(object):
+    """
+    一帧（数据包、EOT 或结束包）等待 ACK 期间的应答判定，只做决策不做收发，
+    由 YMODEM._transmit 与 AsyncYMODEM._expect_ack 共用：
+      - 收到 NAK 立即重发；
+      - 超过重发超时 RTO（按该帧长的 SRTT/RTTVAR 估计，见 rtt.py）仍无应答时重发，RTO 加倍；
+      - 其它杂字节不触发重发，只计入出错统计；连续两个 CAN 表示接收端放弃；
+      - 重发超过 retry 次，或首次发出后 timeout 秒仍未被 ACK 时放弃；
+      - 只用未重发过的帧的 ACK 采样往返时间（Karn 算法）。
+
+        wait = FrameWait(estimator, len(frame), retry, timeout)
+        putc(frame); wait.start(monotonic())
+        while True:
+            action = wait.on_reply(read(wait.remaining(monotonic())), monotonic())
+            ... RESEND：putc(frame)；ACK/FAIL/CANCELED：结束 ...
+    """
+
+    WAIT = "wait"
+    RESEND = "resend"
+    ACK = "ack"
+    FAIL = "fail"  # 本端放弃（调用方应发 CAN）
+    CANCELED = "canceled"  # 接收端发了 CAN CAN
+
+    LATE_WINDOW = 0.05  # 秒：该帧长还没有往返采样时，超时重发的帧被 ACK 后丢弃迟到应答的时长
+
+    def __init__(self, estimator, frame_size, retry, timeout):
+        self.log = logging.getLogger('YReporter')
+        self.estimator = estimator
+        self.frame_size = frame_size
+        self.retry = retry
+        self.timeout = timeout
+        self.first_sent = self.sent_at = self.resend_at = self.give_up = 0.0
+        self.sends = 0
+        self.failures = 0  # NAK/杂字节/超时的次数
+        self.errors = 0  # NAK/杂字节数
+        self.timed_out = False  # 是否发生过超时重发
+        self.cause = packet_telemetry.CAUSE_OK
+        self._can = False
+
+    def start(self, now):
+        """帧首次发出。"""
+        self.first_sent = self.sent_at = now
+        self.give_up = now + self.timeout
+        self.resend_at = now + self.estimator.rto
+        self.sends = 1
+
+    def remaining(self, now, limit=None) -> float:
+        """下一次读取应答最多等待的时间（秒）：到重发时刻或放弃时刻为止，另不超过 limit。"""
+        wait = min(self.resend_at, self.give_up) - now
+        if limit is not None:
+            wait = min(wait, limit)
+        return max(0.0, wait)
+
+    def on_reply(self, char, now) -> str:
+        """
+        处理一次读取的结果（char 为 None 表示这次读取超时），返回动作：
+          WAIT 继续等待；RESEND 调用方应立即重发该帧；ACK 已确认；FAIL 放弃；CANCELED 接收端取消。
+        """
+        if char == ACK:
+            if self.sends == 1:
+                self.estimator.sample(now - self.sent_at)
+            return self.ACK
+        if char == CAN:
+            if self._can:
+                self.log.warning("<<< receiver canceled the transfer")
+                return self.CANCELED
+            self._can = True
+            return self.WAIT
+        self._can = False
+        resend = False
+        if char:
+            self.failures += 1
+            self.errors += 1
+            if char == NAK:
+                self.cause = max(self.cause, packet_telemetry.CAUSE_NAK)
+                resend = True
+            else:
+                self.cause = max(self.cause, packet_telemetry.CAUSE_NOISE)
+        elif now >= self.resend_at:
+            self.failures += 1
+            self.cause = max(self.cause, packet_telemetry.CAUSE_TIMEOUT)
+            self.timed_out = resend = True
+            self.estimator.backoff()
+        if now >= self.give_up:
+            self.log.error(">>> no ACK within %.1fs (%d sends), aborting", self.timeout, self.sends)
+            return self.FAIL
+        if not resend:
+            return self.WAIT
+        if self.sends > self.retry:
+            self.log.error(">>> no ACK after %d resends, aborting", self.retry)
+            return self.FAIL
+        self.log.debug(">>> resending %d bytes (%s, rto %.3fs)", self.frame_size,
+                       "NAK" if char else "timeout", self.estimator.rto)
+        self.sends += 1
+        self.sent_at = now
+        self.resend_at = now + self.estimator.rto
+        return self.RESEND
+
+    @property
+    def late_window(self) -> float:
+        """
+        被 ACK 后丢弃迟到应答（重复帧的 ACK）的时长（秒）；0 表示不需要丢弃。
+        只有超时重发才可能产生重复的 ACK（前一份可能已被接收端收下）；NAK 后的重发不会。
+        """
+        if not self.timed_out:
+            return 0.0
+        srtt = self.estimator.srtt
+        return 2 * srtt if srtt is not None else self.LATE_WINDOW
+
+    @property
+    def stats(self) -> tuple:
+        """
+        (首次发出时刻, 最后一次发出时刻, 出错次数, 出错原因, 写出字节数, NAK/杂字节数, 是否超时重发)，
+        见 YMODEM._ack_stats。ACK 延迟按最后一次发出计算，首次发出时刻用于“首包到 ACK”的总耗时。
+        """
+        return (self.first_sent, self.sent_at, self.failures, self.cause, self.sends * self.frame_size, self.errors,
+                self.timed_out)
 
 
 class YMODEM(object):
     PACKET_SIZE = 128
 
+    # 'auto' 模式的块长自适应参数
+    ADAPT_WINDOW = 16  # 统计最近多少个数据包的出错情况
+    ADAPT_MIN_SAMPLES = 4  # 至少统计多少个包后才允许降级
+    ADAPT_THRESHOLD = 0.25  # 出错包占比超过该值时 1K → 128
+    ADAPT_RECOVER = 64  # 128 字节块连续无错多少个包后再尝试 1K
+
     # initialize
-    def __init__(self, getc, putc, mode='ymodem128', header_pad=b'\x00', pad=b'\x1a'):
+    def __init__(self, getc, putc, mode='ymodem128', header_pad=b'\x00', pad=b'\x1a', pollc=None, readtoken=None,
+                 telemetry=None):
+        """
+        参数：
+          getc/putc: 收发回调。
+          mode: 'ymodem128'（128 字节）/ 'ymodem'（1024 字节）/ 'ymodem-g'（1024 字节流式，需接收端发 'G'）/
+                'auto'（先用 1024 字节块，出错率超过阈值时降为 128 字节块，链路恢复后再升回 1024）。
+          pollc: 可选的非阻塞读取回调 pollc(size)，无数据立即返回 None；
+                 YMODEM-G 流式发送期间用它检查接收端的 CAN，而不阻塞发送。
+          readtoken: 可选的应答读取回调 readtoken(timeout)，最多等待 timeout 秒返回一个应答字节（超时返回 None）；
+                 提供时等待 ACK/NAK/C 的时长由 response_timeout 决定，与端口自身的读超时无关，否则使用 getc(1)。
+          telemetry: 可选的 telemetry.PacketTelemetry，发送时逐包记录 ACK 延迟/重试/出错原因。
+        """
         self.getc = getc
         self.putc = putc
+        self.pollc = pollc
+        self.readtoken = readtoken
+        self.telemetry = telemetry
         self.mode = mode
         self.header_pad = header_pad
         self.pad = pad
@@ -31,6 +184,22 @@ class YMODEM(object):
         self.log = logging.getLogger('YReporter')
         self.flash_status = 0  # 烧录状态，初始化为 0，表示未开始烧录
         self.flash_status_callback = None
+        self.response_timeout = 0.5  # 经 readtoken 读取时，单次等待应答字节的时长（也是取消检查的间隔）
+        self.ack_timeout = 1.0  # 数据包发出后超过该时间仍未收到 ACK，记为一次超时（用于块长自适应统计）；也是首个 RTO
+        self.rtt = rtt.RttTable(self.ack_timeout)  # 本次会话各帧长的往返时间估计（重发超时 RTO）
+        self._ack_stats = (0.0, 0.0, 0, packet_telemetry.CAUSE_OK, 0, 0, False)  # 最近一帧的应答统计，见 _transmit
+        self.block_size = None  # 最近一次发送使用的数据块长度
+        self.block_counts = {}  # 本次会话各块长发送的数据包数量 {1024: n, 128: m}
+        self.block_switches = 0  # 本次会话块长切换次数
+        self.header_ready_timeout = 2.0  # 包0 被 ACK 后等待接收端发 'C'（擦除 Flash 等）的最长时间
+        self.timings = {}  # 本次会话各阶段耗时（秒）：start/header/data/finish
+        self.resume_offset = 0  # 本次会话的起始偏移（接收端接受续传时大于 0）
+        self.acked_offset = 0  # 本次会话中已被 ACK 的数据末尾偏移（续传记录用）
+        self._ready_ext = bytearray()  # 包0 的 ACK 与就绪字节之间收到的扩展应答（续传 '@'+偏移、压缩 'Z'、增量 'D'）
+        self.delta_rejected = False  # 本次会话发送的是增量流而接收端未确认（调用方可重新握手后完整发送）
+        self.compress_rejected = False  # 本次会话发送的是压缩流而接收端未确认（调用方可重新握手后不压缩发送）
+        self.original_size = 0  # 本次会话的固件大小（压缩传输时为解压后的大小）
+        self.wire_size = 0  # 本次会话线上的文件大小（压缩传输时为压缩流长度）
 
     def update_flash_status(self, new_status: int):
         """外部通知当前发送要取消等状态。约定：2 表示请求取消。"""
@@ -59,11 +228,11 @@ class YMODEM(object):
     '''
 
     def send(self, file_stream, file_name, file_size=0, retry=20, timeout=15, callback=None,
-             flash_status_callback=None):
+             flash_status_callback=None, image=None, resume=None, compress=False, delta=None, ready=None):
         """
         YMODEM 发送主流程。
         阶段：
-          1) 等待接收端握手字符 'C'（CRC 模式），支持取消（flash_status==2）。
+          1) 等待接收端握手字符 'C'（CRC 模式），支持取消（flash_status==2）；握手时已收到的（ready）不再等待。
           2) 发送首包（包0）：包含文件名与长度；等待对端 ACK/CRC。
           3) 分块发送数据包（128/1024字节），每块后等待 ACK/NAK，重试不超过 retry。
           4) 发送 EOT 结束，等待 ACK；再发空包完成会话。
@@ -80,44 +249,115 @@ class YMODEM(object):
           file_stream: 已打开的二进制文件对象（由调用方管理关闭）。
           file_name: 发送给对端的文件名（包0使用）。
           file_size: 文件总字节数（用于百分比计算与包0）。
-          retry: 单次等待 ACK/NAK 的最大重试次数。
-          timeout: 单次等待超时（秒）（取决于 getc 的实现，可不使用）。
+          retry: 每帧（包0/数据包/EOT/结束包）最多重发次数；收到 NAK 立即重发，超过 RTO 无应答时也重发。
+          timeout: 每个等待点的总时限（秒）：等待 'C'、等待包0 的 ACK、每帧首次发出到被 ACK，超过即放弃。
+                   单次重发超时 RTO 由本会话的往返时间估计给出（SRTT + 4·RTTVAR，见 rtt.py），与端口的读超时无关。
           callback: 进度/阶段回调。
           flash_status_callback: 外部状态回调（可为 None）。
+          image: 预组帧镜像 framing.FramedImage（可为 None）。提供时直接按下标发送现成的帧，
+                 file_stream 可为 None，file_name/file_size 以镜像为准；包长须与 mode 一致。
+          resume: 续传提议 (offset, digest)（见 resume.ResumeStore.offer），None 表示不提议。
+                  提议附加在包0 中；接收端以 '@'+偏移 接受时从该偏移继续发送，普通接收端忽略提议，照常完整发送。
+                  实际起始偏移见 self.resume_offset，结束后已被 ACK 的偏移见 self.acked_offset。
+          compress: True 时以 zlib 流压缩后发送（见 compression.py），包0 附带压缩标记，接收端须回 'Z' 确认，
+                    否则发 CAN 放弃并置 self.compress_rejected。
+                    提供 image 时以镜像本身是否为压缩流（image.compressed）为准。
+                    原始/线上字节数见 self.original_size / self.wire_size；压缩传输不提议续传。
+          delta: 设备当前镜像的块哈希清单（delta.make_manifest/load_manifest），提供时只发送变化的块（见 delta.py）；
+                 接收端须回 'D' 确认，否则发 CAN 放弃并置 self.delta_rejected；变化过多时照常完整发送。
+                 提供 image 时以镜像本身是否为增量流（image.delta）为准。增量传输不提议续传。
+          ready: 握手时已收到的就绪字节 b'C'/b'G'（bootloader.enter_bootloader 返回的 ready）；
+                 提供时直接发送包0，不再等待接收端的下一个周期 'C'。None 表示等待。
+        数据读取：
+          未提供 image 时，file_stream 经 firmware.as_source() 包装：本地文件 mmap 零拷贝切片，
+          其它流由后台线程预读后续若干包，发送循环中的 read() 不再等待磁盘。
         返回：
           True: 发送成功。
           "cancel": 用户或上层请求取消。
           ("fail", reason): 发送失败及原因字符串。
         """
+        source, owned = None, False
+        if image is None and file_stream is not None and delta is not None:
+            data = file_stream.read()
+            image = delta_ext.frame_delta(data, delta, file_name, framing.packet_size_for(self.mode),
+                                          self.header_pad, self.pad, compress=compress)
+            if image is None:
+                file_stream = io.BytesIO(data)
+        if image is None and file_stream is not None and compress:
+            # 压缩流的大小要写进包0：先整体压缩并组帧，之后与预组帧镜像走同一路径
+            image = framing.FramedImage(file_stream.read(), file_name, framing.packet_size_for(self.mode),
+                                        self.header_pad, self.pad, compress=True)
+        elif image is None and file_stream is not None:
+            chunk = framing.packet_size_for(self.mode)
+            source, owned = firmware.as_source(file_stream, chunk)
         try:
-            packet_size = dict(
-                ymodem=1024,
-                ymodem128=128
-            )[self.mode]
-        except KeyError:
-            raise ValueError("<<< Invalid mode specified: {self.mode!r}".format(self=self))
+            return self._send(source, file_name, file_size, retry, timeout, callback, flash_status_callback, image,
+                              resume, ready)
+        finally:
+            if owned:
+                source.close()
+
+    def _send(self, file_stream, file_name, file_size, retry, timeout, callback, flash_status_callback, image,
+              resume=None, ready=None):
+        """send() 的协议主体；file_stream 为已包装好的数据源（或 None，使用 image）。"""
+        packet_size = framing.packet_size_for(self.mode)
+        if image is not None:
+            if image.packet_size != packet_size:
+                raise ValueError("<<< framed image packet size {0} does not match mode {1!r}".format(
+                    image.packet_size, self.mode))
+            file_name = image.file_name
+            file_size = image.file_size
 
         current_packet = 0  # 当前数据包编号
+        last_percentage = None  # 上次回调的百分比
         total_packet = math.ceil(file_size / packet_size)  # 总数据包数量
-        print('*** total_packet: ', total_packet)
+        self.log.debug('*** total_packet: %d', total_packet)
+        self.timings = {}
+        self.resume_offset = 0
+        self.acked_offset = 0
+        self.delta_rejected = False
+        self.compress_rejected = False
+        self.rtt = rtt.RttTable(self.ack_timeout)
+        compressed = image is not None and image.compressed
+        is_delta = image is not None and image.delta is not None
+        self.original_size = image.original_size if image is not None else file_size
+        self.wire_size = file_size
+        if (compressed or is_delta) and resume:
+            self.log.info("<<< resume is not offered for compressed or delta transfers")
+            resume = None
+        t_phase = monotonic()
+        if self.telemetry is not None:
+            self.telemetry.begin()
 
         self.log.debug('*** Begin start sequence')
         self.flash_status = 3  # flash_status为3表示正在升级中
         if flash_status_callback:
             flash_status_callback(self.flash_status)
-            print('升级中...')
+            self.log.info('升级中...')
 
         # Receive first character
-        error_count = 0
+        deadline = monotonic() + timeout
         cancel = 0
+        streaming = False  # 是否以 YMODEM-G 流式发送
         while True:
             if self._check_cancel():
                 return self._cancel_send()
-            char = self.getc(1)
+            if ready:
+                # 握手已读到的就绪字节：接收端正在等待包0
+                char, ready = ready, None
+            else:
+                char = self._read_response()
             if char:
                 if char == CRC:
                     # Expected CRC
                     self.log.info("<<< CRC")
+                    if self.mode == 'ymodem-g':
+                        # 接收端不支持 G：退回逐包应答的 1K 模式
+                        self.log.warning("<<< receiver offered CRC, falling back from ymodem-g to ymodem")
+                    break
+                elif char == G and self.mode == 'ymodem-g':
+                    self.log.info("<<< G")
+                    streaming = True
                     break
                 elif char == CAN:
                     self.log.info("<<< CAN")
@@ -127,57 +367,98 @@ class YMODEM(object):
                         self.flash_status = 2
                         if flash_status_callback:
                             flash_status_callback(self.flash_status)
-                        print('*** 升级失败')
+                        self.log.info('*** 升级失败')
                         return False
                     else:
                         cancel = 1
                 else:
                     self.log.error(">>> send error, expected CRC or CAN, but got " + hex(ord(char)))
 
-            error_count += 1
-            if error_count > retry:
+            if monotonic() >= deadline:
                 self.abort()
-                self.log.error(">>> send error: error_count reached %d aborting", retry)
+                self.log.error(">>> send error: no CRC within %.1fs, aborting", timeout)
                 # 设置 flash_status为 2，表示升级失败
                 self.flash_status = 2
                 if flash_status_callback:
                     flash_status_callback(self.flash_status)
-                print('*** 升级失败')
+                self.log.info('*** 升级失败')
                 return False
 
-        header = self._make_send_header(128, 0)
-        name = bytes(file_name, encoding="utf8")
+        now = monotonic()
+        self.timings["start"] = now - t_phase
+        t_phase = now
+        offer = self._resume_offer(file_name, file_size, resume)
+        if offer is not None:
+            data_for_send = framing.make_frame(offer, 0, 128, self.header_pad)
+        elif image is not None:
+            data_for_send = image.header_packet
+        else:
+            header = self._make_send_header(128, 0)
+            name = bytes(file_name, encoding="utf8")
 
-        size = bytes(str(file_size), encoding="utf8")
+            size = bytes(str(file_size), encoding="utf8")
 
-        data = name + b'\x00' + size + b'\x20'
+            data = name + b'\x00' + size + b'\x20'
 
-        data = data.ljust(128, self.header_pad)
+            data = data.ljust(128, self.header_pad)
 
-        checksum = self._make_send_checksum(data)
-        data_for_send = header + data + checksum
+            checksum = self._make_send_checksum(data)
+            data_for_send = header + data + checksum
         self.putc(data_for_send)
         self.log.info("<<< Packet 0 >>> " + str(len(data_for_send)))
         # self.sent_data_size = int(0)
         # self.sent_percentage = int(self.sent_data_size/(file_size/100))
-        error_count = 0
+        # 包0 只在 NAK 时重发：有的接收端先擦除 Flash 再 ACK，超时重发会造成重复的 ACK
+        deadline = monotonic() + timeout
+        resends = 0
         cancel = 0
         # Receive response of first packet
         while True:
             if self._check_cancel():
                 return self._cancel_send()
-            char = self.getc(1)
+            if monotonic() >= deadline or resends > retry:
+                self.abort()
+                self.log.error(">>> packet 0 was not acknowledged, aborting")
+                self.flash_status = 2
+                if flash_status_callback:
+                    flash_status_callback(self.flash_status)
+                self.log.info('*** 升级失败')
+                return False
+            char = self._read_response(max(0.0, min(self.response_timeout, deadline - monotonic())))
             if char:
                 if char == ACK:
                     self.log.info("<<< ACK")
                     # self.sent_data_size += len(data_for_send)
-                    char2 = self.getc(1)
-                    if char2 == CRC:
-                        self.log.info("<<< CRC")
-                        break
+                    # 接收端处理完包0（如擦除 Flash）后发 'C'：收到即开始发数据，不再固定等待
+                    char2 = self._wait_ready(streaming, offer is not None or compressed or is_delta)
+                    if char2:
+                        self.log.info("<<< " + char2.decode())
                     else:
                         self.log.warning(">>> ACK wasn't CRC")
-                        break
+                    accepted = self._check_extensions(resume if offer is not None else None, compressed, is_delta)
+                    if accepted is None:
+                        self.abort()
+                        self.flash_status = 2
+                        if flash_status_callback:
+                            flash_status_callback(self.flash_status)
+                        self.log.info('*** 升级失败')
+                        return False
+                    self.resume_offset = accepted
+                    break
+                elif streaming and char == G:
+                    # YMODEM-G：部分接收端对包0 只回 'G'（不回 ACK）
+                    self.log.info("<<< G")
+                    if compressed or is_delta:
+                        self.log.error("<<< receiver did not confirm the packet 0 extensions")
+                        self.delta_rejected = is_delta
+                        self.compress_rejected = compressed and not is_delta
+                        self.abort()
+                        self.flash_status = 2
+                        if flash_status_callback:
+                            flash_status_callback(self.flash_status)
+                        self.log.info('*** 升级失败')
+                        return False
+                    break
                 elif char == CAN:
                     self.log.info("<<< CAN")
                     if cancel:
@@ -185,161 +466,582 @@ class YMODEM(object):
                         self.flash_status = 2
                         if flash_status_callback:
                             flash_status_callback(self.flash_status)
-                        print('*** 升级失败')
+                        self.log.info('*** 升级失败')
                         return False
                     else:
                         cancel = 1
+                elif char == NAK:
+                    self.log.warning("<<< NAK, resending packet 0")
+                    self.putc(data_for_send)
+                    resends += 1
+                elif char == CRC:
+                    # 握手后直接发包0 时，接收端在收到包0 之前发出的周期 'C' 可能随后到达
+                    self.log.debug("<<< C before the packet 0 ACK")
                 else:
                     if 0x20 <= (ord(char)) <= 0x7e:
                         self.log.error("<<< test" + str(char))
                     else:
                         self.log.error("<<< send error, expected ACK or CAN, but got " + hex(ord(char)))
 
-        error_count = 0
-        cancel = 0
         total_packets = 1
         sequence = 1
-        sleep(1)
-        while True:
+        # 'auto'：从 1K 块开始，按出错率在 1K/128 之间切换；其余模式块长固定
+        adaptive = self.mode == 'auto' and not streaming
+        block_size = packet_size
+        offset = self.resume_offset  # 已组帧数据的文件偏移
+        self.acked_offset = offset
+        if offset:
+            self.log.info("<<< receiver accepted resume at offset %d of %d", offset, file_size)
+            if image is None:
+                self._skip_source(file_stream, offset)
+        self.block_size = block_size
+        self.block_counts = {}
+        self.block_switches = 0
+        self._adapt_window = deque(maxlen=self.ADAPT_WINDOW)
+        self._adapt_clean = 0
+        now = monotonic()
+        self.timings["header"] = now - t_phase
+        t_phase = now
+        if streaming:
+            res = self._stream_packets(file_stream, image, packet_size, callback, file_size, offset)
+            if res is not True:
+                if res == "cancel":
+                    return res
+                self.flash_status = 2
+                if flash_status_callback:
+                    flash_status_callback(self.flash_status)
+                self.log.info('*** 升级失败')
+                return False
+            current_packet = total_packet
+            self.block_counts = {packet_size: math.ceil((file_size - offset) / packet_size)}
+        while not streaming:
             if self._check_cancel():
                 return self._cancel_send()
-            # Read raw data from file stream
-            data = file_stream.read(packet_size)
-            if not data:
-                self.log.debug('<<< send: at EOF')
-                break
+            if image is not None:
+                # 预组帧：块长与镜像一致时直接取现成的帧切片（重传也复用同一切片）
+                if offset >= image.file_size:
+                    self.log.debug('<<< send: at EOF')
+                    break
+                data_for_send = image.frame_at(offset, block_size, sequence, self.pad)
+                offset += block_size
+            else:
+                # Read raw data from file stream
+                data = file_stream.read(block_size)
+                if not data:
+                    self.log.debug('<<< send: at EOF')
+                    break
+                offset += len(data)
+
+                header = self._make_send_header(block_size, sequence)
+                if len(data) < block_size:
+                    data = bytes(data).ljust(block_size, self.pad)
+                checksum = self._make_send_checksum(data)
+                data_for_send = header + data + checksum
             total_packets += 1
 
-            header = self._make_send_header(packet_size, sequence)
-            data = data.ljust(packet_size, self.pad)
-            checksum = self._make_send_checksum(data)
+            self.log.info("Packet " + str(sequence) + " >>>" + str(len(data_for_send)))
+            res = self._transmit(data_for_send, retry, timeout)
+            if res is not True:
+                if res == "cancel":
+                    return res
+                # 设置 flash_status为 2，表示升级失败
+                self.flash_status = 2
+                if flash_status_callback:
+                    flash_status_callback(self.flash_status)
+                self.log.info('*** 升级失败')
+                return False
+            sent_at, last_sent_at, retries, cause, wire_bytes, errors, timed_out = self._ack_stats
+            if self.telemetry is not None:
+                self.telemetry.record(sequence, sent_at, monotonic(), retries, cause, wire_bytes, block_size,
+                                      last_sent_at)
+            self.log.info("<<< ACK")
+            self.block_counts[block_size] = self.block_counts.get(block_size, 0) + 1
+            self.acked_offset = min(offset, file_size)
+            if adaptive:
+                timed_out = timed_out or monotonic() - sent_at > self.ack_timeout
+                block_size = self._adapt_block_size(block_size, errors + timed_out)
+            if callback:
+                current_packet += 1
+                try:
+                    sent_percentage = math.ceil(min(offset, file_size) / file_size * 100)
+                except ZeroDivisionError:
+                    sent_percentage = 100
+                # 百分比变化时才回调：1K 块下每个百分点往往对应多个数据包
+                if sent_percentage != last_percentage:
+                    last_percentage = sent_percentage
+                    callback(sent_percentage)
+                    self.log.debug('<<< sent_percentage: %d', sent_percentage)
 
-            while True:
-                if self._check_cancel():
-                    return self._cancel_send()
-                data_for_send = header + data + checksum
-                # print(len(data_for_send))
-                # data_in_hexstring = "".join("%02x" % b for b in data_for_send)
-
-                # Send file data packet
-                self.putc(data_for_send)
-                self.log.info("Packet " + str(sequence) + " >>>" + str(len(data_for_send)))
-                error_count = 0
-                while True:
-                    if self._check_cancel():
-                        return self._cancel_send()
-                    char = self.getc(1)
-                    if char == ACK:
-                        break
-                    else:
-                        error_count += 1
-                    if error_count > retry:
-                        self.abort()
-                        # 设置 flash_status为 2，表示升级失败
-                        self.flash_status = 2
-                        if flash_status_callback:
-                            flash_status_callback(self.flash_status)
-                        print('*** 升级失败')
-                        return False
+            sequence = (sequence + 1) % 0x100
 
-                error_count = 0
-                if char == ACK:
-                    # Expected response
-                    self.log.info("<<< ACK")
-                    if callback:
-                        current_packet += 1
-                        try:
-                            sent_percentage = math.ceil((current_packet / total_packet) * 100)
-                        except ZeroDivisionError:
-                            sent_percentage = 100
-                        callback(sent_percentage)
-                        print('<<< sent_percentage1: ', sent_percentage)
-                        self.log.info("<<< Percentage Start")
-                    error_count = 0
-                    break
+        # Send EOT and expect final ACK
+        now = monotonic()
+        self.timings["data"] = now - t_phase
+        t_phase = now
+        # 经典接收端对第一个 EOT 回 NAK：_transmit 收到 NAK 立即重发
+        self.log.info(">>> EOT")
+        res = self._transmit(EOT, retry, timeout)
+        if res is not True:
+            if res == "cancel":
+                return res
+            self.log.warning('<<< EOT was not ACK, aborting transfer')
+            # 设置 flash_status为 2，表示升级失败
+            self.flash_status = 2
+            if flash_status_callback:
+                flash_status_callback(self.flash_status)
+            self.log.info('*** 升级失败')
+            return False
+        self.log.info("<<< ACK")
 
-                error_count += 1
+        if image is not None:
+            data_for_send = image.end_packet
+        else:
+            header = self._make_send_header(128, 0)
 
-                if error_count > retry:
-                    self.abort()
-                    self.log.error('send error: NAK   received  %d , aborting', retry)
-                    # 设置 flash_status为 2，表示升级失败
-                    self.flash_status = 2
-                    if flash_status_callback:
-                        flash_status_callback(self.flash_status)
-                    print('*** 升级失败')
-                    return False
+            data = bytearray(b'\x00')
 
-            sequence = (sequence + 1) % 0x100
+            data = data.ljust(128, self.header_pad)
 
-        # Send EOT and expect final ACK
-        error_count = 0
+            checksum = self._make_send_checksum(data)
+            data_for_send = header + data + checksum
+        res = self._transmit(data_for_send, retry, timeout)
+        if res is not True:
+            if res == "cancel":
+                return res
+            self.log.warning('>>> SOH was not ACK, aborting transfer')
+            # 设置 flash_status为 2，表示升级失败
+            self.flash_status = 2
+            if flash_status_callback:
+                flash_status_callback(self.flash_status)
+            self.log.info('*** 升级失败')
+            return False
+        if callback:
+            current_packet += 1
+            try:
+                sent_percentage = min(100, math.ceil((current_packet / total_packet) * 100))
+            except ZeroDivisionError:
+                sent_percentage = 100
+            callback(sent_percentage)
+            self.log.debug('<<< sent_percentage: %d', sent_percentage)
+
+        self.timings["finish"] = monotonic() - t_phase
+        if self.telemetry is not None:
+            self.telemetry.finish(self.timings)
+        self.log.info('*** Transmission successful (ACK received ), blocks: %s, timings: %s',
+                      self.block_counts, self.timings)
+        # 设置 flash_status为 1，表示烧录完成
+        self.flash_status = 1
+        if flash_status_callback:
+            flash_status_callback(self.flash_status)
+        self.log.info('*** 升级成功')
+        return True
+
+    def _read_response(self, timeout=None):
+        """读取一个应答字节：有 readtoken 时按 timeout（默认 response_timeout）等待，否则 getc(1)。"""
+        if self.readtoken is not None:
+            return self.readtoken(self.response_timeout if timeout is None else timeout)
+        return self.getc(1)
+
+    def _transmit(self, frame, retry, timeout):
+        """
+        发出一帧（数据包、EOT 或结束包）并等待 ACK；重发与放弃的规则见 FrameWait。
+        超时重发过的帧被 ACK 后丢弃随后短时间内到达的应答（重复帧的 ACK），以免被当作下一帧的应答。
+        返回：
+          True（ACK）/ "cancel"（本端取消）/ False（失败）。
+          各项统计（见 FrameWait.stats）留在 self._ack_stats。
+        """
+        wait = self._frame_wait(frame, retry, timeout)
         while True:
             if self._check_cancel():
                 return self._cancel_send()
-            self.putc(EOT)
-            self.log.info(">>> EOT")
-            char = self.getc(1)
-            if char == ACK:
-                self.log.info("<<< ACK")
-                break
-            else:
-                error_count += 1
-                if error_count > retry:
-                    self.abort()
-                    self.log.warning('<<< EOT was not ACK, aborting transfer')
-                    # 设置 flash_status为 2，表示升级失败
-                    self.flash_status = 2
-                    if flash_status_callback:
-                        flash_status_callback(self.flash_status)
-                    print('*** 升级失败')
-                    return False
+            char = self._read_response(wait.remaining(monotonic(), self.response_timeout))
+            action = wait.on_reply(char, monotonic())
+            if action == FrameWait.RESEND:
+                self.putc(frame)
+            elif action == FrameWait.ACK:
+                if wait.late_window:
+                    self._discard_replies(wait.late_window)
+                self._ack_stats = wait.stats
+                return True
+            elif action == FrameWait.FAIL:
+                self.abort()
+                return False
+            elif action == FrameWait.CANCELED:
+                return False
+
+    def _frame_wait(self, frame, retry, timeout) -> FrameWait:
+        """发出 frame 并返回其应答判定（按帧长取本会话的往返时间估计）。"""
+        wait = FrameWait(self.rtt.get(len(frame)), len(frame), retry, timeout)
+        self.putc(frame)
+        wait.start(monotonic())
+        return wait
+
+    def _discard_replies(self, window):
+        """
+        丢弃 window 秒内到达的应答（重发帧的重复 ACK）。
+        没有 readtoken 时无法按时限等待（getc 受端口读超时约束），只丢弃已经到达的字节。
+        """
+        if self.readtoken is None:
+            while self.pollc is not None and self.pollc(64):
+                pass
+            return
+        deadline = monotonic() + window
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return
+            char = self.readtoken(remaining)
+            if char:
+                self.log.debug("<<< discarding late reply %r", char)
 
-        header = self._make_send_header(128, 0)
+    def _wait_ready(self, streaming, extended=False):
+        """
+        包0 被 ACK 后等待接收端的就绪字节 'C'（流式为 'G'），最长 header_ready_timeout 秒。
+        extended 为 True（包0 带续传提议或压缩标记）时，就绪字节之前收到的字节记入 _ready_ext。
+        返回：
+          收到的就绪字节；超时或被取消返回 None。
+        """
+        self._ready_ext = bytearray()
+        deadline = monotonic() + self.header_ready_timeout
+        while monotonic() < deadline and not self._check_cancel():
+            char = self._read_response(min(self.response_timeout, max(0.0, deadline - monotonic())))
+            if char == CRC or (streaming and char == G):
+                return char
+            if char:
+                if extended and len(self._ready_ext) < 32:
+                    self._ready_ext += char
+                else:
+                    self.log.debug("<<< waiting for C, got %r", char)
+        return None
 
-        data = bytearray(b'\x00')
+    def _check_extensions(self, resume, compressed, is_delta=False):
+        """
+        检查接收端对包0 扩展的应答（_ready_ext）。
+        参数：
+          resume: 包0 中的续传提议 (offset, digest)；未提议为 None。
+          compressed: 包0 是否带压缩标记。
+          is_delta: 包0 是否带增量标记。
+        返回：
+          续传起始偏移（不续传为 0）；接收端不支持压缩/增量或给出非法偏移时返回 None（调用方应放弃传输）。
+        """
+        reply = bytes(self._ready_ext)
+        if is_delta and delta_ext.DELTA_MARK not in reply:
+            self.log.warning("<<< receiver did not accept the delta (got %r)", reply)
+            self.delta_rejected = True
+            return None
+        if compressed and compression.COMPRESS_MARK not in reply:
+            self.log.warning("<<< receiver did not confirm compressed transfer (got %r)", reply)
+            self.compress_rejected = True
+            return None
+        accepted = resume_ext.parse_accept(reply) if resume else None
+        if accepted is None:
+            return 0
+        if accepted > resume[0] or accepted % resume_ext.RESUME_ALIGN:
+            self.log.error("<<< receiver asked to resume at an unexpected offset %d", accepted)
+            return None
+        return accepted
 
-        data = data.ljust(128, self.header_pad)
+    def _resume_offer(self, file_name, file_size, resume):
+        """
+        带续传提议的包0 负载；不提议（resume 为 None、偏移无效或包0 放不下）时返回 None。
+        """
+        if not resume:
+            return None
+        offset, digest = resume
+        if not 0 <= offset < file_size:
+            return None
+        payload = framing.make_header_payload(file_name, file_size, resume_ext.make_offer(offset, digest))
+        if len(payload) > 128:
+            self.log.warning("<<< file name too long for a resume offer, sending the whole image")
+            return None
+        if offset:
+            self.log.info("<<< offering resume at offset %d of %d", offset, file_size)
+        return payload
 
-        checksum = self._make_send_checksum(data)
-        data_for_send = header + data + checksum
-        self.putc(data_for_send)
+    @staticmethod
+    def _skip_source(file_stream, offset):
+        """续传时跳过数据源开头已被接收端确认的 offset 字节（可 seek 时直接定位）。"""
+        if hasattr(file_stream, 'seek'):
+            file_stream.seek(offset)
+            return
+        while offset > 0:
+            data = file_stream.read(min(offset, 64 * 1024))
+            if not data:
+                break
+            offset -= len(data)
+
+    def _adapt_block_size(self, block_size, errors):
+        """
+        'auto' 模式的块长决策：记录刚被 ACK 的数据包的出错次数（NAK/杂字节 + 是否超时），返回下一包的块长。
+          - 1K：最近窗口内出错包占比超过 ADAPT_THRESHOLD 时降为 128。
+          - 128：连续 ADAPT_RECOVER 个包无错时重新尝试 1K。
+        """
+        self._adapt_window.append(1 if errors else 0)
+        if block_size == 1024:
+            samples = len(self._adapt_window)
+            if samples >= self.ADAPT_MIN_SAMPLES and sum(self._adapt_window) / samples > self.ADAPT_THRESHOLD:
+                self.log.warning("<<< error rate %d/%d, falling back to 128-byte blocks",
+                                 sum(self._adapt_window), samples)
+                block_size = 128
+        else:
+            self._adapt_clean = 0 if errors else self._adapt_clean + 1
+            if self._adapt_clean >= self.ADAPT_RECOVER:
+                self.log.info("<<< link clean for %d packets, retrying 1K blocks", self._adapt_clean)
+                block_size = 1024
+        if block_size != self.block_size:
+            self.block_switches += 1
+            self.block_size = block_size
+            self._adapt_window.clear()
+            self._adapt_clean = 0
+        return block_size
 
-        error_count = 0
+    def _stream_packets(self, file_stream, image, packet_size, callback, file_size, start=0):
+        """
+        YMODEM-G 数据阶段：从文件偏移 start（续传时大于 0）起连续发送数据包，不等待逐包 ACK。
+        期间通过 pollc（若提供）非阻塞检查接收端回送的字节：收到 CAN 或 NAK 即中止（G 模式没有重传）。
+        返回：
+          True: 全部数据包已发出。
+          "cancel": 本端请求取消。
+          False: 接收端中止。
+        """
+        index = 0
+        offset = start
+        sequence = 1
+        last_percentage = None
         while True:
             if self._check_cancel():
                 return self._cancel_send()
-            char = self.getc(1)
-            if char == ACK:
-                if callback:
-                    current_packet += 1
-                    try:
-                        sent_percentage = math.ceil((current_packet / total_packet) * 100)
-                    except ZeroDivisionError:
-                        sent_percentage = 100
-                    callback(sent_percentage)
-                    print('<<< sent_percentage2: ', sent_percentage)
-                break
+            if image is not None:
+                if offset >= image.file_size:
+                    break
+                data_for_send = image.frame_at(offset, packet_size, sequence, self.pad)
             else:
-                error_count += 1
-                if error_count > retry:
+                data = file_stream.read(packet_size)
+                if not data:
+                    break
+                if len(data) < packet_size:
+                    data = bytes(data).ljust(packet_size, self.pad)
+                data_for_send = self._make_send_header(packet_size, sequence) + data + self._make_send_checksum(data)
+            self.putc(data_for_send)
+            index += 1
+            offset += packet_size
+            sequence = (sequence + 1) % 0x100
+
+            if self.pollc is not None:
+                reply = self.pollc(16)
+                if reply and (CAN in reply or NAK in reply):
+                    self.log.error("<<< ymodem-g: receiver aborted at packet %d (%r)", index, reply)
                     self.abort()
-                    self.log.warning('>>> SOH was not ACK, aborting transfer')
-                    # 设置 flash_status为 2，表示升级失败
-                    self.flash_status = 2
-                    if flash_status_callback:
-                        flash_status_callback(self.flash_status)
-                    print('*** 升级失败')
                     return False
-
-        self.log.info('*** Transmission successful (ACK received )')
-        # 设置 flash_status为 1，表示烧录完成
-        self.flash_status = 1
-        if flash_status_callback:
-            flash_status_callback(self.flash_status)
-        print('*** 升级成功')
+            if callback:
+                percentage = min(100, math.ceil(offset / file_size * 100)) if file_size else 100
+                if percentage != last_percentage:
+                    last_percentage = percentage
+                    callback(percentage)
+        self.log.debug('<<< send: at EOF (%d packets streamed)', index)
         return True
 
+    '''
+    receive entry
+    '''
+
+    def recv(self, out_dir, retry=10, timeout=10, callback=None):
+        """
+        YMODEM 接收主流程（批量）：发 'C'（ymodem-g 模式发 'G'）→ 包0 → 数据包 → EOT → 下一个包0 / 结束空包。
+        数据包校验通过即直接写入 out_dir 下的文件，不在内存中缓存整个文件；
+        包0 中给出大小时按大小截断末包填充，未给出时仅暂存最后一包，在 EOT 时去掉尾部填充字节。
+        参数：
+          out_dir: 保存目录（不存在时创建）；文件名取包0中的基础名。
+          retry: 连续出错（超时/校验失败）的最大次数，超过后发 CAN 放弃。
+          timeout: 等待下一个包的时限（秒）；等待包0 期间每秒重发一次就绪字节。
+          callback: 进度回调 callback(percent:int)，按当前文件已收字节/文件大小计算。
+        取消：
+          外部调用 update_flash_status(2) 后在下一个等待点发 CAN 并返回 status="cancel"。
+        返回：
+          dict，字段：
+            status: "success" | "fail" | "cancel"；reason: 失败原因
+            files: [{"name", "path", "size", "received"}]（已完整接收的文件）
+            bytes / elapsed / throughput（字节/秒）/ packets / naks / duplicates
+        """
+        streaming = self.mode == 'ymodem-g'
+        result = {"status": "fail", "reason": None, "files": [], "bytes": 0, "elapsed": 0.0,
+                  "throughput": 0.0, "packets": 0, "naks": 0, "duplicates": 0}
+        os.makedirs(out_dir, exist_ok=True)
+        t_start = monotonic()
+        state = {"current": None}
+        try:
+            self._recv_files(out_dir, streaming, retry, timeout, callback, result, state)
+        finally:
+            if state["current"] is not None:
+                state["current"]["stream"].close()
+            result["elapsed"] = monotonic() - t_start
+            if result["elapsed"] > 0:
+                result["throughput"] = result["bytes"] / result["elapsed"]
+        self.log.info("*** receive %s: %d file(s), %d bytes in %.2fs", result["status"], len(result["files"]),
+                      result["bytes"], result["elapsed"])
+        return result
+
+    def _recv_files(self, out_dir, streaming, retry, timeout, callback, result, state):
+        """recv() 的主体；正在写入的文件记录放在 state["current"]，异常退出时由 recv() 关闭。"""
+        ready = G if streaming else CRC
+        expected = 1
+        errors = 0
+        last_percentage = None
+        self.putc(ready)
+        last_ready = monotonic()
+        deadline = last_ready + timeout
+        while True:
+            current = state["current"]
+            if self._check_cancel():
+                self._cancel_send()
+                result["status"] = "cancel"
+                result["reason"] = "canceled"
+                return
+            char = self._read_response()
+            if not char:
+                now = monotonic()
+                if current is None and now - last_ready >= 1.0:
+                    # 等待包0：周期性重发就绪字节
+                    self.putc(ready)
+                    last_ready = now
+                if now < deadline:
+                    continue
+                errors += 1
+                if errors > retry:
+                    self.abort()
+                    result["reason"] = "timeout"
+                    return
+                self.putc(NAK if current is not None else ready)
+                deadline = now + timeout
+                continue
+            if char == CAN:
+                if self._read_response() == CAN:
+                    result["status"] = "cancel"
+                    result["reason"] = "sender canceled"
+                    return
+                continue
+            if char == EOT:
+                if current is not None:
+                    result["bytes"] += self._recv_close(current)
+                    result["files"].append({k: current[k] for k in ("name", "path", "size", "received")})
+                    state["current"] = None
+                    self.putc(ACK + ready)
+                else:
+                    self.putc(ACK)
+                deadline = monotonic() + timeout
+                continue
+            if char not in (SOH, STX):
+                self.log.debug("<<< recv: skipping %r", char)
+                continue
+
+            size = 128 if char == SOH else 1024
+            body = self._recv_exact(size + 4, timeout)
+            valid = body is not None and body[0] ^ body[1] == 0xff
+            if valid:
+                valid, payload = self._verify_recv_checksum(body[2:])
+            if not valid:
+                errors += 1
+                result["naks"] += 1
+                if errors > retry or (streaming and current is not None):
+                    self.abort()
+                    result["reason"] = "bad packet in ymodem-g stream" if streaming else "too many bad packets"
+                    return
+                self._recv_purge()
+                self.putc(NAK)
+                continue
+            errors = 0
+            deadline = monotonic() + timeout
+            sequence = body[0]
+            result["packets"] += 1
+
+            if current is None:
+                if sequence != 0:
+                    # EOT 之前最后一个数据包的重发（ACK 丢失）
+                    result["duplicates"] += 1
+                    self.putc(ACK)
+                    continue
+                name, _, rest = bytes(payload).partition(b'\x00')
+                if not name:
+                    self.putc(ACK)
+                    result["status"] = "success"
+                    return
+                try:
+                    file_size = int(rest.split(b'\x00')[0].split(b' ')[0])
+                except ValueError:
+                    file_size = None
+                name = os.path.basename(name.decode('utf-8', 'replace')) or "unnamed.bin"
+                path = os.path.join(out_dir, name)
+                state["current"] = {"name": name, "path": path, "size": file_size, "received": 0,
+                                    "stream": open(path, 'wb'), "held": None}
+                expected = 1
+                last_percentage = None
+                self.log.info("<<< recv: %s (%s bytes) -> %s", name, file_size, path)
+                self.putc(ACK + ready)
+                continue
+
+            if sequence == 0 and current["received"] == 0 and current["held"] is None:
+                result["duplicates"] += 1  # 包0 的重发
+                self.putc(ACK + ready)
+                continue
+            if sequence == (expected - 1) & 0xff:
+                result["duplicates"] += 1
+                self.putc(ACK)
+                continue
+            if sequence != expected:
+                self.abort()
+                result["reason"] = f"sequence error: got {sequence}, expected {expected}"
+                return
+            result["bytes"] += self._recv_write(current, payload)
+            expected = (expected + 1) & 0xff
+            if not streaming:
+                self.putc(ACK)
+            if callback and current["size"]:
+                percentage = min(100, math.ceil(current["received"] / current["size"] * 100))
+                if percentage != last_percentage:
+                    last_percentage = percentage
+                    callback(percentage)
+
+    def _recv_exact(self, size, timeout):
+        """读取恰好 size 个字节（包体）；超时返回 None。"""
+        buf = bytearray()
+        deadline = monotonic() + timeout
+        while len(buf) < size:
+            chunk = self.getc(size - len(buf))
+            if chunk:
+                buf.extend(chunk)
+            elif monotonic() >= deadline:
+                return None
+        return bytes(buf)
+
+    def _recv_purge(self):
+        """丢弃残包：读掉线路上的剩余字节，直到 response_timeout 内没有新数据。"""
+        while self._read_response():
+            pass
+
+    def _recv_write(self, current, payload):
+        """把数据包写入文件，返回实际写入的字节数。"""
+        if current["size"] is not None:
+            data = payload[:max(0, current["size"] - current["received"])]
+        else:
+            # 大小未知：暂存一包，EOT 时再去掉尾部填充
+            data, current["held"] = current["held"] or b'', payload
+        current["stream"].write(data)
+        current["received"] += len(data)
+        return len(data)
+
+    def _recv_close(self, current):
+        """EOT：写出暂存的末包（去掉尾部填充）并关闭文件，返回此时写入的字节数。"""
+        held = current["held"]
+        written = 0
+        if held is not None:
+            held = bytes(held).rstrip(self.pad)
+            current["stream"].write(held)
+            written = len(held)
+            current["received"] += written
+            current["size"] = current["received"]
+        current["stream"].close()
+        return written
+
     # Header byte
     def _make_send_header(self, packet_size, sequence):
         """
@@ -458,13 +1160,15 @@ class YMODEM(object):
             YMODEM 在使用 'C' 握手的 CRC 模式下，会在每个数据包尾部追加该 2 字节 CRC。
             与“8 位校验和（NAK 模式）”不同，CRC 模式能更好地检测错误。
 
+        实现：
+            由 crc16 模块的可切换后端计算（默认 binascii.crc_hqx，后备为纯 Python 查表），
+            支持增量：calc_crc(b, calc_crc(a)) == calc_crc(a + b)。
+            上面的 crctable 保留作为参照表，tests/test_crc16.py 以它交叉校验各后端。
+
         参考：
             与 _make_send_checksum()/_verify_recv_checksum() 的 CRC 分支保持一致。
         """
-        for char in bytearray(data):
-            crctbl_idx = ((crc >> 8) ^ char) & 0xff
-            crc = ((crc << 8) ^ self.crctable[crctbl_idx]) & 0xffff
-        return crc & 0xffff
+        return crc16.crc16(data, crc)
 
 
 if __name__ == '__main__':